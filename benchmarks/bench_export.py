@@ -0,0 +1,60 @@
+""" Per-category and per-merchant totals: dict loop vs columnar export
+
+Run with the package and numpy installed:
+
+    python benchmarks/bench_export.py --count 500000
+"""
+import time
+import argparse
+
+import numpy
+
+from monzo_export import category_totals, iter_batches, merchant_totals
+from monzo_mock import make_transactions
+
+
+def dict_loop(transactions):
+    categories = {}
+    merchants = {}
+    for transaction in transactions:
+        amount = transaction['amount']
+        category = transaction['category']
+        merchant_id = transaction['merchant']['id']
+        categories[category] = categories.get(category, 0) + amount
+        merchants[merchant_id] = merchants.get(merchant_id, 0) + amount
+    return categories, merchants
+
+
+def columnar(transactions):
+    records = numpy.concatenate([
+        batch.to_record_array() for batch in iter_batches(transactions)
+    ])
+    started = time.time()
+    totals = category_totals(records), merchant_totals(records)
+    return totals, time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=500000)
+    args = parser.parse_args()
+    transactions = make_transactions('acc_bench', args.count)
+
+    started = time.time()
+    expected = dict_loop(transactions)
+    loop = time.time() - started
+
+    started = time.time()
+    totals, aggregate = columnar(transactions)
+    total = time.time() - started
+    assert totals == expected
+
+    print('dict loop:                 {0:.3f}s'.format(loop))
+    print('columnar (build + totals): {0:.3f}s'.format(total))
+    print('columnar totals only:      {0:.3f}s ({1:.0f}x faster than the loop)'.format(  # NOQA
+        aggregate, loop / aggregate
+    ))
+
+
+if __name__ == '__main__':
+    main()
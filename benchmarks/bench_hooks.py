@@ -0,0 +1,64 @@
+""" Cost of request hooks on MonzoClient.request
+
+The session is replaced with one that returns a canned response, so the
+timings are the client's own per call overhead without any network. A
+client without hooks only adds a check of `self.hooks` to each call. Run
+with the package installed:
+
+    python benchmarks/bench_hooks.py --calls 100000
+"""
+import time
+import argparse
+
+import requests
+
+from monzo import MonzoClient
+from monzo_metrics import Hook, MetricsCollector
+
+
+class CannedSession(object):
+    """ Answers every request with the same 200 response """
+
+    def __init__(self):
+        self.response = requests.Response()
+        self.response.status_code = 200
+        self.response._content = b'{"balance": 5000, "currency": "GBP", "spend_today": 0}'  # NOQA
+        self.response.request = requests.Request('GET', 'https://api.monzo.com/balance').prepare()  # NOQA
+
+    def request(self, **kwargs):
+        return self.response
+
+
+def per_call(client, calls):
+    url = client.api_url + 'balance?account_id=acc_bench'
+    started = time.time()
+    for __ in range(calls):
+        client.request(url=url, method='GET')
+    return (time.time() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    clients = [
+        ('no hooks', MonzoClient(access_token='bench', session=CannedSession())),  # NOQA
+        ('empty Hook', MonzoClient(access_token='bench', session=CannedSession(), hooks=[Hook()])),  # NOQA
+        ('MetricsCollector', MonzoClient(access_token='bench', session=CannedSession(), hooks=[MetricsCollector()])),  # NOQA
+    ]
+    # Best of several runs to keep noise from the machine out of it
+    timings = [
+        (name, min(per_call(client, args.calls) for __ in range(args.repeat)))
+        for name, client in clients
+    ]
+    baseline = timings[0][1]
+    for name, micros in timings:
+        print('{0:<18} {1:6.2f}us per call  (+{2:.2f}us)'.format(
+            name, micros, micros - baseline
+        ))
+
+
+if __name__ == '__main__':
+    main()
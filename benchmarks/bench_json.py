@@ -0,0 +1,62 @@
+""" Decode time and peak memory for large transaction pages
+
+Builds a transactions?expand[]=merchant style body and decodes it with
+every JSON decoder installed, and compares that with keeping the raw bytes
+(raw=True). Peak memory comes from tracemalloc. Run with the package
+installed:
+
+    python benchmarks/bench_json.py --transactions 100000
+"""
+import json
+import time
+import argparse
+import tracemalloc
+
+from monzo_json import available_decoders, get_decoder
+from monzo_mock import make_transactions
+
+
+def peak_memory(decode, body):
+    """ Peak bytes allocated while decoding, including the result """
+    tracemalloc.start()
+    result = decode(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def best_time(decode, body, repeat):
+    timings = []
+    for __ in range(repeat):
+        started = time.time()
+        decode(body)
+        timings.append(time.time() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    body = json.dumps({
+        'transactions': make_transactions('acc_bench', args.transactions)
+    }).encode('utf-8')
+    print('{0} transactions, {1:.1f}MB body'.format(args.transactions, len(body) / 1e6))  # NOQA
+
+    decoders = [('raw bytes', lambda data: data)]
+    decoders += [(name, get_decoder(name)[1]) for name in available_decoders()]  # NOQA
+    print('{0:<10} {1:>10} {2:>12}'.format('decoder', 'decode ms', 'peak MB'))
+    for name, decode in decoders:
+        seconds = best_time(decode, body, args.repeat)
+        peak = peak_memory(decode, body)
+        print('{0:<10} {1:>10.1f} {2:>12}'.format(
+            name, seconds * 1000,
+            '{0:.1f}'.format(peak / 1e6),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+""" Throughput and latency percentiles for each MonzoClient method
+
+Runs every method against a local MockMonzoServer from a number of threads
+sharing one client and prints calls per second with p50 and p99 latency.
+Use --latency and --jitter to add a simulated network, --transactions for a
+bigger dataset or --fixtures to serve responses recorded with
+monzo_mock.FixtureRecorder. Run with the package installed:
+
+    python benchmarks/bench_methods.py --calls 2000 --threads 8
+"""
+import os
+import json
+import time
+import argparse
+import threading
+
+from monzo import MonzoClient
+from monzo_mock import MockMonzoServer
+
+LOGO = os.path.join(os.path.dirname(__file__), '..', 'tests', 'mondo-logo.png')  # NOQA
+
+
+def methods(client, transaction_id):
+    """ (name, call) for every method, upload_attachment makes two calls """
+    return [
+        ('whoami', client.whoami),
+        ('list_accounts', client.list_accounts),
+        ('get_balance', client.get_balance),
+        ('list_transactions', lambda: client.list_transactions(limit=100)),
+        ('get_transaction', lambda: client.get_transaction(transaction_id)),
+        ('annotate_transaction', lambda: client.annotate_transaction(
+            transaction_id, {'bench': 'yes'}
+        )),
+        ('get_feed', client.get_feed),
+        ('create_feed_item', lambda: client.create_feed_item(
+            'bench', 'https://example.com/logo.png'
+        )),
+        ('list_webhooks', client.list_webhooks),
+        ('create_webhook', lambda: client.create_webhook('https://example.com/hook')),  # NOQA
+        ('upload_attachment', lambda: client.upload_attachment(LOGO)),
+    ]
+
+
+def percentile(timings, percent):
+    index = int(round(percent / 100.0 * (len(timings) - 1)))
+    return timings[index]
+
+
+def measure(call, calls, threads):
+    timings = []
+    lock = threading.Lock()
+
+    def worker(count):
+        local = []
+        for __ in range(count):
+            started = time.time()
+            call()
+            local.append(time.time() - started)
+        with lock:
+            timings.extend(local)
+
+    workers = [
+        threading.Thread(target=worker, args=(calls // threads,))
+        for __ in range(threads)
+    ]
+    started = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - started
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'per_second': len(timings) / elapsed,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--transactions', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--fixtures')
+    parser.add_argument('--only', help='Comma separated method names')
+    parser.add_argument('--json', action='store_true', help='Print JSON')
+    args = parser.parse_args()
+
+    server = MockMonzoServer(
+        transactions=args.transactions, latency=args.latency,
+        jitter=args.jitter, fixtures=args.fixtures,
+    )
+    results = {}
+    with server:
+        client = MonzoClient(
+            access_token='mock', account_id='acc_mock',
+            pool_maxsize=args.threads,
+        )
+        client.api_url = server.url
+        transaction_id = server.accounts['acc_mock'][0]['id']
+        only = args.only.split(',') if args.only else None
+        for name, call in methods(client, transaction_id):
+            if only is None or name in only:
+                results[name] = measure(call, args.calls, args.threads)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+    print('{0:<22} {1:>10} {2:>10} {3:>10}'.format('method', 'calls/s', 'p50 ms', 'p99 ms'))  # NOQA
+    for name, result in sorted(results.items()):
+        print('{0:<22} {1:>10.0f} {2:>10.2f} {3:>10.2f}'.format(
+            name, result['per_second'], result['p50_ms'], result['p99_ms']
+        ))
+
+
+if __name__ == '__main__':
+    main()
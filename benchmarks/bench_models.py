@@ -0,0 +1,59 @@
+""" Memory used by decoded transaction dicts vs monzo_models.Transaction
+
+Run with the package installed:
+
+    python benchmarks/bench_models.py --count 1000000
+"""
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+from monzo_mock import make_transactions
+from monzo_models import Transaction
+
+PAGE_SIZE = 10000
+
+
+def pages(count):
+    """ JSON pages like the API sends, so every dict is decoded separately """
+    template = make_transactions('acc_bench', PAGE_SIZE)
+    for start in range(0, count, PAGE_SIZE):
+        for i, transaction in enumerate(template):
+            transaction['id'] = 'tx_{0:08d}'.format(start + i)
+        yield json.dumps({'transactions': template[:count - start]})
+
+
+def measure(label, count, convert):
+    page_data = list(pages(count))
+    gc.collect()
+    tracemalloc.start()
+    started = time.time()
+    transactions = []
+    for page in page_data:
+        transactions.extend(convert(json.loads(page)['transactions']))
+    elapsed = time.time() - started
+    size, __ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{0:<8} {1:>10,} transactions  {2:>8.1f} MB  {3:>6.0f} bytes each  {4:.2f}s'.format(  # NOQA
+        label, len(transactions), size / 1e6, size / float(len(transactions)), elapsed  # NOQA
+    ))
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    dicts = measure('dicts', args.count, lambda page: page)
+    models = measure(
+        'models', args.count,
+        lambda page: [Transaction.from_dict(t) for t in page]
+    )
+    print('models use {0:.1f}x less memory'.format(dicts / float(models)))
+
+
+if __name__ == '__main__':
+    main()
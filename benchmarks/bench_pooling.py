@@ -0,0 +1,54 @@
+""" Compare sequential calls with and without a pooled keep-alive session
+
+Run with the package installed (``pip install -e .``):
+
+    python benchmarks/bench_pooling.py --calls 500
+"""
+import argparse
+import time
+
+import requests
+
+from monzo import MonzoClient
+from monzo_mock import MockMonzoServer
+
+
+class UnpooledSession(object):
+    """ Behaves like the module level requests.request: new connection each call """
+
+    def request(self, **kwargs):
+        with requests.Session() as session:
+            return session.request(**kwargs)
+
+
+def make_client(server, session=None):
+    client = MonzoClient(access_token='mock', account_id='acc_mock', session=session)  # NOQA
+    client.api_url = server.url
+    return client
+
+
+def run(client, calls):
+    started = time.time()
+    for __ in range(calls):
+        client.whoami()
+        client.list_transactions(limit=10)
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200)
+    args = parser.parse_args()
+
+    with MockMonzoServer() as server:
+        pooled = run(make_client(server), args.calls)
+        unpooled = run(make_client(server, UnpooledSession()), args.calls)
+
+    requests_made = args.calls * 2
+    print('unpooled: {0:.3f}s ({1:.0f} req/s)'.format(unpooled, requests_made / unpooled))  # NOQA
+    print('pooled:   {0:.3f}s ({1:.0f} req/s)'.format(pooled, requests_made / pooled))  # NOQA
+    print('speedup:  {0:.2f}x'.format(unpooled / pooled))
+
+
+if __name__ == '__main__':
+    main()
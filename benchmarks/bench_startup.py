@@ -0,0 +1,91 @@
+""" Cold start cost of the client: import time and first call latency
+
+Each run starts a fresh interpreter which imports monzo, notes whether
+requests was loaded by the import, then makes a first whoami call against a
+local MockMonzoServer. The median of --runs is printed. --max-import-ms and
+--max-first-call-ms make it exit 1 when exceeded, for use in CI. Run with
+the package installed:
+
+    python benchmarks/bench_startup.py --runs 20 --max-import-ms 50
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from monzo_mock import MockMonzoServer
+
+CHILD = '''
+import sys, json, time
+started = time.time()
+import monzo
+imported = time.time()
+requests_loaded = 'requests' in sys.modules
+client = monzo.MonzoClient(access_token='mock', account_id='acc_mock')
+client.api_url = sys.argv[1]
+called = time.time()
+client.whoami()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_call_ms': (time.time() - called) * 1000,
+    'requests_at_import': requests_loaded,
+}))
+'''
+
+
+def run_once(url):
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD, url], env=dict(os.environ)
+    )
+    return json.loads(output.decode('utf-8'))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-import-ms', type=float)
+    parser.add_argument('--max-first-call-ms', type=float)
+    parser.add_argument('--json', action='store_true', help='Print JSON')
+    args = parser.parse_args()
+
+    with MockMonzoServer(transactions=10) as server:
+        runs = [run_once(server.url) for __ in range(args.runs)]
+    result = {
+        'runs': len(runs),
+        'import_ms': median([run['import_ms'] for run in runs]),
+        'first_call_ms': median([run['first_call_ms'] for run in runs]),
+        'requests_at_import': any(run['requests_at_import'] for run in runs),
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+    else:
+        print('import monzo      {0:>8.1f} ms'.format(result['import_ms']))
+        print('first call        {0:>8.1f} ms'.format(result['first_call_ms']))  # NOQA
+        print('requests imported {0:>8}'.format(
+            'yes' if result['requests_at_import'] else 'no'
+        ))
+
+    failed = []
+    if args.max_import_ms is not None and result['import_ms'] > args.max_import_ms:  # NOQA
+        failed.append('import took {0:.1f} ms, limit {1} ms'.format(
+            result['import_ms'], args.max_import_ms
+        ))
+    if args.max_first_call_ms is not None and result['first_call_ms'] > args.max_first_call_ms:  # NOQA
+        failed.append('first call took {0:.1f} ms, limit {1} ms'.format(
+            result['first_call_ms'], args.max_first_call_ms
+        ))
+    for message in failed:
+        print(message, file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+""" Load test for WebhookReceiver
+
+Starts the receiver on a threaded wsgiref server and posts synthetic
+transaction.created events to it from several threads, a share of them
+redeliveries of events already sent. Run with the package installed:
+
+    python benchmarks/load_webhooks.py --events 20000 --threads 16
+"""
+import json
+import time
+import argparse
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from socketserver import ThreadingMixIn
+
+import requests
+
+from monzo_mock import make_transactions
+from monzo_webhooks import WebhookReceiver
+
+
+class ThreadedWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def post_events(url, bodies, statuses):
+    session = requests.Session()
+    for body in bodies:
+        statuses.append(session.post(url, data=body).status_code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duplicates', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    delivered = []
+    receiver = WebhookReceiver(
+        lambda events: delivered.extend(events), batch_size=args.batch_size
+    )
+    server = make_server(
+        '127.0.0.1', 0, receiver, ThreadedWSGIServer, QuietHandler
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{0}/hook'.format(server.server_port)
+
+    unique = int(args.events * (1 - args.duplicates))
+    transactions = make_transactions('acc_bench', unique)
+    transactions += transactions[:args.events - unique]
+    bodies = [
+        json.dumps({'type': 'transaction.created', 'data': transaction})
+        for transaction in transactions
+    ]
+
+    statuses = []
+    workers = [
+        threading.Thread(
+            target=post_events,
+            args=(url, bodies[i::args.threads], statuses),
+        )
+        for i in range(args.threads)
+    ]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+    receiver.close()
+    server.shutdown()
+
+    print('events posted: {0} in {1:.2f}s ({2:.0f}/s)'.format(
+        len(statuses), elapsed, len(statuses) / elapsed
+    ))
+    print('duplicates:    {0}'.format(receiver.duplicates))
+    print('busy (503):    {0}'.format(receiver.dropped))
+    print('delivered:     {0} (unique {1})'.format(
+        len(delivered), len(set(e['data']['id'] for e in delivered))
+    ))
+
+
+if __name__ == '__main__':
+    main()
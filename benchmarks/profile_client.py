@@ -0,0 +1,626 @@
+""" Load and profiling harness for MonzoClient hot paths
+
+Runs a weighted mix of client calls (whoami, balance, paginated
+transactions, annotate, feed items and attachments) at a target rate
+against a MockMonzoServer in a child process, so the server's own work
+stays out of the measurements. Calls are scheduled open loop: each one's
+latency is counted from when it was due, so a slow client can't hide its
+queueing by sending less.
+
+Every call's time is split into phases by wrapping the client's seams:
+'url' is time spent in the method before each request is made (building
+URLs and form data), 'token' the access token check, 'http' the session
+call, 'json' decoding and 'other' the rest of request() and the caller.
+p50/p95/p99 are reported per operation and per phase.
+
+--profile writes merged cProfile stats of the worker threads (open with
+pstats or snakeviz) and --stacks samples the workers' stacks into the
+collapsed format py-spy writes with --format raw, for flamegraph.pl or
+speedscope. --tracemalloc reports peak memory, the largest allocation
+sites and what grew during the run. --json writes everything; pass an
+earlier file as --baseline and it exits 1 when any p95 is more than
+--max-regression worse. Profilers slow the calls down, so compare runs
+made with the same options. Run with the package installed:
+
+    python benchmarks/profile_client.py --rps 200 --duration 10 \
+        --json results.json
+    python benchmarks/profile_client.py --mix balance=1,transactions=1 \
+        --profile client.pstats --stacks client.folded
+"""
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import functools
+import platform
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from monzo import MonzoClient
+from monzo_mock import MockMonzoServer
+
+PHASES = ('url', 'token', 'http', 'json', 'other')
+
+DEFAULT_MIX = (
+    'whoami=2,balance=4,transactions=2,annotate=1,feed=1,attachment=0.5'
+)
+
+WORKER_PREFIX = 'profile-worker'
+
+# 1x1 transparent PNG, uploaded by the attachment operation
+RECEIPT = (
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01'
+    b'\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f'
+    b'\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82'
+)
+
+
+def whoami(context):
+    context.client.whoami()
+
+
+def balance(context):
+    context.client.get_balance()
+
+
+def transactions(context):
+    """ The first --pages pages of the account's history """
+    count = context.page_size * context.pages
+    pages = context.client.iter_transactions(page_size=context.page_size)
+    for index, __ in enumerate(pages):
+        if index + 1 >= count:
+            break
+
+
+def annotate(context):
+    context.client.annotate_transaction(
+        context.random.choice(context.transaction_ids),
+        {'profiled': str(context.random.randint(0, 1000))},
+    )
+
+
+def feed(context):
+    context.client.create_feed_item(
+        'Profiling', 'https://example.com/icon.png', body='Load test',
+    )
+
+
+def attachment(context):
+    upload = context.client.upload_attachment(
+        io.BytesIO(RECEIPT), file_name='receipt.png', file_type='image/png',
+    )
+    context.client.attach_file(
+        context.random.choice(context.transaction_ids),
+        upload['file_url'], upload['file_type'],
+    )
+
+
+OPERATIONS = {
+    'whoami': whoami,
+    'balance': balance,
+    'transactions': transactions,
+    'annotate': annotate,
+    'feed': feed,
+    'attachment': attachment,
+}
+
+
+def parse_mix(mix):
+    """ 'whoami=2,balance=1' to [(name, weight)] """
+    weights = []
+    for part in mix.split(','):
+        name, __, weight = part.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation {0!r}, choose from {1}'.format(
+                name, ', '.join(sorted(OPERATIONS))
+            ))
+        weights.append((name, float(weight) if weight else 1.0))
+    return weights
+
+
+class TimedSession(object):
+    """ Wraps a requests session, timing its calls as the 'http' phase """
+
+    def __init__(self, session, timer):
+        self.session = session
+        self.timer = timer
+
+    def request(self, **kwargs):
+        return self.timer.call('http', self.session.request, **kwargs)
+
+    def put(self, url, **kwargs):  # Attachment uploads
+        return self.timer.call('http', self.session.put, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class PhaseTimer(object):
+    """ Splits each measured call's time into PHASES
+
+    The client's token check, JSON decoder, session and request method are
+    replaced on the instance with timed wrappers. Timings go to the
+    calling thread's current measurement, so calls can run concurrently.
+    """
+
+    def __init__(self, client):
+        self.local = threading.local()
+        ensure_access_token = client._ensure_access_token
+        client._ensure_access_token = lambda: self.call(
+            'token', ensure_access_token
+        )
+        decoder = client.json_decoder
+        client.json_decoder = lambda body: self.call('json', decoder, body)
+        client.session = TimedSession(client.session, self)
+        request = client.request
+
+        def timed_request(**kwargs):
+            self.add('url', time.perf_counter() - self.local.mark)
+            try:
+                return request(**kwargs)
+            finally:
+                self.local.mark = time.perf_counter()
+
+        client.request = timed_request
+
+    def add(self, phase, seconds):
+        phases = getattr(self.local, 'phases', None)
+        if phases is not None:
+            phases[phase] += seconds
+
+    def call(self, phase, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.add(phase, time.perf_counter() - started)
+
+    def measure(self, func, *args):
+        """ Call func, returns (seconds, {phase: seconds}, error) """
+        phases = self.local.phases = dict.fromkeys(PHASES, 0.0)
+        started = self.local.mark = time.perf_counter()
+        error = None
+        try:
+            func(*args)
+        except Exception as exc:
+            error = '{0}: {1}'.format(type(exc).__name__, exc)
+        elapsed = time.perf_counter() - started
+        self.local.phases = None
+        phases['other'] = max(elapsed - sum(phases.values()), 0.0)
+        return elapsed, phases, error
+
+
+class ThreadProfiles(object):
+    """ cProfile for the worker threads, merged into one pstats file
+
+    Before Python 3.12 a profiler only sees the thread which enabled it,
+    so each worker thread keeps its own and turns it on around each call.
+    From 3.12 one profiler sees every thread, so a single one runs for the
+    whole load instead.
+    """
+
+    def __init__(self):
+        import cProfile
+
+        self.profile = cProfile.Profile
+        self.per_thread = sys.version_info < (3, 12)
+        self.local = threading.local()
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.whole = None if self.per_thread else cProfile.Profile()
+
+    def start(self):
+        if self.whole is not None:
+            self.whole.enable()
+
+    def stop(self):
+        if self.whole is not None:
+            self.whole.disable()
+
+    def call(self, func, *args):
+        if not self.per_thread:
+            return func(*args)
+        profile = getattr(self.local, 'profile', None)
+        if profile is None:
+            profile = self.local.profile = self.profile()
+            with self.lock:
+                self.profiles.append(profile)
+        profile.enable()
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+
+    def save(self, path, top=25):
+        """ Write the merged stats to path, returns the top functions """
+        import pstats
+
+        profiles = self.profiles if self.per_thread else [self.whole]
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        rows = []
+        for (filename, line, name), row in stats.stats.items():
+            calls, __, tottime, cumtime = row[:4]
+            rows.append({
+                'function': '{0} ({1}:{2})'.format(name, filename, line),
+                'calls': calls,
+                'tottime': tottime,
+                'cumtime': cumtime,
+            })
+        rows.sort(key=lambda row: -row['tottime'])
+        return rows[:top]
+
+
+class StackSampler(object):
+    """ Samples the stacks of threads in a call every interval seconds
+
+    Stacks are counted in the collapsed format, one 'frame;frame;... count'
+    line per distinct stack with the root first, as py-spy record
+    --format raw writes them. Idle workers are left out, as py-spy does
+    by default.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.active = set()  # Idents of threads inside a call
+        self.counts = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def call(self, func, *args):
+        ident = threading.get_ident()
+        self.active.add(ident)
+        try:
+            return func(*args)
+        finally:
+            self.active.discard(ident)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            names = dict(
+                (thread.ident, thread.name) for thread in threading.enumerate()
+            )
+            for ident, frame in sys._current_frames().items():
+                if ident not in self.active:
+                    continue
+                name = names.get(ident, WORKER_PREFIX)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{0} ({1}:{2})'.format(
+                        code.co_name, code.co_filename, frame.f_lineno
+                    ))
+                    frame = frame.f_back
+                stack.append(name.rsplit('_', 1)[0])
+                self.counts[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def save(self, path):
+        with open(path, 'w') as folded:
+            for stack, count in sorted(self.counts.items()):
+                folded.write('{0} {1}\n'.format(stack, count))
+
+
+def percentiles(seconds):
+    """ count, mean, p50, p95, p99 and max in milliseconds """
+    if not seconds:
+        return {'count': 0}
+    ordered = sorted(seconds)
+
+    def at(percentile):
+        index = int(round(percentile / 100.0 * (len(ordered) - 1)))
+        return ordered[index] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': at(50),
+        'p95': at(95),
+        'p99': at(99),
+        'max': ordered[-1] * 1000,
+    }
+
+
+def allocations(before, after, top=15):
+    """ Largest allocation sites at the end and the biggest growth """
+    import tracemalloc
+
+    def row(stat, size, count):
+        frame = stat.traceback[0]
+        return {
+            'where': '{0}:{1}'.format(frame.filename, frame.lineno),
+            'size_kb': size / 1024.0,
+            'count': count,
+        }
+
+    # Leave out the harness's own bookkeeping
+    ignore = [
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ]
+    before = before.filter_traces(ignore)
+    after = after.filter_traces(ignore)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'current_kb': current / 1024.0,
+        'peak_kb': peak / 1024.0,
+        'top': [
+            row(stat, stat.size, stat.count)
+            for stat in after.statistics('lineno')[:top]
+        ],
+        'growth': [
+            row(stat, stat.size_diff, stat.count_diff)
+            for stat in after.compare_to(before, 'lineno')[:top]
+            if stat.size_diff > 0
+        ],
+    }
+
+
+class Context(object):
+    """ What the operations need, one per run """
+
+    def __init__(self, client, transaction_ids, page_size, pages, seed):
+        self.client = client
+        self.transaction_ids = transaction_ids
+        self.page_size = page_size
+        self.pages = pages
+        self.random = random.Random(seed)
+
+
+def run_load(context, timer, mix, rps, duration, concurrency, wrappers=()):
+    """ Send calls from mix at rps for duration seconds
+
+    Each call is made through wrappers, e.g. ThreadProfiles.call. Returns
+    [(operation, latency, service time, phases, error)] where latency
+    counts from when the call was due and service time from when a worker
+    started it.
+    """
+    names = [name for name, __ in mix]
+    weights = [weight for __, weight in mix]
+    scheduler = random.Random(context.random.random())
+    results = []
+
+    def run(name, due):
+        call = timer.measure
+        for wrapper in wrappers:
+            call = functools.partial(wrapper, call)
+        started = time.perf_counter()
+        elapsed, phases, error = call(OPERATIONS[name], context)
+        results.append((name, started - due + elapsed, elapsed, phases, error))
+
+    executor = ThreadPoolExecutor(
+        concurrency, thread_name_prefix=WORKER_PREFIX
+    )
+    interval = 1.0 / rps
+    start = time.perf_counter()
+    sent = 0
+    try:
+        while sent * interval < duration:
+            due = start + sent * interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, scheduler.choices(names, weights)[0], due)
+            sent += 1
+    finally:
+        executor.shutdown(wait=True)
+    return results
+
+
+def summarise(results, elapsed):
+    by_operation = {}
+    for result in results:
+        by_operation.setdefault(result[0], []).append(result)
+    by_operation['all'] = results
+
+    summary = {
+        'requests': len(results),
+        'elapsed': elapsed,
+        'achieved_rps': len(results) / elapsed if elapsed else 0.0,
+        'errors': {}, 'latency': {}, 'service': {}, 'phases': {},
+    }
+    for name, rows in sorted(by_operation.items()):
+        errors = Counter(row[4] for row in rows if row[4])
+        if errors and name != 'all':
+            summary['errors'][name] = dict(errors)
+        summary['latency'][name] = percentiles([row[1] for row in rows])
+        summary['service'][name] = percentiles([row[2] for row in rows])
+        summary['phases'][name] = dict(
+            (phase, percentiles([row[3][phase] for row in rows]))
+            for phase in PHASES
+        )
+    return summary
+
+
+def regressions(summary, baseline, max_regression):
+    """ ['what: old -> new'] for p95s more than max_regression worse """
+    found = []
+    checks = [('latency', name) for name in summary['latency']]
+    checks += [('phases', 'all', phase) for phase in PHASES]
+    for path in checks:
+        new, old = summary, baseline
+        for key in path:
+            new, old = new.get(key, {}), old.get(key, {})
+        if not old.get('p95') or not new.get('p95'):
+            continue
+        if new['p95'] > old['p95'] * (1 + max_regression):
+            found.append('{0} p95: {1:.2f}ms -> {2:.2f}ms'.format(
+                '/'.join(path), old['p95'], new['p95']
+            ))
+    return found
+
+
+def serve(connection, transactions):
+    """ Runs the mock API in a child process until told to stop """
+    with MockMonzoServer(transactions=transactions) as server:
+        connection.send(server.url)
+        connection.recv()
+
+
+HEADER = '{0:<14} {1:>7} {2:>9} {3:>9} {4:>9}'
+
+
+def print_summary(summary):
+    print('{0} calls in {1:.1f}s, {2:.1f}/s'.format(
+        summary['requests'], summary['elapsed'], summary['achieved_rps']
+    ))
+    print(HEADER.format('latency ms', 'calls', 'p50', 'p95', 'p99'))
+    for name, stats in sorted(summary['latency'].items()):
+        if stats['count']:
+            print('{0:<14} {1:>7} {2:>9.2f} {3:>9.2f} {4:>9.2f}'.format(
+                name, stats['count'], stats['p50'], stats['p95'], stats['p99'],
+            ))
+    print(HEADER.format('phase ms', '', 'p50', 'p95', 'p99'))
+    for phase in PHASES:
+        stats = summary['phases']['all'][phase]
+        if stats['count']:
+            print('{0:<14} {1:>7} {2:>9.3f} {3:>9.3f} {4:>9.3f}'.format(
+                phase, '', stats['p50'], stats['p95'], stats['p99'],
+            ))
+    for name, errors in sorted(summary['errors'].items()):
+        for error, count in errors.items():
+            print('{0} failed {1} times: {2}'.format(name, count, error))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=(
+        'operation=weight,... from {0}'.format(', '.join(sorted(OPERATIONS)))
+    ))
+    parser.add_argument('--rps', type=float, default=100)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument(
+        '--transactions', type=int, default=1000,
+        help='Per account on the mock server',
+    )
+    parser.add_argument(
+        '--api-url', help='Use this stub server instead of starting one'
+    )
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profile', help='Write cProfile stats here')
+    parser.add_argument('--stacks', help='Write collapsed stacks here')
+    parser.add_argument('--tracemalloc', action='store_true')
+    parser.add_argument('--json', help='Write the results here')
+    parser.add_argument(
+        '--baseline', help='Earlier --json results to compare with'
+    )
+    parser.add_argument(
+        '--max-regression', type=float, default=0.2,
+        help='Allowed p95 increase, 0.2 is 20%%',
+    )
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    connection = process = None
+    api_url = args.api_url
+    if not api_url:
+        connection, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=serve, args=(child, args.transactions)
+        )
+        process.daemon = True
+        process.start()
+        api_url = connection.recv()
+
+    try:
+        client = MonzoClient(
+            access_token='mock', account_id='acc_mock',
+            pool_maxsize=args.concurrency,
+        )
+        client.api_url = api_url
+        transaction_ids = [
+            t['id'] for t in client._list_transactions('acc_mock', 100)
+        ]
+        timer = PhaseTimer(client)
+        context = Context(
+            client, transaction_ids, args.page_size, args.pages, args.seed
+        )
+        # One of each first so imports and connections aren't measured
+        for name, __ in mix:
+            error = timer.measure(OPERATIONS[name], context)[2]
+            if error:
+                raise SystemExit('{0} failed: {1}'.format(name, error))
+
+        profiles = ThreadProfiles() if args.profile else None
+        sampler = StackSampler() if args.stacks else None
+        if args.tracemalloc:
+            import tracemalloc
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        if profiles is not None:
+            profiles.start()
+        if sampler is not None:
+            sampler.start()
+        started = time.perf_counter()
+        wrappers = [w.call for w in (profiles, sampler) if w is not None]
+        results = run_load(
+            context, timer, mix, args.rps, args.duration, args.concurrency,
+            wrappers,
+        )
+        elapsed = time.perf_counter() - started
+        if sampler is not None:
+            sampler.stop()
+        if profiles is not None:
+            profiles.stop()
+
+        summary = summarise(results, elapsed)
+        if args.tracemalloc:
+            summary['allocations'] = allocations(
+                before, tracemalloc.take_snapshot()
+            )
+            tracemalloc.stop()
+    finally:
+        if process is not None:
+            connection.send('stop')
+            process.join(5)
+
+    summary['config'] = dict(vars(args), mix=dict(mix))
+    summary['python'] = '{0} {1}'.format(
+        platform.python_implementation(), platform.python_version()
+    )
+    if profiles is not None:
+        summary['profile'] = {
+            'path': args.profile, 'top': profiles.save(args.profile),
+        }
+    if sampler is not None:
+        sampler.save(args.stacks)
+        summary['stacks'] = {'path': args.stacks, 'samples': sampler.samples}
+    print_summary(summary)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(summary, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            found = regressions(
+                summary, json.load(baseline), args.max_regression
+            )
+        for regression in found:
+            print('Regression: ' + regression)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
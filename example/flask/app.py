@@ -5,7 +5,7 @@ import os
 from flask import Flask, redirect, url_for, make_response, request, jsonify
 from itsdangerous import URLSafeSerializer
 
-from monzo import MonzoClient
+from monzo_pool import MonzoClientPool
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'changeme'
@@ -14,7 +14,8 @@ SIGNER = URLSafeSerializer('secret-key')
 CLIENT_ID = os.getenv('MONZO_CLIENT_ID')
 CLIENT_SECRET = os.getenv('MONZO_CLIENT_SECRET')
 
-monzo = MonzoClient(
+# One client per user, sharing a connection pool
+clients = MonzoClientPool(
     client_id=CLIENT_ID,
     client_secret=CLIENT_SECRET,
     login_url='http://localhost:5000/login/'
@@ -25,7 +26,12 @@ monzo = MonzoClient(
 def home():
     if request.cookies.get('tokens'):
         tokens = SIGNER.loads(request.cookies.get('tokens'))
-        monzo.update_tokens(**tokens)
+        monzo = clients.get(
+            tenant=tokens['user_id'],
+            access_token=tokens['access_token'],
+            refresh_token=tokens.get('refresh_token'),
+            expires_at=tokens['expires_at'],
+        )
         ctx = {'whoami': monzo.whoami()}
     else:
         ctx = {'Login': 'Please go to /login/ to login'}
@@ -34,6 +40,7 @@ def home():
 
 @app.route('/login/')
 def login():
+    monzo = clients.make_client()
     if not request.args.get('code'):
         return redirect(monzo.get_authorization_code())
     else:
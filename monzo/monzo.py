@@ -1,9 +1,87 @@
 import os
-import urllib
-import requests
-from urlparse import urljoin
-from mimetypes import MimeTypes
-from datetime import datetime, timedelta
+import time
+import functools
+from urllib.parse import quote, urlencode
+
+from monzo_endpoints import parse_endpoint
+from monzo_tokens import TokenManager
+
+# requests, mimetypes, the JSON decoder, thread pools, models and the bulk
+# helpers are imported where they are first used so `import monzo` stays
+# cheap for short-lived processes such as serverless functions.
+
+# (connect, read) seconds, so a stalled connection can't hang a worker
+DEFAULT_TIMEOUT = (5, 30)
+
+# Paths below api_url, joined once per client by the api_url setter
+ENDPOINTS = {
+    'whoami': 'ping/whoami',
+    'accounts': 'accounts',
+    'balance': 'balance?account_id={0}',
+    'transactions': 'transactions?account_id={0}&expand%5B%5D=merchant&limit={1}&since={2}&before={3}',  # NOQA
+    'transaction': 'transactions/{0}',
+    'transaction_expanded': 'transactions/{0}?expand[]=merchant',
+    'feed': 'feed',
+    'feed_items': 'feed?account_id={0}',
+    'webhooks': 'webhooks?account_id={0}',
+    'create_webhook': 'webhooks',
+    'webhook': 'webhooks/{0}',
+    'attachment_upload': 'attachment/upload',
+    'attachment_register': 'attachment/register',
+    'attachment_deregister': 'attachment/deregister',
+}
+
+
+def decode_json(body):
+    """ monzo_json.loads, the fastest decoder installed """
+    from monzo_json import loads
+    return loads(body)
+
+
+def make_session(pool_connections=10, pool_maxsize=10, max_retries=0):
+    """ A keep-alive session which can be shared between many clients """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class UploadStream(object):
+    """ Wraps a file object so uploads are sent a chunk at a time
+
+    requests sends any object with read() and a length as a streamed body,
+    so only one chunk is ever held in memory. progress(sent, total) is
+    called after each chunk.
+    """
+
+    def __init__(self, fileobj, progress=None, chunk_size=64 * 1024):
+        from requests.utils import super_len
+
+        self.fileobj = fileobj
+        self.size = super_len(fileobj)
+        self.sent = 0
+        self.progress = progress
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = self.fileobj.read(size)
+        self.sent += len(chunk)
+        if self.progress is not None:
+            self.progress(self.sent, self.size)
+        return chunk
 
 
 class MonzoClient(object):
@@ -16,6 +94,22 @@ class MonzoClient(object):
         access_token=None,
         refresh_token=None,
         account_id=None,
+        session=None,  # Pass a make_session() to share a pool between clients
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=0,
+        timeout=DEFAULT_TIMEOUT,  # None waits forever
+        timeouts=None,  # {endpoint template: timeout} overriding timeout
+        cache=None,  # A monzo_cache.ResponseCache, can be shared
+        token_store=None,  # A monzo_tokens.TokenStore shared between workers
+        refresh_margin=60,  # Refresh this many seconds before expiry
+        rate_limiter=None,  # A monzo_ratelimit.RateLimiter, can be shared
+        retry_policy=None,  # A monzo_ratelimit.RetryPolicy
+        hooks=None,  # monzo_metrics.Hook objects, e.g. a MetricsCollector
+        json_decoder=None,  # loads(bytes), defaults to the fastest installed
+        single_flight=None,  # A monzo_flight.SingleFlight, can be shared
+        circuit_breaker=None,  # A monzo_resilience.CircuitBreaker, shareable
+        hedge=None,  # A monzo_resilience.HedgePolicy for slow GETs
     ):
         self.token_url = 'https://api.monzo.com/oauth2/token'
         self.api_url = 'https://api.monzo.com/'
@@ -23,13 +117,109 @@ class MonzoClient(object):
         self.client_id = client_id if client_id else ''
         self.client_secret = client_secret if client_secret else ''
         self.login_url = login_url if login_url else ''
-        self.access_token = access_token if access_token else ''
-        self.refresh_token = refresh_token if refresh_token else ''
+        self.tokens = TokenManager(
+            access_token=access_token if access_token else '',
+            refresh_token=refresh_token if refresh_token else '',
+            store=token_store,
+            refresh_margin=refresh_margin,
+        )
+        if token_store is not None and not access_token:
+            stored = token_store.load()
+            if stored:
+                self.tokens.update(stored)
         self.account_id = account_id if account_id else ''
-        self.expires_at = '3000-12-31T23:59:59.999999'
+        self.timeout = timeout
+        self.timeouts = dict(timeouts) if timeouts else {}
+        if session is None:
+            session = make_session(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                max_retries=max_retries,
+            )
+        self.session = session
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.hooks = list(hooks) if hooks else []
+        self.json_decoder = json_decoder if json_decoder else decode_json
+        self.single_flight = single_flight
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+
+    @property
+    def api_url(self):
+        return self._api_url
+
+    @api_url.setter
+    def api_url(self, api_url):
+        if not api_url.endswith('/'):
+            api_url += '/'
+        self._api_url = api_url
+        self.urls = dict(
+            (name, api_url + path) for name, path in ENDPOINTS.items()
+        )
+
+    @property
+    def access_token(self):
+        return self.tokens.access_token
+
+    @access_token.setter
+    def access_token(self, access_token):
+        self.tokens.access_token = access_token
+
+    @property
+    def refresh_token(self):
+        return self.tokens.refresh_token
+
+    @refresh_token.setter
+    def refresh_token(self, refresh_token):
+        self.tokens.refresh_token = refresh_token
+
+    @property
+    def expires_at(self):
+        return self.tokens.expires_at
+
+    @expires_at.setter
+    def expires_at(self, expires_at):
+        self.tokens.set_expires_at(expires_at)
+
+    def get(self, url, raw=False):
+        """ raw=True returns the undecoded body and skips the cache """
+        if raw:
+            return self._load(url, raw=True)
+        if self.cache is None:
+            return self._load(url)
+        if not self.hooks:
+            return self.cache.fetch(
+                self.access_token, url, lambda: self._load(url)
+            )
+
+        fetched = []
+
+        def fetch():
+            fetched.append(url)
+            return self._load(url)
+
+        response = self.cache.fetch(self.access_token, url, fetch)
+        if not fetched:
+            endpoint = parse_endpoint(url)[0]
+            for hook in self.hooks:
+                hook.cache_hit(endpoint)
+        return response
 
-    def get(self, url):
-        return self.request(url=url, method='GET')
+    def _load(self, url, raw=False):
+        """ GET url, sharing one call with identical GETs in flight """
+        if self.single_flight is None:
+            return self.request(url=url, method='GET', raw=raw)
+        response, shared = self.single_flight.do(
+            (self.access_token, url, raw),
+            lambda: self.request(url=url, method='GET', raw=raw),
+        )
+        if shared and self.hooks:
+            endpoint = parse_endpoint(url)[0]
+            for hook in self.hooks:
+                hook.coalesced(endpoint)
+        return response
 
     def post(self, url, data):
         return self.request(url=url, method='POST', data=data)
@@ -41,7 +231,10 @@ class MonzoClient(object):
         return self.request(url=url, method='DELETE')
 
     def request(self, **kwargs):
-        self._ensure_access_token()
+        retry = kwargs.pop('retry', None)  # True to retry non-idempotent calls
+        raw = kwargs.pop('raw', False)  # True for the body as bytes
+        if kwargs['url'] != self.token_url:
+            self._ensure_access_token()
 
         if kwargs['url'].endswith('/'):  # pragma: no cover
             kwargs['url'] = kwargs['url'][:-1]
@@ -55,17 +248,158 @@ class MonzoClient(object):
         if 'data' in kwargs:
             kwargs['headers']['Content-Type'] = 'application/x-www-form-urlencoded'  # NOQA
 
-        response = requests.request(**kwargs)
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.timeouts.get(
+                parse_endpoint(kwargs['url'])[0], self.timeout
+            ) if self.timeouts else self.timeout
+        if self.hooks:
+            return self._hooked_request(kwargs, retry, raw)
+        response = self._send(kwargs, retry)
         response.raise_for_status()
-        return response.json()
+        if raw:
+            return response.content
+        return self.json_decoder(response.content)
+
+    def _hooked_request(self, kwargs, retry, raw=False):
+        """ request() reporting the call to every hook """
+        event = {
+            'method': kwargs['method'],
+            'url': kwargs['url'],
+            'endpoint': parse_endpoint(kwargs['url'])[0],
+            'data': kwargs.get('data'),
+            'attempts': 1,
+            'elapsed': None,
+        }
+        for hook in self.hooks:
+            hook.before_request(event)
+        started = time.time()
+        try:
+            response = self._send(kwargs, retry, event)
+            event['elapsed'] = time.time() - started
+            for hook in self.hooks:
+                hook.after_response(event, response)
+            response.raise_for_status()
+            if raw:
+                return response.content
+            return self.json_decoder(response.content)
+        except Exception as error:
+            if event['elapsed'] is None:
+                event['elapsed'] = time.time() - started
+            for hook in self.hooks:
+                hook.on_error(event, error)
+            raise
+
+    def _send(self, kwargs, retry=None, event=None):
+        """ Send the request, waiting on the rate limiter and retrying
+
+        Throttled (429), unavailable (503), reset connections and timeouts
+        are retried with backoff when the retry policy allows it for the
+        method. An open circuit raises CircuitOpenError straight away.
+        """
+        if self.rate_limiter is None and self.retry_policy is None and \
+                self.circuit_breaker is None and self.hedge is None:
+            return self.session.request(**kwargs)
+
+        import requests
+
+        endpoint = parse_endpoint(kwargs['url'])[0]
+        policy = self.retry_policy
+        breaker = self.circuit_breaker
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self.access_token, endpoint)
+            if breaker is not None:
+                self._circuit_changed(endpoint, breaker.allow(endpoint))
+            try:
+                response = self._send_once(kwargs, endpoint)
+            except (requests.ConnectionError, requests.Timeout):
+                if breaker is not None:
+                    self._circuit_changed(endpoint, breaker.record(endpoint, False))  # NOQA
+                if policy is None or not policy.can_retry(kwargs['method'], attempt, retry):  # NOQA
+                    raise
+                delay = policy.delay(attempt)
+            except Exception:
+                if breaker is not None:
+                    self._circuit_changed(endpoint, breaker.record(endpoint, False))  # NOQA
+                raise
+            else:
+                if breaker is not None:
+                    self._circuit_changed(endpoint, breaker.record(
+                        endpoint, not breaker.failed(response)
+                    ))
+                if policy is None or \
+                        response.status_code not in policy.statuses or \
+                        not policy.can_retry(kwargs['method'], attempt, retry):
+                    return response
+                delay = policy.delay(attempt, response)
+                if response.status_code == 429 and self.rate_limiter is not None:  # NOQA
+                    # Hold back every caller using this token, the next
+                    # acquire() does the waiting
+                    self.rate_limiter.backoff(self.access_token, endpoint, delay)  # NOQA
+                    delay = 0
+            attempt += 1
+            if event is not None:
+                event['attempts'] = attempt + 1
+            if delay:
+                time.sleep(delay)
+
+    def _send_once(self, kwargs, endpoint):
+        """ One attempt, hedged if it is a slow GET and hedge is set """
+        if self.hedge is None or kwargs['method'] != 'GET':
+            return self.session.request(**kwargs)
+        response, hedged, won = self.hedge.send(
+            endpoint, lambda: self.session.request(**kwargs)
+        )
+        if hedged:
+            for hook in self.hooks:
+                hook.hedged(endpoint, won)
+        return response
+
+    def _circuit_changed(self, endpoint, state):
+        if state is not None:
+            key = self.circuit_breaker.key(endpoint)
+            for hook in self.hooks:
+                hook.circuit_changed(key, state)
+
+    def _invalidate(self, *tags):
+        """ Drop cached responses a write has made stale """
+        if self.cache is not None:
+            self.cache.invalidate(self.access_token, tags)
+
+    def with_token(self, access_token, account_id=None):
+        """ A client for another access token
+
+        It shares this client's session, timeouts, rate limiter, retry
+        policy, cache, hooks, JSON decoder, single flight, circuit breaker
+        and hedge policy, so making one per call is cheap.
+        """
+        client = MonzoClient(
+            access_token=access_token,
+            account_id=account_id,
+            session=self.session,
+            timeout=self.timeout,
+            timeouts=self.timeouts,
+            cache=self.cache,
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            hooks=self.hooks,
+            json_decoder=self.json_decoder,
+            single_flight=self.single_flight,
+            circuit_breaker=self.circuit_breaker,
+            hedge=self.hedge,
+        )
+        client.api_url = self.api_url
+        client.token_url = self.token_url
+        return client
 
     def get_authorization_code(self):  # pragma: no cover
-        query = urllib.urlencode({
+        query = urlencode({
             'client_id': self.client_id,
             'redirect_uri': self.login_url,
             'response_type': 'code',
         })
-        url = urljoin(self.auth_url, '?{0}'.format(query))
+        url = '{0}?{1}'.format(self.auth_url, query)
         return url
 
     def get_access_token(self, code):  # pragma: no cover
@@ -81,33 +415,30 @@ class MonzoClient(object):
         if 'refresh_token' in response:
             self.refresh_token = response['refresh_token']
         response['expires_at'] = self._set_expires_at(response['expires_in'])
+        if self.tokens.store is not None:
+            self.tokens.store.save(self.tokens.as_dict())
         return response
 
     def refresh_access_token(self, refresh_token=None):
         if refresh_token:  # pragma: no cover
             self.refresh_token = refresh_token
+        return self.tokens.refresh(self._request_refresh)
+
+    def _request_refresh(self, refresh_token):
         data = {
             'grant_type': 'refresh_token',
             'client_id': self.client_id,
             'client_secret': self.client_secret,
-            'refresh_token': self.refresh_token,
+            'refresh_token': refresh_token,
         }
-
-        response = self.post(url=self.token_url, data=data)
-        self.access_token = response['access_token']
-        self.refresh_token = response['refresh_token']
-        response['expires_at'] = self._set_expires_at(response['expires_in'])
-        return response
+        return self.post(url=self.token_url, data=data)
 
     def _set_expires_at(self, expires_in):
-        expires_at = datetime.now() + timedelta(seconds=expires_in)
-        self.expires_at = expires_at.isoformat()
+        self.tokens.set_expires_at_epoch(time.time() + expires_in)
         return self.expires_at
 
     def _ensure_access_token(self):
-        expires_at = datetime.strptime(self.expires_at, "%Y-%m-%dT%H:%M:%S.%f")
-        if datetime.now() > expires_at:  # pragma: no cover
-            self.refresh_access_token()
+        self.tokens.ensure(self._request_refresh)
 
     def update_tokens(self, **kwargs):
         if 'access_token' in kwargs:
@@ -129,77 +460,201 @@ class MonzoClient(object):
             'account_id': self.account_id,
         }
 
-    def whoami(self):
-        url = urljoin(self.api_url, 'ping/whoami')
-        response = self.get(url)
+    def whoami(self, raw=False):
+        url = self.urls['whoami']
+        response = self.get(url, raw=raw)
         return response
 
-    def list_accounts(self):
-        url = urljoin(self.api_url, 'accounts')
-        response = self.get(url)
+    def list_accounts(self, raw=False):
+        url = self.urls['accounts']
+        response = self.get(url, raw=raw)
         return response
 
-    def get_balance(self, account_id=None):
+    def get_balance(self, account_id=None, raw=False):
         if account_id:  # pragma: no cover
             self.account_id = account_id
+        return self._get_balance(self.account_id, raw=raw)
 
-        url = urljoin(self.api_url, 'balance?account_id={0}'.format(self.account_id))  # NOQA
-        response = self.get(url)
+    def _get_balance(self, account_id, raw=False):
+        url = self.urls['balance'].format(account_id)
+        response = self.get(url, raw=raw)
         return response
 
-    def list_transactions(self, account_id=None, limit=100, since='', before=''):  # NOQA
-        if account_id:  # pragma: no cover
-            self.account_id = account_id
+    def get_balances(self, account_ids, max_workers=10):
+        """ Fetch the balance of many accounts concurrently
 
-        query = {
-            'account_id': self.account_id,
-            'expand[]': 'merchant',
-            'limit': limit,
-            'since': since,
-            'before': before,
-        }
+        Returns {'results': {account_id: balance}, 'errors': {account_id: exc}}
+        """
+        return self._fan_out(self._get_balance, account_ids, max_workers)
 
-        query = urllib.urlencode(query)
-        url = urljoin(self.api_url, 'transactions?{0}'.format(query))
-        response = self.get(url)
+    def list_transactions(self, account_id=None, limit=100, since='', before='', models=False, raw=False):  # NOQA
+        """ models=True returns monzo_models.Transaction objects
+
+        raw=True returns the response body as bytes without decoding it.
+        """
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+        transactions = self._list_transactions(self.account_id, limit, since, before, raw)  # NOQA
+        if models and not raw:
+            from monzo_models import Transaction
+            return [Transaction.from_dict(t) for t in transactions]
+        return transactions
+
+    def _list_transactions(self, account_id, limit=100, since='', before='', raw=False):  # NOQA
+        url = self.urls['transactions'].format(
+            account_id, limit,
+            quote(since, safe='') if since else '',
+            quote(before, safe='') if before else '',
+        )
+        response = self.get(url, raw=raw)
+        if raw:
+            return response
         return response['transactions']
 
-    def get_transaction(self, transactions_id):
-        url = urljoin(
-            self.api_url,
-            'transactions/{0}?expand[]=merchant'.format(transactions_id)
+    def list_transactions_many(self, account_ids, limit=100, since='', before='', max_workers=10):  # NOQA
+        """ list_transactions for many accounts concurrently
+
+        Returns {'results': {account_id: transactions}, 'errors': {...}}
+        """
+        fetch = functools.partial(
+            self._list_transactions, limit=limit, since=since, before=before
+        )
+        return self._fan_out(fetch, account_ids, max_workers)
+
+    def _fan_out(self, func, account_ids, max_workers):
+        """ Call func(account_id) for each account on a bounded thread pool
+
+        An error for one account is reported under 'errors' rather than
+        aborting the batch. self.account_id is never touched. Keep
+        max_workers at or below the session pool_maxsize so every worker
+        gets a pooled connection.
+        """
+        def call(account_id):
+            try:
+                return account_id, func(account_id), None
+            except Exception as error:
+                return account_id, None, error
+
+        from multiprocessing.pool import ThreadPool
+
+        results = {}
+        errors = {}
+        pool = ThreadPool(max_workers)
+        try:
+            for account_id, result, error in pool.imap_unordered(call, set(account_ids)):  # NOQA
+                if error is None:
+                    results[account_id] = result
+                else:
+                    errors[account_id] = error
+        finally:
+            pool.close()
+            pool.join()
+        return {'results': results, 'errors': errors}
+
+    def iter_transactions(self, account_id=None, since=None, until=None, page_size=100, prefetch=False, models=False):  # NOQA
+        """ Yield every transaction between since and until, one at a time
+
+        Pages are requested page_size at a time, moving the since cursor on to
+        the id of the last transaction seen, so only one page is held in
+        memory. With prefetch=True the next page is requested in a background
+        thread while the current one is being consumed.
+        """
+        fetch = functools.partial(
+            self._list_transactions,
+            account_id if account_id else self.account_id,
+            limit=page_size,
+            before=until if until else '',
         )
-        response = self.get(url)
+        if models:
+            from monzo_models import Transaction
+        if prefetch:
+            from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(1) if prefetch else None
+        try:
+            page = fetch(since=since if since else '')
+            while page:
+                full_page = len(page) == page_size
+                next_page = None
+                if pool and full_page:
+                    next_page = pool.apply_async(fetch, kwds={'since': page[-1]['id']})  # NOQA
+                for transaction in page:
+                    if models:
+                        transaction = Transaction.from_dict(transaction)
+                    yield transaction
+                if not full_page:
+                    break
+                if next_page:
+                    page = next_page.get()
+                else:
+                    page = fetch(since=page[-1]['id'])
+        finally:
+            if pool:
+                pool.terminate()
+
+    def get_transaction(self, transactions_id, models=False, raw=False):
+        url = self.urls['transaction_expanded'].format(transactions_id)
+        response = self.get(url, raw=raw)
+        if raw:
+            return response
+        if models:
+            from monzo_models import Transaction
+            return Transaction.from_dict(response['transaction'])
         return response['transaction']
 
     def annotate_transaction(self, transactions_id, metadata):
         """ Metadata is just a key:value pair """
 
-        url = urljoin(self.api_url, 'transactions/{0}'.format(transactions_id))
+        url = self.urls['transaction'].format(transactions_id)
         data = {}
         for key, value in metadata.items():
             data['metadata[{}]'.format(key)] = value
 
         response = self.patch(url, data=data)
+        self._invalidate_transaction(transactions_id, response)
         return response['transaction']
 
     def remove_annotations(self, transactions_id, annotation_keys):
         """ annotation_keys is a list of keys to remove """
 
-        url = urljoin(self.api_url, 'transactions/{0}'.format(transactions_id))
+        url = self.urls['transaction'].format(transactions_id)
         data = {}
         for key in annotation_keys:
             data['metadata[{}]'.format(key)] = ''
 
         response = self.patch(url, data=data)
+        self._invalidate_transaction(transactions_id, response)
         return response
 
-    def get_feed(self, account_id=None):
+    def bulk_annotate(self, annotations, known=None, max_workers=8):
+        """ Write metadata to many transactions with one PATCH each
+
+        annotations is an iterable of (transaction_id, metadata) pairs, the
+        same transaction may appear more than once. Pass the transactions
+        as known (e.g. from iter_transactions) to skip writes they already
+        hold. Returns {transaction_id: result}, see AnnotationQueue.flush.
+        """
+        from monzo_annotate import AnnotationQueue
+
+        queue = AnnotationQueue(self, max_workers=max_workers)
+        if known is not None:
+            queue.seed(known)
+        for transaction_id, metadata in annotations:
+            queue.update(transaction_id, metadata)
+        return queue.flush()
+
+    def _invalidate_transaction(self, transactions_id, response):
+        tags = ['transaction:{0}'.format(transactions_id)]
+        account_id = response.get('transaction', {}).get('account_id')
+        if account_id:
+            tags.append('transactions:{0}'.format(account_id))
+        self._invalidate(*tags)
+
+    def get_feed(self, account_id=None, raw=False):
         if account_id:  # pragma: no cover
             self.account_id = account_id
 
-        url = urljoin(self.api_url, 'feed?account_id={0}'.format(self.account_id))  # NOQA
-        response = self.get(url)
+        url = self.urls['feed_items'].format(self.account_id)
+        response = self.get(url, raw=raw)
         return response
 
     def create_feed_item(
@@ -210,95 +665,168 @@ class MonzoClient(object):
         if account_id:  # pragma: no cover
             self.account_id = account_id
 
-        url = urljoin(self.api_url, 'feed')
-        data = {
-            'account_id': self.account_id,
-            'type': 'basic',
-            'params[title]': title,
-            'params[image_url]': image_url
-        }
-        if url:
-            data['url'] = url
-        if body:
-            data['params[body]'] = body
-        if background_color:
-            data['params[background_color]'] = background_color
-        if title_color:
-            data['params[title_color]'] = title_color
-        if body_color:
-            data['params[body_color]'] = body_color
-
-        response = self.post(url, data=data)
+        from monzo_feed import feed_item_data
+
+        data = feed_item_data({
+            'title': title,
+            'image_url': image_url,
+            'url': url,
+            'body': body,
+            'background_color': background_color,
+            'title_color': title_color,
+            'body_color': body_color,
+        }, self.account_id)
+        response = self.post(self.urls['feed'], data=data)
         return response
 
-    def list_webhooks(self, account_id=None):
+    def create_feed_items(
+        self, items, max_workers=8, max_pending=None, progress=None,
+        retry_policy=None
+    ):
+        """ Post many feed items concurrently, see monzo_feed.FeedPublisher
+
+        items is an iterable of dicts with the create_feed_item arguments
+        plus optional account_id and access_token keys. It is read lazily,
+        max_pending items ahead of the max_workers threads posting them.
+        Returns the stats, including any 'failures' after retries. Only
+        posts the API cannot have acted on are retried unless retry_policy
+        says otherwise.
+        """
+        from monzo_feed import FeedPublisher
+
+        publisher = FeedPublisher(
+            self, max_workers=max_workers, max_pending=max_pending,
+            retry_policy=retry_policy, progress=progress,
+        )
+        return publisher.publish(items)
+
+    def list_webhooks(self, account_id=None, raw=False):
         if account_id:  # pragma: no cover
             self.account_id = account_id
+        return self._list_webhooks(self.account_id, raw=raw)
 
-        url = urljoin(self.api_url, 'webhooks?account_id={0}'.format(self.account_id))  # NOQA
-        response = self.get(url)
+    def _list_webhooks(self, account_id, raw=False):
+        url = self.urls['webhooks'].format(account_id)
+        response = self.get(url, raw=raw)
+        if raw:
+            return response
         return response['webhooks']
 
     def create_webhook(self, webhook_url, account_id=None):
         if account_id:  # pragma: no cover
             self.account_id = account_id
-        url = urljoin(self.api_url, 'webhooks')
+        return self._create_webhook(webhook_url, self.account_id)
+
+    def _create_webhook(self, webhook_url, account_id):
+        url = self.urls['create_webhook']
         data = {
-            'account_id': self.account_id,
+            'account_id': account_id,
             'url': webhook_url,
         }
         response = self.post(url, data)
+        self._invalidate('webhooks:{0}'.format(account_id))
         return response['webhook']
 
     def remove_webhook(self, webhook_id, account_id=None):
         if account_id:  # pragma: no cover
             self.account_id = account_id
+        return self._remove_webhook(webhook_id, self.account_id)
 
-        url = urljoin(self.api_url, 'webhooks/{0}'.format(webhook_id))
+    def _remove_webhook(self, webhook_id, account_id):
+        url = self.urls['webhook'].format(webhook_id)
         response = self.delete(url)
+        self._invalidate('webhooks:{0}'.format(account_id))
         return response
 
-    def upload_attachment(self, file_path):
-        __, file_name = os.path.split(file_path)
-        mime = MimeTypes()
-        url = urllib.pathname2url(file_path)
-        mime_type, __ = mime.guess_type(url)
+    def upload_attachment(
+        self, file_path, file_name=None, file_type=None, progress=None,
+        chunk_size=64 * 1024
+    ):
+        """ Upload a file, streaming it in chunk_size pieces
+
+        file_path can also be an open binary file object or an mmap, in
+        which case pass file_name unless the object has a name.
+        progress(sent, total) is called as each chunk is sent.
+        """
+        if hasattr(file_path, 'read'):
+            fileobj = file_path
+            file_path = getattr(fileobj, 'name', file_name)
+        else:
+            fileobj = None
+        if not file_name:
+            __, file_name = os.path.split(file_path)
+        if not file_type:
+            import mimetypes
+            file_type, __ = mimetypes.guess_type(file_name)
 
         data = {
             'file_name': file_name,
-            'file_type': mime_type
+            'file_type': file_type
         }
-        url = urljoin(self.api_url, 'attachment/upload')
+        url = self.urls['attachment_upload']
         response = self.post(url, data=data)
 
-        with open(file_path) as fh:
-            file_data = fh.read()
-
-        upload_response = requests.put(
-            response['upload_url'],
-            data=file_data,
-            headers={'content-type': mime_type},
-            params={'file': file_path}
-        )
+        fh = fileobj if fileobj is not None else open(file_path, 'rb')
+        try:
+            upload_response = self.session.put(
+                response['upload_url'],
+                data=UploadStream(fh, progress, chunk_size),
+                headers={'content-type': file_type},
+                params={'file': file_path},
+                timeout=self.timeout,
+            )
+        finally:
+            if fileobj is None:
+                fh.close()
         upload_response.raise_for_status()
 
         return {
             'file_url': response['file_url'],
-            'file_type': mime_type,
+            'file_type': file_type,
         }
 
+    def upload_and_attach_many(self, files, max_workers=4, progress=None):
+        """ Upload and attach many (transaction_id, file_path) pairs
+
+        Each file goes through attachment/upload, the PUT and
+        attachment/register on a pool of max_workers threads, so the steps
+        for different files overlap. Returns one dict per file, in order,
+        with either an 'attachment' or the 'error' raised.
+        """
+        def upload_and_attach(item):
+            transaction_id, file_path = item
+            result = {'transaction_id': transaction_id, 'file_path': file_path}  # NOQA
+            try:
+                upload = self.upload_attachment(file_path, progress=progress)
+                result['attachment'] = self.attach_file(
+                    transaction_id, upload['file_url'], upload['file_type']
+                )
+            except Exception as error:
+                result['error'] = error
+            return result
+
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(max_workers)
+        try:
+            return pool.map(upload_and_attach, files)
+        finally:
+            pool.close()
+            pool.join()
+
     def attach_file(self, transaction_id, file_url, file_type):
-        url = urljoin(self.api_url, 'attachment/register')
+        url = self.urls['attachment_register']
         data = {
             'external_id': transaction_id,
             'file_url': file_url,
             'file_type': file_type
         }
         response = self.post(url, data=data)
+        self._invalidate('transaction:{0}'.format(transaction_id))
         return response['attachment']
 
     def remove_attachment(self, attachment_id):
-        url = urljoin(self.api_url, 'attachment/deregister')
+        url = self.urls['attachment_deregister']
         data = {'id': attachment_id}
         response = self.post(url, data=data)
         return response
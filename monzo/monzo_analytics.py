@@ -0,0 +1,275 @@
+""" Spending analytics from rollups kept next to a TransactionStore
+
+AnalyticsStore is a TransactionStore which also keeps daily, monthly and
+per-merchant totals in SQLite. Every upsert, e.g. from TransactionSync,
+adds each new transaction's amount to a fixed number of rollup rows, and
+takes an updated transaction's old amount back out first, so nothing is
+ever recomputed from scratch. Queries read the rollups by primary key
+ranges instead of scanning transactions.
+
+Amounts are in minor units. 'spent' is money out, 'received' money in and
+'net' their difference; declined transactions are left out. Days and
+months are taken from the UTC 'created' timestamp.
+"""
+
+import json
+
+from monzo_sync import TransactionStore, merchant_id
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    account_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    spent INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (account_id, day, category)
+);
+CREATE TABLE IF NOT EXISTS monthly_rollup (
+    account_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    spent INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (account_id, month, category)
+);
+CREATE TABLE IF NOT EXISTS merchant_rollup (
+    account_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    merchant_id TEXT NOT NULL,
+    spent INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (account_id, day, merchant_id)
+);
+CREATE INDEX IF NOT EXISTS merchant_rollup_merchant
+    ON merchant_rollup (account_id, merchant_id, day);
+"""
+
+# table: (period column, group column)
+ROLLUPS = {
+    'daily_rollup': ('day', 'category'),
+    'monthly_rollup': ('month', 'category'),
+    'merchant_rollup': ('day', 'merchant_id'),
+}
+
+
+def contributions(transaction):
+    """ [(table, key, (spent, received, count))] for one transaction """
+    if transaction.get('decline_reason'):
+        return []
+    amount = transaction.get('amount') or 0
+    values = (max(-amount, 0), max(amount, 0), 1)
+    account_id = transaction['account_id']
+    day = transaction['created'][:10]
+    category = transaction.get('category') or ''
+    rows = [
+        ('daily_rollup', (account_id, day, category), values),
+        ('monthly_rollup', (account_id, day[:7], category), values),
+    ]
+    merchant = merchant_id(transaction)
+    if merchant:
+        rows.append(('merchant_rollup', (account_id, day, merchant), values))
+    return rows
+
+
+def as_day(value):
+    """ 'YYYY-MM-DD' from a date, datetime or Monzo timestamp """
+    if value is None or isinstance(value, str):
+        return value[:10] if value else None
+    return value.strftime('%Y-%m-%d')
+
+
+def as_month(value):
+    day = as_day(value)
+    return day[:7] if day else None
+
+
+def totals(row, **values):
+    values.update({
+        'spent': row['spent'],
+        'received': row['received'],
+        'net': row['received'] - row['spent'],
+        'count': row['count'],
+    })
+    return values
+
+
+class AnalyticsStore(TransactionStore):
+    """ TransactionStore with incrementally maintained spending rollups
+
+    Opening an existing store without rollups builds them once from the
+    stored transactions; after that only rebuild() recomputes anything.
+    Ranges are since <= period < before, as with transactions().
+    """
+
+    def __init__(self, path=':memory:'):
+        super(AnalyticsStore, self).__init__(path)
+        self.connection.executescript(ROLLUP_SCHEMA)
+        empty = self.connection.execute(
+            'SELECT 1 FROM daily_rollup LIMIT 1'
+        ).fetchone() is None
+        if empty and self.connection.execute(
+            'SELECT 1 FROM transactions LIMIT 1'
+        ).fetchone() is not None:
+            self.rebuild()
+
+    def changed(self, changes):
+        deltas = {}
+        for previous, transaction in changes:
+            if previous is not None:
+                self._add(deltas, json.loads(previous), -1)
+            self._add(deltas, transaction, 1)
+        self._apply(deltas)
+
+    def rebuild(self, account_id=None):
+        """ Recompute the rollups for one account, or all, from scratch """
+        sql = 'SELECT data FROM transactions'
+        params = ()
+        if account_id:
+            sql += ' WHERE account_id = ?'
+            params = (account_id,)
+        with self.lock, self.connection:
+            for table in ROLLUPS:
+                self.connection.execute(
+                    'DELETE FROM {0}{1}'.format(table, ' WHERE account_id = ?' if account_id else ''),  # NOQA
+                    params,
+                )
+            deltas = {}
+            for row in self.connection.execute(sql, params):
+                self._add(deltas, json.loads(row['data']), 1)
+            self._apply(deltas)
+
+    def _add(self, deltas, transaction, sign):
+        for table, key, values in contributions(transaction):
+            total = deltas.setdefault((table, key), [0, 0, 0])
+            for index, value in enumerate(values):
+                total[index] += sign * value
+
+    def _apply(self, deltas):
+        """ Add summed deltas to the rollups, one row update per key """
+        for (table, key), (spent, received, count) in deltas.items():
+            if not (spent or received or count):
+                continue
+            period, group = ROLLUPS[table]
+            where = 'account_id = ? AND {0} = ? AND {1} = ?'.format(period, group)  # NOQA
+            self.connection.execute(
+                'INSERT OR IGNORE INTO {0} VALUES (?, ?, ?, 0, 0, 0)'.format(table),  # NOQA
+                key,
+            )
+            self.connection.execute(
+                'UPDATE {0} SET spent = spent + ?, received = received + ?, '
+                'count = count + ? WHERE {1}'.format(table, where),
+                (spent, received, count) + key,
+            )
+            if count < 0:
+                self.connection.execute(
+                    'DELETE FROM {0} WHERE {1} AND count <= 0'.format(table, where),  # NOQA
+                    key,
+                )
+
+    def _query(self, table, column, account_id, since, before, filters=()):
+        """ Rollup rows in range summed per column, ordered by it """
+        period = ROLLUPS[table][0]
+        sql = 'SELECT {0}, SUM(spent) AS spent, SUM(received) AS received, SUM(count) AS count FROM {1} WHERE account_id = ?'.format(column, table)  # NOQA
+        params = [account_id]
+        for name, value in filters:
+            if value is not None:
+                sql += ' AND {0} = ?'.format(name)
+                params.append(value)
+        if since:
+            sql += ' AND {0} >= ?'.format(period)
+            params.append(since)
+        if before:
+            sql += ' AND {0} < ?'.format(period)
+            params.append(before)
+        sql += ' GROUP BY {0} ORDER BY {0}'.format(column)
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def daily(self, account_id, since=None, before=None, category=None):
+        """ Totals per day, oldest first """
+        rows = self._query(
+            'daily_rollup', 'day', account_id, as_day(since), as_day(before),
+            [('category', category)],
+        )
+        return [totals(row, day=row['day']) for row in rows]
+
+    def monthly(self, account_id, since=None, before=None, category=None):
+        """ Totals per month ('YYYY-MM'), oldest first """
+        rows = self._query(
+            'monthly_rollup', 'month', account_id, as_month(since),
+            as_month(before), [('category', category)],
+        )
+        return [totals(row, month=row['month']) for row in rows]
+
+    def month_over_month(self, account_id, since=None, before=None, category=None):  # NOQA
+        """ monthly() plus each month's change in spending from the last
+
+        'change' is the difference in spent and 'change_pct' it as a
+        percentage, None for the first month or after a month with none.
+        """
+        months = self.monthly(account_id, since, before, category)
+        previous = None
+        for month in months:
+            month['change'] = month['change_pct'] = None
+            if previous is not None:
+                month['change'] = month['spent'] - previous['spent']
+                if previous['spent']:
+                    month['change_pct'] = 100.0 * month['change'] / previous['spent']  # NOQA
+            previous = month
+        return months
+
+    def categories(self, account_id, since=None, before=None):
+        """ {category: totals} for the days in range """
+        rows = self._query(
+            'daily_rollup', 'category', account_id, as_day(since),
+            as_day(before),
+        )
+        return dict((row['category'], totals(row)) for row in rows)
+
+    def merchants(self, account_id, since=None, before=None, limit=None):
+        """ Totals per merchant for the days in range, biggest spend first """
+        rows = [
+            totals(row, merchant_id=row['merchant_id'])
+            for row in self._query(
+                'merchant_rollup', 'merchant_id', account_id, as_day(since),
+                as_day(before),
+            )
+        ]
+        rows.sort(key=lambda row: (-row['spent'], row['merchant_id']))
+        return rows[:limit] if limit else rows
+
+    def merchant_daily(self, account_id, merchant_id, since=None, before=None):  # NOQA
+        """ Totals per day for one merchant, read from its own index """
+        rows = self._query(
+            'merchant_rollup', 'day', account_id, as_day(since),
+            as_day(before), [('merchant_id', merchant_id)],
+        )
+        return [totals(row, day=row['day']) for row in rows]
+
+    def running_balance(self, account_id, balance, since=None, before=None):  # NOQA
+        """ [(day, balance at the end of that day)] for days with activity
+
+        balance is the account's balance now, e.g. from get_balance, and
+        earlier balances are worked back from it. Only transactions in the
+        store are accounted for, so sync the account first.
+        """
+        since, before = as_day(since), as_day(before)
+        if before:
+            with self.lock:
+                row = self.connection.execute(
+                    'SELECT SUM(received) - SUM(spent) AS net '
+                    'FROM daily_rollup WHERE account_id = ? AND day >= ?',
+                    (account_id, before),
+                ).fetchone()
+            balance -= row['net'] or 0
+        days = self.daily(account_id, since, before)
+        balances = []
+        for day in reversed(days):
+            balances.append((day['day'], balance))
+            balance -= day['net']
+        balances.reverse()
+        return balances
@@ -0,0 +1,131 @@
+""" Bulk transaction annotation for MonzoClient
+
+AnnotationQueue collects metadata writes and sends them as one PATCH per
+transaction. Several writes to the same transaction are merged, the last
+value for a key wins, and keys which already hold the value being written
+(per the last metadata seen for that transaction) are dropped before
+anything is sent.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from monzo_ratelimit import RETRY_STATUSES, RetryPolicy
+
+
+class AnnotationQueue(object):
+    """ Pending metadata writes, coalesced per transaction id
+
+    An empty value removes the key, as with remove_annotations. Writes can
+    be queued from any thread; flush() sends them on max_workers threads
+    and retries transient failures with retry_policy.
+    """
+
+    def __init__(self, client, max_workers=8, retry_policy=None):
+        self.client = client
+        self.max_workers = max_workers
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(statuses=RETRY_STATUSES)  # NOQA
+        self.pending = OrderedDict()  # transaction_id: {key: value}
+        self.known = {}  # transaction_id: last metadata seen
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def seed(self, transactions):
+        """ Remember the current metadata of transactions already fetched
+
+        Takes transaction dicts or monzo_models.Transaction objects, e.g.
+        from iter_transactions, so writes they already hold are skipped.
+        """
+        with self.lock:
+            for transaction in transactions:
+                if not isinstance(transaction, dict):
+                    transaction = transaction.raw
+                self.known[transaction['id']] = dict(transaction.get('metadata') or {})  # NOQA
+
+    def update(self, transaction_id, metadata):
+        """ Queue metadata {key: value} to be written to transaction_id """
+        with self.lock:
+            self.pending.setdefault(transaction_id, {}).update(metadata)
+
+    def set(self, transaction_id, key, value):
+        self.update(transaction_id, {key: value})
+
+    def remove(self, transaction_id, keys):
+        self.update(transaction_id, dict((key, '') for key in keys))
+
+    def changes(self, transaction_id, metadata):
+        """ The part of metadata which differs from what is known """
+        known = self.known.get(transaction_id)
+        if known is None:
+            return dict(metadata)
+        return dict(
+            (key, value) for key, value in metadata.items()
+            if known.get(key, '') != value
+        )
+
+    def flush(self):
+        """ Send every pending write, returns {transaction_id: result}
+
+        Each result has a 'status' of 'updated', 'unchanged' or 'failed',
+        the 'metadata' sent, the number of 'attempts' and, on failure, the
+        'error' raised. Failed writes are not queued again.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, OrderedDict()
+            work = []
+            report = OrderedDict()
+            for transaction_id, metadata in pending.items():
+                changes = self.changes(transaction_id, metadata)
+                report[transaction_id] = {
+                    'status': 'unchanged', 'metadata': changes, 'attempts': 0,
+                }
+                if changes:
+                    work.append((transaction_id, changes))
+
+        if work:
+            pool = ThreadPool(min(self.max_workers, len(work)))
+            try:
+                for transaction_id, result in pool.imap_unordered(self._write, work):  # NOQA
+                    report[transaction_id].update(result)
+            finally:
+                pool.close()
+                pool.join()
+        return report
+
+    def _write(self, item):
+        transaction_id, metadata = item
+        policy = self.retry_policy
+        attempt = 0
+        while True:
+            response = None
+            try:
+                transaction = self.client.annotate_transaction(transaction_id, metadata)  # NOQA
+            except (requests.ConnectionError, requests.HTTPError) as error:
+                response = getattr(error, 'response', None)
+                transient = response is None or response.status_code in policy.statuses  # NOQA
+                if not transient or not policy.can_retry('PATCH', attempt):
+                    return transaction_id, {
+                        'status': 'failed', 'attempts': attempt + 1,
+                        'error': error,
+                    }
+            except Exception as error:
+                return transaction_id, {
+                    'status': 'failed', 'attempts': attempt + 1,
+                    'error': error,
+                }
+            else:
+                with self.lock:
+                    self.known[transaction_id] = dict(transaction.get('metadata') or {})  # NOQA
+                return transaction_id, {
+                    'status': 'updated', 'attempts': attempt + 1,
+                }
+            delay = policy.delay(attempt, response)
+            attempt += 1
+            if delay:
+                time.sleep(delay)
@@ -0,0 +1,45 @@
+""" ASGI adapter for monzo_webhooks.WebhookReceiver """
+
+import json
+
+
+def asgi_app(receiver):
+    """ Wrap a WebhookReceiver so it can be served by uvicorn, hypercorn... """
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    receiver.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        if scope['method'] != 'POST':
+            status, body = 405, {'error': 'POST only'}
+        else:
+            chunks = []
+            more_body = True
+            while more_body:
+                message = await receive()
+                chunks.append(message.get('body', b''))
+                more_body = message.get('more_body', False)
+            # handle() only queues the event so it is safe on the event loop
+            status, body = receiver.handle(
+                b''.join(chunks), scope.get('query_string', b'').decode('latin-1')  # NOQA
+            )
+
+        payload = json.dumps(body).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode('ascii')),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    return app
@@ -0,0 +1,394 @@
+""" asyncio version of MonzoClient (requires aiohttp) """
+
+import os
+import time
+import asyncio
+import mimetypes
+from urllib.parse import urlencode, urljoin
+
+import aiohttp
+
+from monzo import DEFAULT_TIMEOUT
+from monzo_tokens import TokenManager
+
+
+def client_timeout(timeout):
+    """ An aiohttp.ClientTimeout for a requests style timeout
+
+    (connect, read) or one number for both, as MonzoClient takes. None
+    gives None, so the session keeps aiohttp's own default.
+    """
+    if timeout is None:
+        return None
+    if isinstance(timeout, aiohttp.ClientTimeout):
+        return timeout
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout,) * 2
+    return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+
+def make_async_session(limit=100, limit_per_host=0, timeout=DEFAULT_TIMEOUT):
+    """ An aiohttp session which can be shared between many async clients """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)  # NOQA
+    timeout = client_timeout(timeout)
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    return aiohttp.ClientSession(connector=connector, **kwargs)
+
+
+class AsyncMonzoClient(object):
+    """ Same methods as MonzoClient but each network call is a coroutine
+
+    Many clients (one per account) can share a session so a single event
+    loop keeps all of their requests in flight at once.
+    """
+
+    def __init__(
+        self,
+        client_id=None,  # Needed if access code is not already aquired
+        client_secret=None,  # Needed if access code is not already aquired
+        login_url=None,  # Needed if access code is not already aquired
+        access_token=None,
+        refresh_token=None,
+        account_id=None,
+        session=None,  # Pass a make_async_session() to share between clients
+        limit=100,
+        timeout=DEFAULT_TIMEOUT,  # None uses aiohttp's default
+        single_flight=None,  # A monzo_flight.AsyncSingleFlight, can be shared
+        token_store=None,  # A monzo_tokens.TokenStore shared between workers
+        refresh_margin=60,  # Refresh this many seconds before expiry
+    ):
+        self.token_url = 'https://api.monzo.com/oauth2/token'
+        self.api_url = 'https://api.monzo.com/'
+        self.auth_url = 'https://auth.getmondo.co.uk/'
+        self.client_id = client_id if client_id else ''
+        self.client_secret = client_secret if client_secret else ''
+        self.login_url = login_url if login_url else ''
+        self.tokens = TokenManager(
+            access_token=access_token if access_token else '',
+            refresh_token=refresh_token if refresh_token else '',
+            store=token_store,
+            refresh_margin=refresh_margin,
+        )
+        if token_store is not None and not access_token:
+            stored = token_store.load()
+            if stored:
+                self.tokens.update(stored)
+        self.account_id = account_id if account_id else ''
+        self.limit = limit
+        self.timeout = timeout
+        self.session = session
+        self._owns_session = session is None
+        self.single_flight = single_flight
+
+    @property
+    def access_token(self):
+        return self.tokens.access_token
+
+    @access_token.setter
+    def access_token(self, access_token):
+        self.tokens.access_token = access_token
+
+    @property
+    def refresh_token(self):
+        return self.tokens.refresh_token
+
+    @refresh_token.setter
+    def refresh_token(self, refresh_token):
+        self.tokens.refresh_token = refresh_token
+
+    @property
+    def expires_at(self):
+        return self.tokens.expires_at
+
+    @expires_at.setter
+    def expires_at(self, expires_at):
+        self.tokens.set_expires_at(expires_at)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        # aiohttp sessions must be created inside the running loop
+        if self.session is None:
+            self.session = make_async_session(limit=self.limit, timeout=self.timeout)  # NOQA
+        return self.session
+
+    async def get(self, url):
+        if self.single_flight is None:
+            return await self.request(url=url, method='GET')
+        response, __ = await self.single_flight.do(
+            (self.access_token, url),
+            lambda: self.request(url=url, method='GET'),
+        )
+        return response
+
+    async def post(self, url, data):
+        return await self.request(url=url, method='POST', data=data)
+
+    async def patch(self, url, data):
+        return await self.request(url=url, method='PATCH', data=data)
+
+    async def delete(self, url):
+        return await self.request(url=url, method='DELETE')
+
+    async def request(self, **kwargs):
+        if kwargs['url'] != self.token_url:
+            await self._ensure_access_token()
+
+        if kwargs['url'].endswith('/'):  # pragma: no cover
+            kwargs['url'] = kwargs['url'][:-1]
+
+        if 'method' in kwargs:
+            kwargs['method'] = kwargs['method'].upper()
+        else:  # pragma: no cover
+            kwargs['method'] = 'GET'
+
+        kwargs['headers'] = {'Authorization': 'Bearer {0}'.format(self.access_token)}  # NOQA
+        if 'data' in kwargs:
+            kwargs['headers']['Content-Type'] = 'application/x-www-form-urlencoded'  # NOQA
+
+        async with self._get_session().request(**kwargs) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    def get_authorization_code(self):  # pragma: no cover
+        query = urlencode({
+            'client_id': self.client_id,
+            'redirect_uri': self.login_url,
+            'response_type': 'code',
+        })
+        url = urljoin(self.auth_url, '?{0}'.format(query))
+        return url
+
+    async def get_access_token(self, code):  # pragma: no cover
+        data = {
+            'grant_type': 'authorization_code',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'redirect_uri': self.login_url,
+            'code': code,
+        }
+        response = await self.post(url=self.token_url, data=data)
+        self.access_token = response['access_token']
+        if 'refresh_token' in response:
+            self.refresh_token = response['refresh_token']
+        response['expires_at'] = self._set_expires_at(response['expires_in'])
+        if self.tokens.store is not None:
+            self.tokens.store.save(self.tokens.as_dict())
+        return response
+
+    async def refresh_access_token(self, refresh_token=None):
+        if refresh_token:  # pragma: no cover
+            self.refresh_token = refresh_token
+        return await self.tokens.refresh_async(self._request_refresh)
+
+    async def _request_refresh(self, refresh_token):
+        data = {
+            'grant_type': 'refresh_token',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'refresh_token': refresh_token,
+        }
+        return await self.post(url=self.token_url, data=data)
+
+    def _set_expires_at(self, expires_in):
+        self.tokens.set_expires_at_epoch(time.time() + expires_in)
+        return self.expires_at
+
+    async def _ensure_access_token(self):
+        await self.tokens.ensure_async(self._request_refresh)
+
+    async def update_tokens(self, **kwargs):
+        if 'access_token' in kwargs:
+            self.access_token = kwargs['access_token']
+        if 'refresh_token' in kwargs:
+            self.refresh_token = kwargs['refresh_token']
+        if 'expires_at' in kwargs:
+            self.expires_at = kwargs['expires_at']
+        if 'account_id' in kwargs:  # pragma: no cover
+            self.account_id = kwargs['account_id']
+        else:
+            accounts = await self.list_accounts()
+            self.account_id = accounts['accounts'][0]['id']
+        await self._ensure_access_token()
+        return {
+            'access_token': self.access_token,
+            'refresh_token': self.refresh_token,
+            'expires_at': self.expires_at,
+            'account_id': self.account_id,
+        }
+
+    async def whoami(self):
+        url = urljoin(self.api_url, 'ping/whoami')
+        return await self.get(url)
+
+    async def list_accounts(self):
+        url = urljoin(self.api_url, 'accounts')
+        return await self.get(url)
+
+    async def get_balance(self, account_id=None):
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+
+        url = urljoin(self.api_url, 'balance?account_id={0}'.format(self.account_id))  # NOQA
+        return await self.get(url)
+
+    async def list_transactions(self, account_id=None, limit=100, since='', before=''):  # NOQA
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+
+        query = urlencode({
+            'account_id': self.account_id,
+            'expand[]': 'merchant',
+            'limit': limit,
+            'since': since,
+            'before': before,
+        })
+        url = urljoin(self.api_url, 'transactions?{0}'.format(query))
+        response = await self.get(url)
+        return response['transactions']
+
+    async def get_transaction(self, transactions_id):
+        url = urljoin(
+            self.api_url,
+            'transactions/{0}?expand[]=merchant'.format(transactions_id)
+        )
+        response = await self.get(url)
+        return response['transaction']
+
+    async def annotate_transaction(self, transactions_id, metadata):
+        """ Metadata is just a key:value pair """
+
+        url = urljoin(self.api_url, 'transactions/{0}'.format(transactions_id))
+        data = {}
+        for key, value in metadata.items():
+            data['metadata[{}]'.format(key)] = value
+
+        response = await self.patch(url, data=data)
+        return response['transaction']
+
+    async def remove_annotations(self, transactions_id, annotation_keys):
+        """ annotation_keys is a list of keys to remove """
+
+        url = urljoin(self.api_url, 'transactions/{0}'.format(transactions_id))
+        data = {}
+        for key in annotation_keys:
+            data['metadata[{}]'.format(key)] = ''
+
+        return await self.patch(url, data=data)
+
+    async def get_feed(self, account_id=None):
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+
+        url = urljoin(self.api_url, 'feed?account_id={0}'.format(self.account_id))  # NOQA
+        return await self.get(url)
+
+    async def create_feed_item(
+        self, title, image_url, url=None, body=None,
+        background_color=None, title_color=None, body_color=None,
+        account_id=None
+    ):
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+
+        data = {
+            'account_id': self.account_id,
+            'type': 'basic',
+            'params[title]': title,
+            'params[image_url]': image_url
+        }
+        if url:
+            data['url'] = url
+        if body:
+            data['params[body]'] = body
+        if background_color:
+            data['params[background_color]'] = background_color
+        if title_color:
+            data['params[title_color]'] = title_color
+        if body_color:
+            data['params[body_color]'] = body_color
+
+        return await self.post(urljoin(self.api_url, 'feed'), data=data)
+
+    async def list_webhooks(self, account_id=None):
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+
+        url = urljoin(self.api_url, 'webhooks?account_id={0}'.format(self.account_id))  # NOQA
+        response = await self.get(url)
+        return response['webhooks']
+
+    async def create_webhook(self, webhook_url, account_id=None):
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+        url = urljoin(self.api_url, 'webhooks')
+        data = {
+            'account_id': self.account_id,
+            'url': webhook_url,
+        }
+        response = await self.post(url, data)
+        return response['webhook']
+
+    async def remove_webhook(self, webhook_id, account_id=None):
+        if account_id:  # pragma: no cover
+            self.account_id = account_id
+
+        url = urljoin(self.api_url, 'webhooks/{0}'.format(webhook_id))
+        return await self.delete(url)
+
+    async def upload_attachment(self, file_path):
+        __, file_name = os.path.split(file_path)
+        mime_type, __ = mimetypes.guess_type(file_path)
+
+        data = {
+            'file_name': file_name,
+            'file_type': mime_type
+        }
+        url = urljoin(self.api_url, 'attachment/upload')
+        response = await self.post(url, data=data)
+
+        # The running loop, get_running_loop() needs Python 3.7
+        loop = asyncio.get_event_loop()
+        file_data = await loop.run_in_executor(None, _read_file, file_path)
+
+        upload = self._get_session().put(
+            response['upload_url'],
+            data=file_data,
+            headers={'content-type': mime_type},
+            params={'file': file_path},
+        )
+        async with upload as upload_response:
+            upload_response.raise_for_status()
+
+        return {
+            'file_url': response['file_url'],
+            'file_type': mime_type,
+        }
+
+    async def attach_file(self, transaction_id, file_url, file_type):
+        url = urljoin(self.api_url, 'attachment/register')
+        data = {
+            'external_id': transaction_id,
+            'file_url': file_url,
+            'file_type': file_type
+        }
+        response = await self.post(url, data=data)
+        return response['attachment']
+
+    async def remove_attachment(self, attachment_id):
+        url = urljoin(self.api_url, 'attachment/deregister')
+        data = {'id': attachment_id}
+        return await self.post(url, data=data)
+
+
+def _read_file(file_path):
+    with open(file_path, 'rb') as fh:
+        return fh.read()
@@ -0,0 +1,386 @@
+""" Full history backfill for many accounts on a process pool
+
+Backfill splits each account's history into time range shards and fetches
+them from a pool of worker processes, so JSON decoding is spread over CPUs
+while other workers wait on the network. Each worker keeps one MonzoClient
+per account with that account's own token. Pages stream back over a
+bounded queue to the parent, the single writer, which upserts them into a
+store such as monzo_sync.TransactionStore.
+
+After a page is written its shard's cursor is checkpointed to a JSON file.
+Running the same backfill again after a crash skips finished shards and
+resumes the others from their cursor; upserts are idempotent so a page
+written but not yet checkpointed is harmless.
+"""
+
+import os
+import json
+import time
+import queue
+import multiprocessing
+from datetime import datetime, timedelta
+
+from monzo_sync import format_since
+
+# Monzo opened to customers in 2015, so no history starts earlier
+HISTORY_START = datetime(2015, 1, 1)
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def plan_shards(
+    account_ids, start=HISTORY_START, end=None, shard_size=timedelta(days=90)
+):
+    """ [shard] covering start to end for each account, oldest first
+
+    A shard is a dict with an 'id', 'account_id', 'since' and 'before'.
+    """
+    end = end if end else datetime.utcnow()
+    shards = []
+    for account_id in account_ids:
+        since = start
+        while since < end:
+            before = min(since + shard_size, end)
+            shards.append({
+                'id': '{0}/{1}'.format(account_id, format_since(since)),
+                'account_id': account_id,
+                'since': format_since(since),
+                'before': format_since(before),
+            })
+            since = before
+    return shards
+
+
+def _init_worker(client_kwargs, api_url, token_path, page_size, results):
+    from monzo_ratelimit import RETRY_STATUSES, RetryPolicy
+
+    client_kwargs = dict(client_kwargs)
+    client_kwargs.setdefault(
+        'retry_policy', RetryPolicy(statuses=RETRY_STATUSES)
+    )
+    _worker.update({
+        'client_kwargs': client_kwargs,
+        'api_url': api_url,
+        'token_path': token_path,
+        'page_size': page_size,
+        'results': results,
+        'clients': {},
+    })
+
+
+def _client(account):
+    """ This worker's MonzoClient for account, made on first use
+
+    Refreshed tokens are shared through a SQLiteTokenStore keyed by the
+    account id, so workers fetching shards of one account, and later runs,
+    use the latest single-use refresh token.
+    """
+    from monzo import MonzoClient
+    from monzo_tokens import SQLiteTokenStore, parse_expires_at
+
+    account_id = account['account_id']
+    clients = _worker['clients']
+    client = clients.get(account_id)
+    if client is None:
+        kwargs = dict(_worker['client_kwargs'])
+        kwargs.update({
+            'account_id': account_id,
+            'access_token': account.get('access_token'),
+            'refresh_token': account.get('refresh_token'),
+        })
+        if _worker['token_path']:
+            kwargs['token_store'] = SQLiteTokenStore(
+                _worker['token_path'], key=account_id
+            )
+        client = clients[account_id] = MonzoClient(**kwargs)
+        if account.get('expires_at'):
+            client.expires_at = account['expires_at']
+        store = client.tokens.store
+        stored = store.load() if store is not None else None
+        if stored and parse_expires_at(stored.get('expires_at')) > \
+                client.tokens.expires_at_epoch:
+            # Refreshed by an earlier run, the given tokens are spent
+            client.tokens.update(stored)
+        if _worker['api_url']:
+            client.api_url = _worker['api_url']
+            client.token_url = client.api_url + 'oauth2/token'
+    return client
+
+
+def _run_shard(task):
+    """ Fetch one shard a page at a time, sending each to the writer """
+    shard, cursor, account = task
+    results = _worker['results']
+    page_size = _worker['page_size']
+    pid = os.getpid()
+    results.put(('start', shard['id'], pid))
+    try:
+        client = _client(account)
+        since = cursor if cursor else shard['since']
+        while True:
+            page = client._list_transactions(
+                shard['account_id'], page_size, since, shard['before']
+            )
+            if page:
+                since = page[-1]['id']
+                results.put(
+                    ('page', shard['id'], pid, page, since, time.time())
+                )
+            if len(page) < page_size:
+                break
+        results.put(('done', shard['id'], pid))
+    except Exception as error:
+        message = '{0}: {1}'.format(type(error).__name__, error)
+        results.put(('error', shard['id'], pid, message))
+
+
+def _alive(pid):
+    """ Whether a worker process is still running """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        pass
+    return True
+
+
+class Backfill(object):
+    """ Fetch every account's history into store on a process pool
+
+    accounts is a list of dicts with an 'account_id' plus its tokens:
+    'access_token' and optionally 'refresh_token' and 'expires_at', as
+    update_tokens() returns them. Each account's MonzoClient is made with
+    them and client_kwargs, and refreshed tokens are kept in token_path
+    (by default checkpoint_path plus .tokens). store needs an
+    upsert(transactions) method. Shards and cursors are kept in
+    checkpoint_path; an existing checkpoint is resumed rather than planned
+    again. progress(stats) is called at most every progress_interval
+    seconds and once at the end.
+    """
+
+    def __init__(
+        self, accounts, store, checkpoint_path, processes=4,
+        start=HISTORY_START, end=None, shard_size=timedelta(days=90),
+        page_size=100, client_kwargs=None, api_url=None, max_pending=None,
+        progress=None, progress_interval=1.0, checkpoint_interval=1.0,
+        token_path=None
+    ):
+        self.accounts = dict(
+            (account['account_id'], account) for account in accounts
+        )
+        self.store = store
+        self.checkpoint_path = checkpoint_path
+        self.processes = processes
+        self.start = start
+        self.end = end
+        self.shard_size = shard_size
+        self.page_size = page_size
+        self.client_kwargs = client_kwargs if client_kwargs else {}
+        self.api_url = api_url  # Overrides for a mock or sandbox API
+        self.token_path = token_path if token_path else \
+            checkpoint_path + '.tokens'
+        self.max_pending = max_pending if max_pending else processes * 4
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.checkpoint_interval = checkpoint_interval
+
+    def load_checkpoint(self):
+        """ The saved shards, or a new plan if there is no checkpoint """
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint:
+                return json.load(checkpoint)['shards']
+        shards = plan_shards(
+            sorted(self.accounts), self.start, self.end, self.shard_size
+        )
+        for shard in shards:
+            shard.update({'cursor': None, 'done': False, 'transactions': 0})
+        return shards
+
+    def save_checkpoint(self, shards):
+        """ Written to a temporary file first so a crash can't corrupt it """
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'shards': shards}, checkpoint)
+        os.replace(temporary, self.checkpoint_path)
+
+    def run(self):
+        """ Backfill every shard not already done, returns the final stats
+
+        Stats count 'shards', 'done' and 'failed' shards, 'transactions'
+        written, 'elapsed' seconds and 'per_second'. 'workers' has, per
+        worker pid, the 'shard' it last sent, its 'pages' and
+        'transactions', and its 'lag': seconds between the worker fetching
+        its last page and that page being written. 'errors' maps shard ids
+        to the error which stopped them; rerun to retry them. A shard
+        whose worker process died counts as failed too.
+        """
+        shards = self.load_checkpoint()
+        by_id = dict((shard['id'], shard) for shard in shards)
+        todo = [shard for shard in shards if not shard['done']]
+        self.stats = {
+            'shards': len(shards), 'done': len(shards) - len(todo),
+            'failed': 0, 'transactions': 0, 'workers': {}, 'errors': {},
+        }
+        self.started = self.reported = time.time()
+        saved = time.time()
+        self.save_checkpoint(shards)
+        if not todo:
+            return self._report(final=True)
+
+        results = multiprocessing.Queue(self.max_pending)
+        pool = multiprocessing.Pool(
+            min(self.processes, len(todo)), _init_worker,
+            (
+                self.client_kwargs, self.api_url, self.token_path,
+                self.page_size, results,
+            ),
+        )
+        try:
+            result = pool.map_async(_run_shard, [
+                (shard, shard['cursor'], self.accounts[shard['account_id']])
+                for shard in todo
+            ], chunksize=1)
+            remaining = set(shard['id'] for shard in todo)
+            running = {}  # shard id: pid of the worker fetching it
+            while remaining:
+                try:
+                    message = results.get(timeout=self.progress_interval)
+                except queue.Empty:
+                    # A killed worker never reports, so look for shards
+                    # which can no longer finish
+                    lost = [
+                        shard_id for shard_id in remaining
+                        if result.ready() or (
+                            shard_id in running
+                            and not _alive(running[shard_id])
+                        )
+                    ]
+                    for shard_id in lost:
+                        remaining.discard(shard_id)
+                        self.stats['failed'] += 1
+                        self.stats['errors'][shard_id] = (
+                            'Worker exited before finishing the shard'
+                        )
+                    self._report()
+                    continue
+                shard = by_id[message[1]]
+                if message[0] == 'start':
+                    running[shard['id']] = message[2]
+                    continue
+                worker = self.stats['workers'].setdefault(message[2], {
+                    'shard': None, 'pages': 0, 'transactions': 0, 'lag': 0.0,
+                })
+                worker['shard'] = shard['id']
+                if message[0] == 'page':
+                    page, cursor, fetched_at = message[3:]
+                    self.store.upsert(page)
+                    shard['cursor'] = cursor
+                    shard['transactions'] += len(page)
+                    self.stats['transactions'] += len(page)
+                    worker['pages'] += 1
+                    worker['transactions'] += len(page)
+                    worker['lag'] = time.time() - fetched_at
+                elif shard['id'] in remaining:
+                    remaining.discard(shard['id'])
+                    running.pop(shard['id'], None)
+                    if message[0] == 'done':
+                        shard['done'] = True
+                        self.stats['done'] += 1
+                    else:
+                        self.stats['failed'] += 1
+                        self.stats['errors'][shard['id']] = message[3]
+                if time.time() - saved >= self.checkpoint_interval:
+                    self.save_checkpoint(shards)
+                    saved = time.time()
+                self._report()
+        finally:
+            pool.terminate()
+            pool.join()
+            self.save_checkpoint(shards)
+        return self._report(final=True)
+
+    def _report(self, final=False):
+        now = time.time()
+        if not final and now - self.reported < self.progress_interval:
+            return None
+        self.reported = now
+        stats = dict(self.stats)
+        stats['workers'] = dict(
+            (pid, dict(worker))
+            for pid, worker in self.stats['workers'].items()
+        )
+        stats['elapsed'] = now - self.started
+        stats['per_second'] = 0.0
+        if stats['elapsed']:
+            stats['per_second'] = stats['transactions'] / stats['elapsed']
+        if self.progress is not None:
+            self.progress(stats)
+        return stats
+
+
+def main():
+    """ python -m monzo_backfill --accounts accounts.json --db my.db """
+    import argparse
+
+    from monzo_sync import TransactionStore
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--accounts', required=True,
+        help='JSON list of {"account_id", "access_token", ...}',
+    )
+    parser.add_argument(
+        '--db', required=True, help='SQLite TransactionStore path'
+    )
+    parser.add_argument(
+        '--checkpoint', help='Defaults to the db path plus .checkpoint'
+    )
+    parser.add_argument(
+        '--tokens', help='Refreshed tokens, defaults to checkpoint + .tokens'
+    )
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--shard-days', type=float, default=90)
+    parser.add_argument('--since', help='YYYY-MM-DD, defaults to 2015-01-01')
+    parser.add_argument('--api-url')
+    args = parser.parse_args()
+
+    with open(args.accounts) as accounts:
+        accounts = json.load(accounts)
+
+    def progress(stats):
+        lag = max([w['lag'] for w in stats['workers'].values()] or [0])
+        print((
+            '{0}/{1} shards, {2} transactions, {3:.0f}/s, max lag {4:.2f}s'
+        ).format(
+            stats['done'], stats['shards'], stats['transactions'],
+            stats['per_second'], lag,
+        ))
+
+    start = HISTORY_START
+    if args.since:
+        start = datetime.strptime(args.since, '%Y-%m-%d')
+    backfill = Backfill(
+        accounts, TransactionStore(args.db),
+        args.checkpoint if args.checkpoint else args.db + '.checkpoint',
+        processes=args.processes,
+        start=start,
+        shard_size=timedelta(days=args.shard_days),
+        api_url=args.api_url,
+        progress=progress,
+        token_path=args.tokens,
+        # Needed to refresh tokens
+        client_kwargs={
+            'client_id': os.environ.get('MONZO_CLIENT_ID'),
+            'client_secret': os.environ.get('MONZO_CLIENT_SECRET'),
+        },
+    )
+    stats = backfill.run()
+    for shard_id, error in sorted(stats['errors'].items()):
+        print('{0} failed: {1}'.format(shard_id, error))
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+""" Response caching for the read endpoints of MonzoClient """
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from monzo_endpoints import parse_endpoint, token_scope
+
+# Seconds to keep each endpoint for, anything not listed is never cached
+DEFAULT_TTLS = {
+    'ping/whoami': 300,
+    'accounts': 300,
+    'balance': 10,
+    'transactions/{id}': 30,
+    'webhooks': 300,
+}
+
+
+class CacheBackend(object):
+    """ Storage used by ResponseCache
+
+    Implement this to share a cache between processes (memcached, redis,
+    ...). Values are JSON strings and each one is stored with a list of
+    tags so that invalidate() can drop every entry for a tag at once.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl, tags):
+        raise NotImplementedError
+
+    def invalidate(self, tags):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """ In-process LRU cache bounded by number of entries and total bytes """
+
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key: (value, expires_at, tags)
+        self.tags = {}  # tag: set of keys
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._unlink(key, entry)
+                return None
+            self.entries[key] = entry  # Most recently used goes last
+            return entry[0]
+
+    def set(self, key, value, ttl, tags):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self._unlink(key, entry)
+            self.entries[key] = (value, time.time() + ttl, tags)
+            self.size += len(value)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.entries and (
+                len(self.entries) > self.max_entries or
+                self.size > self.max_bytes
+            ):
+                self._unlink(*self.entries.popitem(last=False))
+
+    def invalidate(self, tags):
+        with self.lock:
+            for tag in tags:
+                for key in self.tags.pop(tag, ()):
+                    entry = self.entries.pop(key, None)
+                    if entry is not None:
+                        self._unlink(key, entry)
+
+    def _unlink(self, key, entry):
+        self.size -= len(entry[0])
+        for tag in entry[2]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+
+class ResponseCache(object):
+    """ Caches GET responses per access token with a TTL per endpoint
+
+    Entries are tagged with the account or transaction they belong to so
+    MonzoClient can drop exactly what a write changed. The Monzo API sends
+    no ETag or Last-Modified and ignores conditional requests, so there is
+    nothing to revalidate with: an expired entry is simply fetched again,
+    and invalidation on writes stands in for revalidation.
+    """
+
+    def __init__(self, backend=None, ttls=None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+
+    def scope(self, access_token):
+        """ Tokens are hashed so they never end up in a shared backend """
+        return token_scope(access_token)
+
+    def tags(self, endpoint, resource_id):
+        if endpoint == 'transactions/{id}':
+            return ['transaction:' + resource_id]
+        if resource_id:
+            return ['{0}:{1}'.format(endpoint, resource_id)]
+        return [endpoint]
+
+    def fetch(self, access_token, url, fetch):
+        """ Return the cached response for url or call fetch() and store it """
+        endpoint, resource_id = parse_endpoint(url)
+        ttl = self.ttls.get(endpoint)
+        if not ttl:
+            return fetch()
+
+        scope = self.scope(access_token)
+        key = scope + url
+        cached = self.backend.get(key)
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        response = fetch()
+        tags = self.tags(endpoint, resource_id)
+        self.backend.set(
+            key, json.dumps(response), ttl, [scope + tag for tag in tags]
+        )
+        return response
+
+    def invalidate(self, access_token, tags):
+        scope = self.scope(access_token)
+        self.backend.invalidate([scope + tag for tag in tags])
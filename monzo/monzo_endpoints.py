@@ -0,0 +1,25 @@
+""" Helpers for working out which API endpoint a url belongs to """
+
+from urllib.parse import urlparse, parse_qs
+
+
+def parse_endpoint(url):
+    """ Returns the endpoint template and the resource id for an API url
+
+    .../transactions/tx_1?expand[]=merchant gives ('transactions/{id}', 'tx_1')
+    .../balance?account_id=acc_1 gives ('balance', 'acc_1')
+    .../ping/whoami gives ('ping/whoami', None)
+    """
+    url = urlparse(url)
+    path = url.path.strip('/')
+    resource, __, resource_id = path.partition('/')
+    if resource_id and resource in ('transactions', 'webhooks'):
+        return resource + '/{id}', resource_id
+    account_id = parse_qs(url.query).get('account_id')
+    return path, account_id[0] if account_id else None
+
+
+def token_scope(access_token):
+    """ Short hash of a token to key per-token state without storing it """
+    import hashlib
+    return hashlib.sha1(access_token.encode('utf-8')).hexdigest()[:16]
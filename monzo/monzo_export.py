@@ -0,0 +1,232 @@
+""" Columnar export of transaction history (NumPy, Arrow and Parquet)
+
+Transactions are streamed from MonzoClient.iter_transactions into column
+buffers of batch_size rows, so only one batch is in memory at a time while
+writing Arrow or Parquet files. numpy and pyarrow are optional and only
+imported when an export needs them (pip install monzo[export]).
+"""
+
+COLUMNS = (
+    'id', 'amount', 'currency', 'created', 'category', 'merchant_id',
+    'settled', 'metadata_keys',
+)
+# Columns which also get an integer code so totals can use bincount
+CODES = {'category': 'category_code', 'merchant_id': 'merchant_code'}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        raise ImportError('numpy is needed for this export: pip install numpy')  # NOQA
+    return numpy
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # NOQA
+    except ImportError:  # pragma: no cover
+        raise ImportError('pyarrow is needed for this export: pip install pyarrow')  # NOQA
+    return pyarrow
+
+
+class TransactionColumns(object):
+    """ One batch of transactions held as a list per column
+
+    Batches from the same export share `vocabulary` so category and
+    merchant codes mean the same thing in every batch.
+    """
+
+    def __init__(self, vocabulary=None):
+        self.columns = dict((name, []) for name in COLUMNS + tuple(CODES.values()))  # NOQA
+        self.vocabulary = vocabulary if vocabulary is not None else dict(
+            (column, {}) for column in CODES
+        )
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def append(self, transaction):
+        if not isinstance(transaction, dict):  # A monzo_models.Transaction
+            transaction = transaction.raw
+        merchant = transaction.get('merchant')
+        if isinstance(merchant, dict):
+            merchant = merchant.get('id')
+        created = transaction['created']
+        columns = self.columns
+        columns['id'].append(transaction['id'])
+        columns['amount'].append(transaction.get('amount') or 0)
+        columns['currency'].append(transaction.get('currency') or '')
+        columns['created'].append(created[:-1] if created.endswith('Z') else created)  # NOQA
+        category = transaction.get('category') or ''
+        merchant = merchant or ''
+        vocabulary = self.vocabulary
+        columns['category'].append(category)
+        columns['category_code'].append(vocabulary['category'].setdefault(category, len(vocabulary['category'])))  # NOQA
+        columns['merchant_id'].append(merchant)
+        columns['merchant_code'].append(vocabulary['merchant_id'].setdefault(merchant, len(vocabulary['merchant_id'])))  # NOQA
+        columns['settled'].append(bool(transaction.get('settled')))
+        columns['metadata_keys'].append(tuple(sorted(transaction.get('metadata') or ())))  # NOQA
+
+    def to_record_array(self):
+        numpy = _numpy()
+        columns = self.columns
+        records = numpy.empty(len(self), dtype=record_dtype())
+        records['id'] = columns['id']
+        records['amount'] = columns['amount']
+        records['currency'] = columns['currency']
+        records['created'] = numpy.array(columns['created'], dtype='datetime64[us]')  # NOQA
+        records['category'] = columns['category']
+        records['merchant_id'] = columns['merchant_id']
+        records['settled'] = columns['settled']
+        records['category_code'] = columns['category_code']
+        records['merchant_code'] = columns['merchant_code']
+        metadata_keys = numpy.empty(len(self), dtype=object)
+        metadata_keys[:] = columns['metadata_keys']
+        records['metadata_keys'] = metadata_keys
+        return records.view(numpy.recarray)
+
+    def to_arrow(self):
+        pyarrow = _pyarrow()
+        numpy = _numpy()
+        columns = self.columns
+        return pyarrow.RecordBatch.from_arrays([
+            pyarrow.array(columns['id'], pyarrow.string()),
+            pyarrow.array(columns['amount'], pyarrow.int64()),
+            pyarrow.array(columns['currency'], pyarrow.string()),
+            pyarrow.array(numpy.array(columns['created'], dtype='datetime64[us]')),  # NOQA
+            pyarrow.array(columns['category'], pyarrow.string()),
+            pyarrow.array(columns['merchant_id'], pyarrow.string()),
+            pyarrow.array(columns['settled'], pyarrow.bool_()),
+            pyarrow.array(
+                [list(keys) for keys in columns['metadata_keys']],
+                pyarrow.list_(pyarrow.string()),
+            ),
+        ], names=list(COLUMNS))
+
+
+def record_dtype():
+    numpy = _numpy()
+    return numpy.dtype([
+        ('id', object),
+        ('amount', numpy.int64),
+        ('currency', 'U3'),
+        ('created', 'datetime64[us]'),
+        ('category', object),
+        ('merchant_id', object),
+        ('settled', numpy.bool_),
+        ('metadata_keys', object),
+        ('category_code', numpy.int32),
+        ('merchant_code', numpy.int32),
+    ])
+
+
+def iter_batches(transactions, batch_size=10000):
+    """ Group an iterable of transactions into TransactionColumns batches """
+    batch = TransactionColumns()
+    for transaction in transactions:
+        batch.append(transaction)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = TransactionColumns(batch.vocabulary)
+    if len(batch):
+        yield batch
+
+
+def _transactions(client, account_id, since, until, page_size):
+    return client.iter_transactions(
+        account_id=account_id, since=since, until=until,
+        page_size=page_size, prefetch=True,
+    )
+
+
+def export_record_array(
+    client, account_id=None, since=None, until=None, page_size=100,
+    batch_size=10000
+):
+    """ Full history as a single NumPy record array """
+    numpy = _numpy()
+    transactions = _transactions(client, account_id, since, until, page_size)
+    batches = [
+        batch.to_record_array()
+        for batch in iter_batches(transactions, batch_size)
+    ]
+    if not batches:
+        return numpy.empty(0, dtype=record_dtype()).view(numpy.recarray)
+    return numpy.concatenate(batches).view(numpy.recarray)
+
+
+def export_parquet(
+    client, path, account_id=None, since=None, until=None, page_size=100,
+    batch_size=10000
+):
+    """ Write history to a Parquet file one batch at a time, returns rows """
+    pyarrow = _pyarrow()
+    transactions = _transactions(client, account_id, since, until, page_size)
+    return _write_batches(
+        iter_batches(transactions, batch_size),
+        lambda schema: pyarrow.parquet.ParquetWriter(path, schema),
+        lambda writer, batch: writer.write_batch(batch),
+    )
+
+
+def export_arrow(
+    client, path, account_id=None, since=None, until=None, page_size=100,
+    batch_size=10000
+):
+    """ Write history to an Arrow IPC file one batch at a time """
+    pyarrow = _pyarrow()
+    transactions = _transactions(client, account_id, since, until, page_size)
+    return _write_batches(
+        iter_batches(transactions, batch_size),
+        lambda schema: pyarrow.ipc.new_file(path, schema),
+        lambda writer, batch: writer.write_batch(batch),
+    )
+
+
+def _write_batches(batches, open_writer, write):
+    writer = None
+    rows = 0
+    try:
+        for batch in batches:
+            record_batch = batch.to_arrow()
+            if writer is None:
+                writer = open_writer(record_batch.schema)
+            write(writer, record_batch)
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def totals_by(records, column):
+    """ Sum of amount for each distinct value of column
+
+    Works on record arrays from export_record_array and returns
+    {value: total} using numpy grouping rather than a Python loop.
+    """
+    numpy = _numpy()
+    amounts = records['amount']
+    code_column = CODES.get(column)
+    if code_column is None:
+        keys, codes = numpy.unique(records[column], return_inverse=True)
+        codes = codes.ravel()
+    else:
+        codes = records[code_column]
+    totals = numpy.bincount(codes, weights=amounts)
+    # Index of the first row for each code gives its value
+    first = numpy.full(len(totals), -1, dtype=numpy.int64)
+    first[codes[::-1]] = numpy.arange(len(codes) - 1, -1, -1)
+    present = first >= 0
+    keys = records[column][first[present]]
+    return dict(zip(keys.tolist(), totals[present].astype(numpy.int64).tolist()))  # NOQA
+
+
+def category_totals(records):
+    return totals_by(records, 'category')
+
+
+def merchant_totals(records):
+    return totals_by(records, 'merchant_id')
@@ -0,0 +1,218 @@
+""" Publishing feed items in bulk for MonzoClient.create_feed_items
+
+FeedPublisher reads feed item specs from any iterable, including a
+generator, and posts them from a fixed set of worker threads. At most
+max_pending specs are read ahead of the workers so memory stays flat
+however long the input is. Throttled or failed posts go to a retry queue
+and are sent again after a backoff while new items keep flowing.
+
+A feed item POST is not idempotent, so by default only posts the API
+cannot have acted on are retried: 429 and 503 responses and connections
+which failed before the request was sent. Retrying a 500 or a dropped
+connection could show the user the same item twice.
+"""
+
+import time
+import heapq
+import queue
+import threading
+
+import requests
+
+from monzo_ratelimit import RetryPolicy
+from monzo_resilience import CircuitOpenError
+
+# Spec keys sent as params[...], the rest of the form is fixed
+PARAMS = (
+    'title', 'image_url', 'body', 'background_color', 'title_color',
+    'body_color',
+)
+
+# Statuses which mean the item was not created
+FEED_RETRY_STATUSES = (429, 503)
+
+
+def feed_item_data(spec, account_id=None):
+    """ The form for POST /feed from a spec dict
+
+    A spec has the create_feed_item arguments as keys plus an optional
+    account_id, which defaults to the account_id passed in.
+    """
+    data = {
+        'account_id': spec.get('account_id') or account_id,
+        'type': 'basic',
+    }
+    for key in PARAMS:
+        value = spec.get(key)
+        if value:
+            data['params[' + key + ']'] = value
+    if spec.get('url'):
+        data['url'] = spec['url']
+    return data
+
+
+def not_sent(error):
+    """ Whether a failed request cannot have reached the API """
+    if isinstance(error, (requests.ConnectTimeout, CircuitOpenError)):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    from urllib3.exceptions import NewConnectionError
+
+    reason = error.args[0]
+    # Connection errors usually wrap urllib3's MaxRetryError
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+class FeedPublisher(object):
+    """ Bounded concurrent pipeline of feed item POSTs
+
+    A spec with an access_token is posted with that token (and its
+    account_id) through a client sharing this client's session, rate
+    limiter and hooks. progress(stats) is called at most every
+    progress_interval seconds and once at the end. retry_policy decides
+    which statuses are retried; connection errors are only retried when
+    the request was never sent.
+    """
+
+    def __init__(
+        self, client, max_workers=8, max_pending=None, retry_policy=None,
+        progress=None, progress_interval=1.0
+    ):
+        self.client = client
+        self.max_workers = max_workers
+        self.max_pending = max_pending if max_pending else max_workers * 4
+        if retry_policy is None:
+            retry_policy = RetryPolicy(
+                statuses=FEED_RETRY_STATUSES, methods=('POST',)
+            )
+        self.retry_policy = retry_policy
+        self.progress = progress
+        self.progress_interval = progress_interval
+
+    def publish(self, items):
+        """ Post every spec in items, returns the final stats
+
+        Stats count items 'sent' and 'failed', 'retries' made, 'elapsed'
+        seconds and 'per_second'. 'failures' lists a dict with the 'item',
+        the last 'error' and the number of 'attempts' for each failed spec.
+        """
+        self.work = queue.Queue(self.max_pending)
+        self.retries = []  # Heap of (ready_at, sequence, spec, attempt)
+        self.condition = threading.Condition()
+        self.outstanding = 0
+        self.sequence = 0
+        self.stats = {'sent': 0, 'failed': 0, 'retries': 0, 'failures': []}
+        self.started = self.reported = time.time()
+
+        workers = [
+            threading.Thread(target=self._run) for __ in range(self.max_workers)  # NOQA
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            for spec in items:
+                with self.condition:
+                    self.outstanding += 1
+                self._put((spec, 0))
+            # Input is done, wait for the retry queue to drain
+            while True:
+                with self.condition:
+                    if not self.outstanding:
+                        break
+                    wait = self.retries[0][0] - time.time() if self.retries else self.progress_interval  # NOQA
+                    if wait > 0:
+                        self.condition.wait(min(wait, self.progress_interval))
+                self._put_due_retries()
+                self._report()
+        finally:
+            for __ in workers:
+                self.work.put(None)
+            for worker in workers:
+                worker.join()
+        return self._report(final=True)
+
+    def _put(self, item):
+        """ Queue item, blocking while max_pending items are waiting """
+        while True:
+            self._put_due_retries()
+            try:
+                self.work.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+            finally:
+                self._report()
+
+    def _put_due_retries(self):
+        now = time.time()
+        while True:
+            with self.condition:
+                if not self.retries or self.retries[0][0] > now:
+                    return
+                __, __, spec, attempt = heapq.heappop(self.retries)
+            try:
+                self.work.put_nowait((spec, attempt))
+            except queue.Full:
+                with self.condition:
+                    self.sequence += 1
+                    heapq.heappush(self.retries, (now, self.sequence, spec, attempt))  # NOQA
+                return
+
+    def _report(self, final=False):
+        now = time.time()
+        if not final and now - self.reported < self.progress_interval:
+            return None
+        self.reported = now
+        with self.condition:
+            stats = dict(self.stats)
+        stats['elapsed'] = now - self.started
+        stats['per_second'] = stats['sent'] / stats['elapsed'] if stats['elapsed'] else 0.0  # NOQA
+        if self.progress is not None:
+            self.progress(stats)
+        return stats
+
+    def _run(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            spec, attempt = item
+            try:
+                self._post(spec)
+            except Exception as error:
+                self._failed(spec, attempt, error)
+            else:
+                with self.condition:
+                    self.stats['sent'] += 1
+                    self.outstanding -= 1
+                    self.condition.notify()
+
+    def _failed(self, spec, attempt, error):
+        policy = self.retry_policy
+        response = getattr(error, 'response', None)
+        transient = not_sent(error) or (
+            isinstance(error, requests.HTTPError) and
+            response is not None and response.status_code in policy.statuses
+        )
+        with self.condition:
+            if transient and policy.can_retry('POST', attempt):
+                self.stats['retries'] += 1
+                self.sequence += 1
+                ready_at = time.time() + policy.delay(attempt, response)
+                heapq.heappush(self.retries, (ready_at, self.sequence, spec, attempt + 1))  # NOQA
+            else:
+                self.stats['failed'] += 1
+                self.stats['failures'].append({
+                    'item': spec, 'error': error, 'attempts': attempt + 1,
+                })
+                self.outstanding -= 1
+            self.condition.notify()
+
+    def _post(self, spec):
+        client = self.client
+        if spec.get('access_token'):
+            client = client.with_token(spec['access_token'])
+        data = feed_item_data(spec, client.account_id)
+        return client.post(client.urls['feed'], data=data)
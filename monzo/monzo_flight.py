@@ -0,0 +1,109 @@
+""" Single-flight coalescing of identical concurrent GETs
+
+During a burst, for example webhook handlers all fetching the transaction
+they were told about, many callers can ask for the same resource at once.
+With a SingleFlight passed to MonzoClient only the first caller for a key
+(access token and URL) makes the request; the others wait for it and get
+the same decoded result, or the same exception. Nothing is kept once the
+request finishes, so this is not a cache; use monzo_cache for that.
+
+The result is shared, not copied, so callers must not mutate it.
+"""
+
+import threading
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ Coalesces calls with the same key made from several threads
+
+    calls counts the functions actually run and coalesced the callers which
+    shared one instead. One SingleFlight can be shared between clients.
+    """
+
+    def __init__(self):
+        self.in_flight = {}  # key: _Call
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    def do(self, key, fn):
+        """ fn() unless a call for key is already running
+
+        Returns (result, shared) where shared is True if the result came
+        from another caller's call.
+        """
+        with self.lock:
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight(object):
+    """ SingleFlight for coroutines running on one event loop
+
+    The first caller's coroutine runs as a task so cancelling one waiter
+    does not cancel the request for the others.
+    """
+
+    def __init__(self):
+        self.in_flight = {}  # key: asyncio.Task
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    async def do(self, key, factory):
+        """ await factory() unless a call for key is already running
+
+        Returns (result, shared) like SingleFlight.do.
+        """
+        import asyncio  # Only async users pay for importing it
+
+        task = self.in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self.in_flight[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
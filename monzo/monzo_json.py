@@ -0,0 +1,66 @@
+""" JSON decoding for API responses
+
+loads() is the fastest decoder installed: orjson, then ujson, then
+simdjson (pysimdjson), falling back to the standard library. Pass
+json_decoder to MonzoClient to use something else.
+"""
+
+import json
+from collections import OrderedDict
+
+
+def _orjson():
+    import orjson
+    return orjson.loads
+
+
+def _ujson():
+    import ujson
+    return ujson.loads
+
+
+def _simdjson():
+    import simdjson
+    return simdjson.loads
+
+
+def _stdlib():
+    return json.loads
+
+
+# Name: function returning that decoder's loads, fastest first
+DECODERS = OrderedDict([
+    ('orjson', _orjson),
+    ('ujson', _ujson),
+    ('simdjson', _simdjson),
+    ('json', _stdlib),
+])
+
+
+def get_decoder(name=None):
+    """ (name, loads) for the named decoder or the best one installed
+
+    Raises ImportError if the named decoder is not installed.
+    """
+    if name is not None:
+        return name, DECODERS[name]()
+    for name, decoder in DECODERS.items():
+        try:
+            return name, decoder()
+        except ImportError:
+            pass
+
+
+def available_decoders():
+    """ Names of the decoders which are installed """
+    names = []
+    for name, decoder in DECODERS.items():
+        try:
+            decoder()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+DECODER, loads = get_decoder()
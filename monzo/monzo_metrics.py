@@ -0,0 +1,388 @@
+""" Request hooks and a metrics collector for MonzoClient
+
+Pass hooks=[...] to MonzoClient and each call made through
+MonzoClient.request is reported to every hook. Hooks see an `event` dict
+with the method, url, endpoint template (see monzo_endpoints), form data,
+number of attempts and elapsed seconds. A client without hooks skips all of
+this.
+"""
+
+import time
+import bisect
+import threading
+
+# The same as monzo_resilience.STATES, which imports requests
+CIRCUIT_STATES = ('closed', 'open', 'half_open')
+
+# Latency buckets in seconds, the same as the Prometheus client defaults
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+    7.5, 10.0,
+)
+
+
+class Hook(object):
+    """ Subclass and override the callbacks you need
+
+    before_request(event) runs before the first attempt, after_response
+    once a response arrives (whatever its status) and on_error when the
+    call raises, including for 4xx and 5xx after raise_for_status.
+    cache_hit(endpoint) runs when a ResponseCache answered a GET instead,
+    and coalesced(endpoint) when a GET shared a call already in flight
+    (see monzo_flight). circuit_changed(key, state) runs when a circuit
+    breaker opens, half-opens or closes and hedged(endpoint, won) when a
+    second copy of a slow GET was sent (see monzo_resilience).
+    """
+
+    def before_request(self, event):
+        pass
+
+    def after_response(self, event, response):
+        pass
+
+    def on_error(self, event, error):
+        pass
+
+    def cache_hit(self, endpoint):
+        pass
+
+    def coalesced(self, endpoint):
+        pass
+
+    def circuit_changed(self, key, state):
+        pass
+
+    def hedged(self, endpoint, won):
+        pass
+
+
+class Histogram(object):
+    """ Counts of observations per bucket plus their sum """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        counts = []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class MetricsCollector(Hook):
+    """ Latency, status, byte, retry, refresh, cache and resilience counts
+
+    Latency histograms and status counts are kept per (method, endpoint
+    template) so transactions/{id} is one series rather than one per
+    transaction. Circuit breaker states and hedged GETs, sent and won, are
+    kept too. Read them with prometheus() or otlp().
+    """
+
+    def __init__(self, buckets=BUCKETS, prefix='monzo'):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.started = time.time()
+        self.latency = {}  # (method, endpoint): Histogram
+        self.statuses = {}  # (method, endpoint, status): count
+        self.errors = {}  # (method, endpoint, error class name): count
+        self.cache_hits = {}  # endpoint: count
+        self.coalesced_calls = {}  # endpoint: count
+        self.circuits = {}  # circuit key: current state
+        self.circuit_changes = {}  # (circuit key, state): count
+        self.hedges = {}  # endpoint: [sent, won]
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.refreshes = 0
+        self.lock = threading.Lock()
+
+    def after_response(self, event, response):
+        key = (event['method'], event['endpoint'])
+        body = getattr(response.request, 'body', None)
+        with self.lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(self.buckets)
+            histogram.observe(event['elapsed'])
+            status = key + (response.status_code,)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes_sent += len(body) if body else 0
+            self.bytes_received += len(response.content or b'')
+            self.retries += event['attempts'] - 1
+            grant_type = (event['data'] or {}).get('grant_type')
+            if event['endpoint'] == 'oauth2/token' and response.ok and \
+                    grant_type == 'refresh_token':
+                self.refreshes += 1
+
+    def on_error(self, event, error):
+        key = (event['method'], event['endpoint'], type(error).__name__)
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def cache_hit(self, endpoint):
+        with self.lock:
+            self.cache_hits[endpoint] = self.cache_hits.get(endpoint, 0) + 1
+
+    def coalesced(self, endpoint):
+        with self.lock:
+            count = self.coalesced_calls.get(endpoint, 0)
+            self.coalesced_calls[endpoint] = count + 1
+
+    def circuit_changed(self, key, state):
+        with self.lock:
+            self.circuits[key] = state
+            change = (key, state)
+            count = self.circuit_changes.get(change, 0)
+            self.circuit_changes[change] = count + 1
+
+    def hedged(self, endpoint, won):
+        with self.lock:
+            counts = self.hedges.setdefault(endpoint, [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if won else 0
+
+    def hedge_win_rate(self, endpoint=None):
+        """ Share of hedged GETs answered by the second request first """
+        with self.lock:
+            if endpoint:
+                counts = [self.hedges.get(endpoint, [0, 0])]
+            else:
+                counts = list(self.hedges.values())
+            sent = sum(count[0] for count in counts)
+            won = sum(count[1] for count in counts)
+        return won / float(sent) if sent else 0.0
+
+    def prometheus(self):
+        """ Everything collected in the Prometheus text exposition format """
+        name = self.prefix + '_request_duration_seconds'
+        lines = [
+            '# HELP {0} Time taken by Monzo API calls'.format(name),
+            '# TYPE {0} histogram'.format(name),
+        ]
+        with self.lock:
+            for key, histogram in sorted(self.latency.items()):
+                labels = 'method="{0}",endpoint="{1}"'.format(*key)
+                bounds = [repr(float(b)) for b in histogram.buckets]
+                counts = histogram.cumulative()
+                for bound, count in zip(bounds + ['+Inf'], counts):
+                    lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(
+                        name, labels, bound, count
+                    ))
+                lines.append('{0}_sum{{{1}}} {2!r}'.format(
+                    name, labels, histogram.sum
+                ))
+                lines.append('{0}_count{{{1}}} {2}'.format(
+                    name, labels, histogram.count
+                ))
+
+            by_status = 'method="{0}",endpoint="{1}",status="{2}"'
+            by_error = 'method="{0}",endpoint="{1}",error="{2}"'
+            by_endpoint = 'endpoint="{0}"'
+            by_circuit = 'circuit="{0}",state="{1}"'
+            hedges = sorted(self.hedges.items())
+            counters = [
+                ('responses_total', 'API responses by status code', [
+                    (by_status.format(*key), count)
+                    for key, count in sorted(self.statuses.items())
+                ]),
+                ('request_errors_total', 'API calls which raised', [
+                    (by_error.format(*key), count)
+                    for key, count in sorted(self.errors.items())
+                ]),
+                (
+                    'cache_hits_total',
+                    'GETs answered from the response cache', [
+                        (by_endpoint.format(endpoint), count)
+                        for endpoint, count in sorted(self.cache_hits.items())
+                    ],
+                ),
+                ('coalesced_total', 'GETs which shared a call in flight', [
+                    (by_endpoint.format(endpoint), count)
+                    for endpoint, count in sorted(self.coalesced_calls.items())
+                ]),
+                ('circuit_changes_total', 'Circuit breaker state changes', [
+                    (by_circuit.format(*key), count)
+                    for key, count in sorted(self.circuit_changes.items())
+                ]),
+                ('hedged_requests_total', 'Second copies of slow GETs sent', [
+                    (by_endpoint.format(endpoint), counts[0])
+                    for endpoint, counts in hedges
+                ]),
+                (
+                    'hedge_wins_total',
+                    'Hedged GETs answered by the second copy', [
+                        (by_endpoint.format(endpoint), counts[1])
+                        for endpoint, counts in hedges
+                    ],
+                ),
+                ('bytes_total', 'Request and response body bytes', [
+                    ('direction="out"', self.bytes_sent),
+                    ('direction="in"', self.bytes_received),
+                ]),
+                ('retries_total', 'Attempts retried', [('', self.retries)]),
+                ('token_refreshes_total', 'Access tokens refreshed', [
+                    ('', self.refreshes),
+                ]),
+            ]
+            gauges = [
+                (
+                    'circuit_state',
+                    'Circuit breaker state, 1 for the current one', [
+                        (by_circuit.format(key, state), int(state == current))
+                        for key, current in sorted(self.circuits.items())
+                        for state in CIRCUIT_STATES
+                    ],
+                ),
+                (
+                    'hedge_win_ratio',
+                    'Share of hedged GETs won by the second copy', [
+                        (
+                            by_endpoint.format(endpoint),
+                            repr(counts[1] / float(counts[0])),
+                        )
+                        for endpoint, counts in hedges
+                    ],
+                ),
+            ]
+        for kind, metrics in (('counter', counters), ('gauge', gauges)):
+            for suffix, help_text, samples in metrics:
+                metric = '{0}_{1}'.format(self.prefix, suffix)
+                lines.append('# HELP {0} {1}'.format(metric, help_text))
+                lines.append('# TYPE {0} {1}'.format(metric, kind))
+                for labels, value in samples:
+                    if labels:
+                        lines.append('{0}{{{1}}} {2}'.format(
+                            metric, labels, value
+                        ))
+                    else:
+                        lines.append('{0} {1}'.format(metric, value))
+        return '\n'.join(lines) + '\n'
+
+    def otlp(self, service_name='monzo-client'):
+        """ Everything collected as an OTLP/JSON metrics export request
+
+        POST json.dumps(collector.otlp()) to an OpenTelemetry collector's
+        /v1/metrics endpoint. Counters and histograms are cumulative since
+        the collector was created.
+        """
+        start = str(int(self.started * 1e9))
+        now = str(int(time.time() * 1e9))
+
+        def attributes(**values):
+            return [
+                {'key': key, 'value': {'stringValue': str(value)}}
+                for key, value in sorted(values.items())
+            ]
+
+        def named(metric, unit, kind, data):
+            return {
+                'name': '{0}.client.{1}'.format(self.prefix, metric),
+                'unit': unit,
+                kind: data,
+            }
+
+        def counter(metric, unit, points):
+            return named(metric, unit, 'sum', {
+                'aggregationTemporality': 2,  # Cumulative
+                'isMonotonic': True,
+                'dataPoints': [{
+                    'attributes': labels,
+                    'startTimeUnixNano': start,
+                    'timeUnixNano': now,
+                    'asInt': str(value),
+                } for labels, value in points],
+            })
+
+        def gauge(metric, unit, points):
+            return named(metric, unit, 'gauge', {
+                'dataPoints': [{
+                    'attributes': labels,
+                    'timeUnixNano': now,
+                    'asDouble': value,
+                } for labels, value in points],
+            })
+
+        with self.lock:
+            latency = sorted(self.latency.items())
+            durations = [{
+                'attributes': attributes(method=method, endpoint=endpoint),
+                'startTimeUnixNano': start,
+                'timeUnixNano': now,
+                'count': str(histogram.count),
+                'sum': histogram.sum,
+                'bucketCounts': [str(count) for count in histogram.counts],
+                'explicitBounds': list(histogram.buckets),
+            } for (method, endpoint), histogram in latency]
+            hedges = sorted(self.hedges.items())
+            metrics = [
+                named('duration', 's', 'histogram', {
+                    'aggregationTemporality': 2,
+                    'dataPoints': durations,
+                }),
+                counter('responses', '1', [
+                    (attributes(method=m, endpoint=e, status=s), count)
+                    for (m, e, s), count in sorted(self.statuses.items())
+                ]),
+                counter('errors', '1', [
+                    (attributes(method=m, endpoint=e, error=name), count)
+                    for (m, e, name), count in sorted(self.errors.items())
+                ]),
+                counter('cache_hits', '1', [
+                    (attributes(endpoint=endpoint), count)
+                    for endpoint, count in sorted(self.cache_hits.items())
+                ]),
+                counter('coalesced', '1', [
+                    (attributes(endpoint=endpoint), count)
+                    for endpoint, count in sorted(self.coalesced_calls.items())
+                ]),
+                counter('circuit.changes', '1', [
+                    (attributes(circuit=key, state=state), count)
+                    for (key, state), count in
+                    sorted(self.circuit_changes.items())
+                ]),
+                gauge('circuit.state', '1', [
+                    (
+                        attributes(circuit=key, state=state),
+                        float(state == current),
+                    )
+                    for key, current in sorted(self.circuits.items())
+                    for state in CIRCUIT_STATES
+                ]),
+                counter('hedged', '1', [
+                    (attributes(endpoint=endpoint), counts[0])
+                    for endpoint, counts in hedges
+                ]),
+                counter('hedge_wins', '1', [
+                    (attributes(endpoint=endpoint), counts[1])
+                    for endpoint, counts in hedges
+                ]),
+                gauge('hedge_win_ratio', '1', [
+                    (
+                        attributes(endpoint=endpoint),
+                        counts[1] / float(counts[0]),
+                    )
+                    for endpoint, counts in hedges
+                ]),
+                counter('bytes', 'By', [
+                    (attributes(direction='out'), self.bytes_sent),
+                    (attributes(direction='in'), self.bytes_received),
+                ]),
+                counter('retries', '1', [([], self.retries)]),
+                counter('token_refreshes', '1', [([], self.refreshes)]),
+            ]
+        return {'resourceMetrics': [{
+            'resource': {
+                'attributes': attributes(**{'service.name': service_name}),
+            },
+            'scopeMetrics': [{'scope': {'name': 'monzo'}, 'metrics': metrics}],
+        }]}
@@ -0,0 +1,483 @@
+""" A small local stand-in for the Monzo API, used by tests and benchmarks
+
+MockMonzoServer implements the endpoints MonzoClient uses against synthetic
+accounts of any size, with optional latency, random or injected errors and a
+request rate above which it answers 429. Responses recorded from the real
+API with FixtureRecorder can be replayed in place of the synthetic ones.
+"""
+
+import json
+import time
+import bisect
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, urlencode
+
+from monzo_metrics import Hook
+
+START = datetime(2016, 1, 1)
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def make_transactions(account_id, count, id_prefix='tx_'):
+    transactions = []
+    for i in range(count):
+        transactions.append({
+            'id': '{0}{1:08d}'.format(id_prefix, i),
+            'account_id': account_id,
+            'amount': -(100 + i % 5000),
+            'currency': 'GBP',
+            'created': (START + timedelta(minutes=i)).strftime(TIME_FORMAT),
+            'description': 'MERCHANT {0}'.format(i % 50),
+            'category': 'eating_out',
+            'settled': True,
+            'metadata': {},
+            'attachments': [],
+            'merchant': {
+                'id': 'merch_{0:04d}'.format(i % 50),
+                'name': 'Merchant {0}'.format(i % 50),
+            },
+        })
+    return transactions
+
+
+def fixture_key(method, path, query):
+    """ (METHOD, path, query) with the query in a canonical order """
+    if not isinstance(query, dict):
+        query = dict((k, v[0]) for k, v in parse_qs(query).items())
+    return method.upper(), path.strip('/'), urlencode(sorted(query.items()))
+
+
+class FixtureRecorder(Hook):
+    """ Records responses from a MonzoClient for MockMonzoServer to replay
+
+    monzo = MonzoClient(..., hooks=[FixtureRecorder()]), use the client
+    against the real API and then recorder.save('fixtures.json'). Tokens in
+    oauth2/token responses are replaced so the file is safe to share.
+    """
+
+    def __init__(self):
+        self.fixtures = []
+        self.lock = threading.Lock()
+
+    def after_response(self, event, response):
+        url = urlparse(event['url'])
+        try:
+            body = response.json()
+        except ValueError:
+            return
+        if event['endpoint'] == 'oauth2/token' and isinstance(body, dict):
+            for field in ('access_token', 'refresh_token'):
+                if field in body:
+                    body[field] = 'recorded_' + field
+        method, path, query = fixture_key(event['method'], url.path, url.query)  # NOQA
+        with self.lock:
+            self.fixtures.append({
+                'method': method, 'path': path, 'query': query,
+                'status': response.status_code, 'body': body,
+            })
+
+    def save(self, path):
+        with open(path, 'w') as fixture_file:
+            json.dump(self.fixtures, fixture_file, indent=1, sort_keys=True)
+
+
+def load_fixtures(fixtures):
+    """ {fixture key: [(status, body), ...]} from a path or a list """
+    if not isinstance(fixtures, list):
+        with open(fixtures) as fixture_file:
+            fixtures = json.load(fixture_file)
+    replay = {}
+    for fixture in fixtures:
+        key = fixture_key(fixture['method'], fixture['path'], fixture['query'])  # NOQA
+        replay.setdefault(key, []).append((fixture['status'], fixture['body']))  # NOQA
+    return replay
+
+
+class MockMonzoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pragma: no cover
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = self.rfile.read(length).decode('utf-8')
+        form = parse_qs(body, keep_blank_values=True)
+        return dict((k, v[0]) for k, v in form.items())
+
+    def do_GET(self):  # NOQA
+        self.dispatch('get')
+
+    def do_POST(self):  # NOQA
+        self.dispatch('post')
+
+    def do_PATCH(self):  # NOQA
+        self.dispatch('patch')
+
+    def do_DELETE(self):  # NOQA
+        self.dispatch('delete')
+
+    def do_PUT(self):  # NOQA
+        self.dispatch('put')
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        self.query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        self.form = self.read_form() if method != 'put' else {}
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            error = server.errors.pop(0) if server.errors else None
+            if error is None:
+                error = self.random_error()
+            if error is None:
+                error = self.rate_limited()
+        if server.latency or server.jitter:
+            time.sleep(server.latency + server.random.uniform(0, server.jitter))  # NOQA
+
+        if error is not None:
+            status, headers = error
+            if status is None:  # Drop the connection without a response
+                self.close_connection = True
+                return
+            return self.send_json(status, {'code': 'injected'}, headers)
+
+        path = url.path.strip('/')
+        replay = server.fixtures.get(fixture_key(method, path, self.query))
+        if replay:
+            with server.lock:
+                # Recorded responses are served in order, the last one repeats
+                status, body = replay.pop(0) if len(replay) > 1 else replay[0]  # NOQA
+            return self.send_json(status, body)
+
+        if path == 'ping/whoami':
+            path = 'whoami'
+        parts = path.split('/', 1)
+        handler = getattr(self, '{0}_{1}'.format(method, parts[0]), None)
+        if handler is None:
+            status, body = 404, {'code': 'not_found', 'message': 'Unknown path'}  # NOQA
+        else:
+            status, body = handler(*parts[1:])
+        self.send_json(status, body)
+
+    def random_error(self):
+        server = self.server
+        if server.error_rate and server.random.random() < server.error_rate:
+            return server.error_status, {}
+        return None
+
+    def rate_limited(self):
+        """ 429 once more than rate_limit requests arrive in one second """
+        server = self.server
+        if not server.rate_limit:
+            return None
+        second = int(time.time())
+        if second != server.window[0]:
+            server.window = [second, 0]
+        server.window[1] += 1
+        if server.window[1] > server.rate_limit:
+            server.throttled += 1
+            return 429, {'Retry-After': '1'}
+        return None
+
+    def not_found(self, message):
+        return 404, {'code': 'not_found', 'message': message}
+
+    def find_transaction(self, transaction_id):
+        return self.server.transactions.get(transaction_id)
+
+    def post_oauth2(self, __):
+        server = self.server
+        with server.lock:
+            if self.form.get('grant_type') == 'refresh_token':
+                if self.form.get('refresh_token') not in server.refresh_tokens:
+                    return 401, {'code': 'unauthorized.bad_refresh_token'}
+                # Refresh tokens can only be used once
+                server.refresh_tokens.discard(self.form['refresh_token'])
+            server.token_count += 1
+            refresh_token = 'refresh_{0}'.format(server.token_count)
+            server.refresh_tokens.add(refresh_token)
+        return 200, {
+            'access_token': 'access_{0}'.format(server.token_count),
+            'refresh_token': refresh_token,
+            'expires_in': 21600,
+            'token_type': 'Bearer',
+        }
+
+    def get_whoami(self):
+        return 200, {
+            'authenticated': True,
+            'client_id': 'oauthclient_mock',
+            'user_id': 'user_mock',
+        }
+
+    def get_accounts(self):
+        return 200, {'accounts': [
+            {'id': account_id, 'description': 'Mock account'}
+            for account_id in self.server.accounts
+        ]}
+
+    def get_balance(self):
+        if self.query.get('account_id') not in self.server.accounts:
+            return self.not_found('Unknown account')
+        return 200, {'balance': 5000, 'currency': 'GBP', 'spend_today': 0}
+
+    def get_transactions(self, transaction_id=None):
+        if transaction_id:
+            transaction = self.find_transaction(transaction_id)
+            if transaction is None:
+                return self.not_found('Unknown transaction')
+            return 200, {'transaction': transaction}
+
+        limit = int(self.query.get('limit') or 100)
+        since = self.query.get('since', '')
+        before = self.query.get('before', '')
+        account_id = self.query.get('account_id')
+        transactions = self.server.accounts.get(account_id, [])
+        ids, created = self.server.index.get(account_id, ([], []))
+        # Transactions are in id and created order so bisect the range
+        start, end = 0, len(transactions)
+        if since.startswith('tx_'):
+            start = bisect.bisect_right(ids, since)
+        elif since:
+            start = bisect.bisect_left(created, since[:19])
+        if before:
+            end = bisect.bisect_left(created, before[:19])
+        return 200, {'transactions': transactions[start:min(end, start + limit)]}  # NOQA
+
+    def patch_transactions(self, transaction_id):
+        transaction = self.find_transaction(transaction_id)
+        if transaction is None:
+            return self.not_found('Unknown transaction')
+        for key, value in self.form.items():
+            if key.startswith('metadata[') and key.endswith(']'):
+                key = key[len('metadata['):-1]
+                if value:
+                    transaction['metadata'][key] = value
+                else:
+                    transaction['metadata'].pop(key, None)
+        return 200, {'transaction': transaction}
+
+    def get_feed(self):
+        account_id = self.query.get('account_id')
+        return 200, {'items': self.server.feed.get(account_id, [])}
+
+    def post_feed(self):
+        params = dict(
+            (key[len('params['):-1], value)
+            for key, value in self.form.items() if key.startswith('params[')
+        )
+        item = {'type': self.form.get('type'), 'params': params}
+        if 'url' in self.form:
+            item['url'] = self.form['url']
+        with self.server.lock:
+            self.server.feed.setdefault(self.form.get('account_id'), []).append(item)  # NOQA
+        return 200, {}
+
+    def post_attachment(self, action):
+        server = self.server
+        if action == 'upload':
+            with server.lock:
+                upload_id = 'upload_{0:06d}'.format(len(server.uploads))
+                server.uploads[upload_id] = None
+            return 200, {
+                'file_url': 'https://mock.monzo/{0}/{1}'.format(upload_id, self.form.get('file_name')),  # NOQA
+                'upload_url': '{0}://{1}:{2}/upload/{3}'.format(
+                    'http', server.server_address[0], server.server_address[1], upload_id  # NOQA
+                ),
+            }
+        if action == 'register':
+            with server.lock:
+                attachment = {
+                    'id': 'attach_{0:06d}'.format(len(server.attachments)),
+                    'external_id': self.form.get('external_id'),
+                    'file_url': self.form.get('file_url'),
+                    'file_type': self.form.get('file_type'),
+                }
+                server.attachments[attachment['id']] = attachment
+                transaction = self.find_transaction(attachment['external_id'])
+                if transaction is not None:
+                    transaction['attachments'].append(attachment)
+            return 200, {'attachment': attachment}
+        if action == 'deregister':
+            with server.lock:
+                attachment = server.attachments.pop(self.form.get('id'), None)
+                # Deregistering twice is not an error
+                if attachment is not None:
+                    transaction = self.find_transaction(attachment['external_id'])  # NOQA
+                    if transaction is not None:
+                        transaction['attachments'].remove(attachment)
+            return 200, {}
+        return self.not_found('Unknown path')
+
+    def put_upload(self, upload_id):
+        if upload_id not in self.server.uploads:
+            return self.not_found('Unknown upload')
+        remaining = int(self.headers.get('Content-Length') or 0)
+        size = 0
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            size += len(chunk)
+            remaining -= len(chunk)
+        self.server.uploads[upload_id] = {
+            'size': size,
+            'content_type': self.headers.get('Content-Type'),
+        }
+        return 200, {}
+
+    def get_webhooks(self):
+        account_id = self.query.get('account_id')
+        return 200, {'webhooks': [
+            webhook for webhook in self.server.webhooks.values()
+            if webhook['account_id'] == account_id
+        ]}
+
+    def post_webhooks(self):
+        with self.server.lock:
+            # Counted separately so ids are not reused after a delete
+            self.server.webhook_count += 1
+            webhook = {
+                'id': 'webhook_{0:06d}'.format(self.server.webhook_count),
+                'account_id': self.form.get('account_id'),
+                'url': self.form.get('url'),
+            }
+            self.server.webhooks[webhook['id']] = webhook
+        return 200, {'webhook': webhook}
+
+    def delete_webhooks(self, webhook_id):
+        if self.server.webhooks.pop(webhook_id, None) is None:
+            return self.not_found('Unknown webhook')
+        return 200, {}
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockMonzoServer(object):
+    """ Serves fake Monzo responses on localhost from a background thread
+
+    Each request waits latency seconds plus up to jitter more. A share of
+    error_rate requests fail with error_status and, with rate_limit set,
+    requests beyond that many per second get a 429 with Retry-After.
+    fixtures is a FixtureRecorder file (or its list) whose responses are
+    served instead of the synthetic ones for the requests they match.
+    """
+
+    def __init__(
+        self, host='127.0.0.1', port=0, transactions=100, latency=0,
+        account_ids=('acc_mock',), jitter=0, error_rate=0, error_status=503,
+        rate_limit=None, fixtures=None, seed=None
+    ):
+        self.httpd = ThreadedHTTPServer((host, port), MockMonzoHandler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.httpd.webhooks = OrderedDict()
+        self.httpd.webhook_count = 0
+        self.httpd.feed = {}
+        self.httpd.errors = []
+        self.httpd.uploads = OrderedDict()
+        self.httpd.attachments = OrderedDict()
+        self.httpd.token_count = 0
+        self.httpd.refresh_tokens = set(['refresh_0'])
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.rate_limit = rate_limit
+        self.httpd.window = [0, 0]  # Second, requests in it
+        self.httpd.throttled = 0
+        self.httpd.random = random.Random(seed)
+        self.httpd.fixtures = load_fixtures(fixtures) if fixtures else {}
+        # Ids are unique across accounts, as they are in the real API
+        self.httpd.accounts = OrderedDict(
+            (account_id, make_transactions(
+                account_id, transactions,
+                'tx_{0}_'.format(index) if index else 'tx_',
+            ))
+            for index, account_id in enumerate(account_ids)
+        )
+        self.httpd.transactions = {}
+        for account in self.httpd.accounts.values():
+            for transaction in account:
+                self.httpd.transactions[transaction['id']] = transaction
+        self.httpd.index = dict(
+            (account_id, (
+                [transaction['id'] for transaction in account],
+                [transaction['created'][:19] for transaction in account],
+            ))
+            for account_id, account in self.httpd.accounts.items()
+        )
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{0}:{1}/'.format(host, port)
+
+    def inject_errors(self, status, count=1, retry_after=None):
+        """ Answer the next count requests with status
+
+        A status of None closes the connection without any response.
+        """
+        headers = {}
+        if retry_after is not None:
+            headers['Retry-After'] = str(retry_after)
+        with self.httpd.lock:
+            self.httpd.errors.extend([(status, headers)] * count)
+
+    @property
+    def accounts(self):
+        """ {account_id: [transaction, ...]} served by the mock, in order """
+        return self.httpd.accounts
+
+    @property
+    def token_count(self):
+        """ Number of access tokens issued by oauth2/token """
+        return self.httpd.token_count
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    @property
+    def throttled(self):
+        """ Requests answered 429 because of rate_limit """
+        return self.httpd.throttled
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,140 @@
+""" Compact typed wrappers for API responses
+
+Opt in with list_transactions(models=True) and friends. Each model uses
+__slots__ instead of a per-instance dict, merchants are shared between every
+transaction that references them and timestamps are only parsed when read.
+Fields the model does not know about are kept in `extra` so `raw` gives
+back the original dict.
+"""
+
+import sys
+import weakref
+from datetime import datetime
+
+
+def parse_timestamp(value):
+    """ 2016-01-01T12:00:00.123Z or 2016-01-01T12:00:00Z to a datetime """
+    if not value:
+        return None
+    if '.' in value:
+        return datetime.strptime(value[:26].rstrip('Z'), '%Y-%m-%dT%H:%M:%S.%f')  # NOQA
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+class Model(object):
+    __slots__ = ('extra',)
+    fields = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls.__new__(cls)
+        for field in cls.fields:
+            setattr(model, field, data.get(field))
+        extra = dict(
+            (key, value) for key, value in data.items()
+            if key not in cls.fields
+        )
+        model.extra = extra if extra else None
+        return model
+
+    @property
+    def raw(self):
+        """ The response dict this model was built from
+
+        Known fields which were null in the response are left out.
+        """
+        data = dict(
+            (field, getattr(self, field)) for field in self.fields
+            if getattr(self, field) is not None
+        )
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.raw == other.raw
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(type(self).__name__, getattr(self, 'id', ''))  # NOQA
+
+
+class Merchant(Model):
+    fields = ('id', 'group_id', 'name', 'logo', 'category', 'address')
+    __slots__ = fields + ('__weakref__',)
+
+    _interned = weakref.WeakValueDictionary()
+
+    @classmethod
+    def intern(cls, data):
+        """ One shared Merchant per merchant id """
+        merchant = cls._interned.get(data.get('id'))
+        if merchant is None:
+            merchant = cls.from_dict(data)
+            if merchant.id:
+                cls._interned[merchant.id] = merchant
+        return merchant
+
+
+class Transaction(Model):
+    fields = (
+        'id', 'account_id', 'amount', 'currency', 'created', 'settled',
+        'category', 'description', 'merchant', 'metadata', 'notes',
+        'local_amount', 'local_currency', 'is_load', 'decline_reason',
+    )
+    __slots__ = fields + ('_created_at',)
+
+    @classmethod
+    def from_dict(cls, data):
+        transaction = super(Transaction, cls).from_dict(data)
+        transaction._created_at = None
+        if transaction.amount is not None:
+            transaction.amount = int(transaction.amount)  # Minor units (pence)
+        # Repeated on every transaction so share one copy of each
+        for field in ('account_id', 'currency', 'category'):
+            value = getattr(transaction, field)
+            if value:
+                setattr(transaction, field, sys.intern(str(value)))
+        if isinstance(transaction.merchant, dict):
+            transaction.merchant = Merchant.intern(transaction.merchant)
+        return transaction
+
+    @property
+    def raw(self):
+        data = super(Transaction, self).raw
+        if isinstance(self.merchant, Merchant):
+            data['merchant'] = self.merchant.raw
+        return data
+
+    @property
+    def created_at(self):
+        if self._created_at is None:
+            self._created_at = parse_timestamp(self.created)
+        return self._created_at
+
+    @property
+    def is_settled(self):
+        return bool(self.settled)
+
+    @property
+    def merchant_id(self):
+        if isinstance(self.merchant, Merchant):
+            return self.merchant.id
+        return self.merchant
+
+
+class Account(Model):
+    fields = ('id', 'description', 'created')
+    __slots__ = fields
+
+
+class Balance(Model):
+    fields = ('balance', 'currency', 'spend_today')
+    __slots__ = fields
+
+
+class Webhook(Model):
+    fields = ('id', 'account_id', 'url')
+    __slots__ = fields
@@ -0,0 +1,164 @@
+""" One MonzoClient per user for apps acting on behalf of many users
+
+MonzoClient holds one user's tokens and account_id, so sharing a single
+client between users of a web app mixes them up. MonzoClientPool keeps a
+client per tenant instead. The clients share a connection pool, rate
+limiter, retry policy and hooks but nothing else. Each tenant's primary
+account id is remembered so it is only looked up once, and the least
+recently used clients are dropped once there are more than max_clients.
+"""
+
+import threading
+from collections import OrderedDict
+
+from monzo import DEFAULT_TIMEOUT, MonzoClient, make_session
+from monzo_endpoints import token_scope
+from monzo_tokens import parse_expires_at
+
+
+class MonzoClientPool(object):
+    """ Registry of per-tenant MonzoClients sharing one session
+
+    token_store, if given, is called with the tenant key and returns the
+    monzo_tokens.TokenStore for that tenant, so refreshed tokens survive
+    the client being evicted. A single_flight, circuit_breaker and hedge
+    policy are shared the same way.
+    """
+
+    def __init__(
+        self, client_id=None, client_secret=None, login_url=None,
+        max_clients=1024, max_accounts=None, session=None, pool_maxsize=10,
+        timeout=DEFAULT_TIMEOUT, cache=None, rate_limiter=None,
+        retry_policy=None, hooks=None, token_store=None, api_url=None,
+        token_url=None, single_flight=None, timeouts=None,
+        circuit_breaker=None, hedge=None
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.login_url = login_url
+        self.max_clients = max_clients
+        self.max_accounts = max_accounts if max_accounts else max_clients * 10  # NOQA
+        if session is None:
+            session = make_session(pool_connections=1, pool_maxsize=pool_maxsize)  # NOQA
+        self.session = session
+        self.timeout = timeout
+        self.timeouts = timeouts
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.hooks = hooks
+        self.single_flight = single_flight
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+        self.token_store = token_store
+        self.api_url = api_url  # Overrides for a mock or sandbox API
+        self.token_url = token_url
+        self.clients = OrderedDict()  # tenant: (client, lock), oldest first
+        self.account_ids = OrderedDict()  # tenant: primary account id
+        self.lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+        self.account_lookups = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __contains__(self, tenant):
+        return tenant in self.clients
+
+    def make_client(self, tenant=None, **tokens):
+        """ A new MonzoClient with the pool's shared parts """
+        client = MonzoClient(
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            login_url=self.login_url,
+            session=self.session,
+            timeout=self.timeout,
+            timeouts=self.timeouts,
+            cache=self.cache,
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            hooks=self.hooks,
+            single_flight=self.single_flight,
+            circuit_breaker=self.circuit_breaker,
+            hedge=self.hedge,
+            token_store=self.token_store(tenant) if self.token_store and tenant else None,  # NOQA
+            **tokens
+        )
+        if self.api_url:
+            client.api_url = self.api_url
+        if self.token_url:
+            client.token_url = self.token_url
+        return client
+
+    def get(
+        self, tenant=None, access_token=None, refresh_token=None,
+        expires_at=None, account_id=None
+    ):
+        """ The client for tenant, made from the tokens given if it is new
+
+        tenant defaults to a hash of the refresh token (or access token).
+        An existing client keeps its own tokens, which may have been
+        refreshed since, unless the tokens given expire later. The client's
+        account_id is the one given or the tenant's first account.
+        """
+        if tenant is None:
+            tenant = token_scope(refresh_token or access_token)
+        with self.lock:
+            entry = self.clients.pop(tenant, None)
+            if entry is None:
+                client = self.make_client(
+                    tenant, access_token=access_token,
+                    refresh_token=refresh_token,
+                )
+                if access_token and expires_at:
+                    client.expires_at = expires_at
+                entry = (client, threading.Lock())
+                self.created += 1
+            self.clients[tenant] = entry  # Most recently used goes last
+            while len(self.clients) > self.max_clients:
+                self._forget(self.clients.popitem(last=False)[1][0])
+                self.evicted += 1
+            known_account_id = self.account_ids.get(tenant)
+
+        client, client_lock = entry
+        if access_token and access_token != client.access_token and \
+                parse_expires_at(expires_at) > client.tokens.expires_at_epoch:  # NOQA
+            # Newer than what the client holds, e.g. the user logged in again
+            client.tokens.update({
+                'access_token': access_token,
+                'refresh_token': refresh_token or client.refresh_token,
+                'expires_at': expires_at,
+            })
+        if account_id:
+            client.account_id = account_id
+        elif not client.account_id:
+            with client_lock:  # One lookup however many requests arrive
+                if not client.account_id:
+                    client.account_id = known_account_id or self._primary_account_id(client)  # NOQA
+        self._remember_account(tenant, client.account_id)
+        return client
+
+    def _primary_account_id(self, client):
+        self.account_lookups += 1
+        return client.list_accounts()['accounts'][0]['id']
+
+    def _remember_account(self, tenant, account_id):
+        with self.lock:
+            self.account_ids.pop(tenant, None)
+            self.account_ids[tenant] = account_id
+            while len(self.account_ids) > self.max_accounts:
+                self.account_ids.popitem(last=False)
+
+    def discard(self, tenant):
+        """ Forget a tenant, e.g. when the user logs out """
+        with self.lock:
+            entry = self.clients.pop(tenant, None)
+            self.account_ids.pop(tenant, None)
+        if entry is not None:
+            self._forget(entry[0])
+
+    def _forget(self, client):
+        """ Drop shared state kept for a client which has gone """
+        if self.rate_limiter is not None and client.access_token:
+            self.rate_limiter.discard(client.access_token)
@@ -0,0 +1,164 @@
+""" Client-side rate limiting and retry with backoff for MonzoClient """
+
+import time
+import random
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_tz, mktime_tz
+
+from monzo_endpoints import token_scope
+
+# Statuses worth another attempt for bulk writes, other 4xx will fail again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket(object):
+    """ Allows rate calls per second with bursts of up to capacity calls """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """ Take a token and return how long the caller must wait for it """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def block(self, seconds):
+        """ Hold every caller back, e.g. after the API asks us to slow down
+
+        Calls wait until seconds from now, or longer if already blocked.
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+
+class RateLimiter(object):
+    """ Token buckets per access token and per (access token, endpoint)
+
+    limits maps an endpoint template (see monzo_endpoints) to a
+    (rate, burst) pair; endpoints not listed only use the per token bucket.
+    A single RateLimiter can be shared between clients. Tokens change on
+    every refresh, so only the max_buckets most recently used buckets are
+    kept.
+    """
+
+    def __init__(self, rate=10, burst=20, limits=None, max_buckets=10000):
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits if limits else {}
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()  # (scope, endpoint): bucket, oldest first
+        self.lock = threading.Lock()
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    def _buckets(self, access_token, endpoint):
+        scope = token_scope(access_token)
+        keys = [(scope, None)]
+        if endpoint in self.limits:
+            keys.append((scope, endpoint))
+        buckets = []
+        with self.lock:
+            for key in keys:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    rate, burst = self.limits.get(
+                        key[1], (self.rate, self.burst)
+                    )
+                    bucket = self.buckets[key] = TokenBucket(rate, burst)
+                    while len(self.buckets) > self.max_buckets:
+                        self.buckets.popitem(last=False)
+                else:
+                    self.buckets.move_to_end(key)
+                buckets.append(bucket)
+        return buckets
+
+    def discard(self, access_token):
+        """ Drop the buckets of a token which will not be used again """
+        scope = token_scope(access_token)
+        with self.lock:
+            for key in [key for key in self.buckets if key[0] == scope]:
+                del self.buckets[key]
+
+    def acquire(self, access_token, endpoint):
+        """ Block until a call to endpoint is allowed
+
+        Returns the seconds waited.
+        """
+        buckets = self._buckets(access_token, endpoint)
+        wait = max(bucket.reserve() for bucket in buckets)
+        if wait > 0:
+            with self.lock:
+                self.throttled += 1
+                self.throttled_seconds += wait
+            time.sleep(wait)
+        return wait
+
+    def backoff(self, access_token, endpoint, seconds):
+        for bucket in self._buckets(access_token, endpoint):
+            bucket.block(seconds)
+
+
+class RetryPolicy(object):
+    """ Exponential backoff with full jitter for throttled or failed calls
+
+    Only methods in `methods` are retried, so a POST is never sent twice
+    unless the caller asks for it with request(..., retry=True).
+    """
+
+    def __init__(
+        self, max_retries=3, backoff=0.5, max_backoff=30,
+        statuses=(429, 503), methods=('GET', 'DELETE', 'PATCH')
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.methods = methods
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def can_retry(self, method, attempt, retry=None):
+        if attempt >= self.max_retries:
+            return False
+        if retry is not None:
+            return retry
+        return method in self.methods
+
+    def delay(self, attempt, response=None):
+        """ Seconds to wait before the next attempt """
+        with self.lock:
+            self.retries += 1
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        ceiling = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+
+def retry_after_seconds(response):
+    """ Retry-After may be a number of seconds or an HTTP date """
+    if response is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time.time())
@@ -0,0 +1,302 @@
+""" A circuit breaker and hedged GETs for MonzoClient
+
+CircuitBreaker stops calling an endpoint which keeps failing, so callers
+fail fast instead of each waiting out a timeout, and lets a single probe
+through now and then to find out when it has recovered. HedgePolicy cuts
+tail latency on idempotent GETs by sending a second copy of a request
+that is slower than usual and using whichever answer arrives first.
+
+Pass them to MonzoClient as circuit_breaker= and hedge=. Both can be
+shared between clients and report to the client's hooks (see
+monzo_metrics).
+"""
+
+import time
+import heapq
+import threading
+from collections import deque
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+# Statuses which mean the API is struggling, other 4xx are the caller's fault
+FAILURE_STATUSES = (500, 502, 503, 504)
+
+# Read-only endpoints worth hedging, see monzo_endpoints for the templates
+HEDGE_ENDPOINTS = ('ping/whoami', 'accounts', 'balance', 'transactions/{id}', 'webhooks')  # NOQA
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """ Raised instead of calling an endpoint whose circuit is open
+
+    It is a ConnectionError so bulk helpers treat it as transient and try
+    again after a backoff. MonzoClient itself does not retry it.
+    """
+
+    def __init__(self, endpoint, retry_in):
+        super(CircuitOpenError, self).__init__(
+            'Circuit for {0} is open, retry in {1:.1f}s'.format(endpoint, retry_in)  # NOQA
+        )
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class Circuit(object):
+    __slots__ = ('state', 'failures', 'opened_at', 'probing')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+
+class CircuitBreaker(object):
+    """ Opens after failure_threshold consecutive failures
+
+    Connection errors, timeouts and failure_statuses responses count as
+    failures. An open circuit rejects calls with CircuitOpenError for
+    reset_timeout seconds and then half-opens: one probe call goes through
+    and closes the circuit if it succeeds or opens it again if it fails.
+    There is a circuit per endpoint template, or one for the whole API with
+    per_endpoint=False. opened and rejected count what happened.
+    """
+
+    def __init__(
+        self, failure_threshold=5, reset_timeout=30, per_endpoint=True,
+        failure_statuses=FAILURE_STATUSES
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.per_endpoint = per_endpoint
+        self.failure_statuses = failure_statuses
+        self.circuits = {}  # key: Circuit
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def key(self, endpoint):
+        return endpoint if self.per_endpoint else '*'
+
+    def state(self, endpoint):
+        circuit = self.circuits.get(self.key(endpoint))
+        return circuit.state if circuit is not None else CLOSED
+
+    def states(self):
+        """ {key: state} for every circuit used so far """
+        with self.lock:
+            return dict(
+                (key, circuit.state) for key, circuit in self.circuits.items()
+            )
+
+    def allow(self, endpoint):
+        """ Raise CircuitOpenError unless a call to endpoint may go ahead
+
+        Returns the new state if letting the call through changed it (to
+        half open for a probe), otherwise None.
+        """
+        key = self.key(endpoint)
+        with self.lock:
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                circuit = self.circuits[key] = Circuit()
+            if circuit.state == CLOSED:
+                return None
+            retry_in = circuit.opened_at + self.reset_timeout - time.time()
+            if circuit.state == OPEN and retry_in <= 0:
+                circuit.state = HALF_OPEN
+                circuit.probing = True
+                return HALF_OPEN
+            self.rejected += 1
+        raise CircuitOpenError(key, max(retry_in, 0.0))
+
+    def record(self, endpoint, ok):
+        """ Count the outcome of a call allow() let through
+
+        Returns the new state if this changed it, otherwise None.
+        """
+        key = self.key(endpoint)
+        with self.lock:
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                circuit = self.circuits[key] = Circuit()
+            if ok:
+                circuit.failures = 0
+                if circuit.state == CLOSED:
+                    return None
+                circuit.state = CLOSED
+                circuit.probing = False
+                return CLOSED
+            circuit.failures += 1
+            if circuit.state == OPEN or (
+                circuit.state == CLOSED and
+                circuit.failures < self.failure_threshold
+            ):
+                return None
+            circuit.state = OPEN
+            circuit.opened_at = time.time()
+            circuit.probing = False
+            self.opened += 1
+            return OPEN
+
+    def failed(self, response):
+        """ Whether a response counts as a failure """
+        return response.status_code in self.failure_statuses
+
+
+class _HedgedCall(object):
+    __slots__ = ('endpoint', 'send', 'done', 'hedge', 'answered')
+
+    def __init__(self, endpoint, send):
+        self.endpoint = endpoint
+        self.send = send
+        self.done = False  # Set once no hedge is wanted
+        self.hedge = None  # The hedge's future, once it has been sent
+        self.answered = threading.Event()  # Set as each request finishes
+
+
+class HedgePolicy(object):
+    """ Sends a second copy of GETs slower than the recent p95
+
+    For GETs to endpoints, if no response has arrived after the percentile
+    of that endpoint's last window latencies, the request is sent again and
+    the first response to arrive is used. Until min_samples latencies have
+    been seen it waits delay seconds instead. Hedged requests are limited
+    to budget (a fraction) of all requests so a slow API does not get
+    twice the traffic. hedges counts second requests sent and wins how
+    many of them answered first.
+
+    Requests are sent from a pool of max_workers threads, so size it for
+    the number of hedged calls in flight at once. The hedge delay starts
+    when a worker starts the first request, so time queued for a worker
+    does not trigger hedges, and a single timer thread sends them.
+    """
+
+    def __init__(
+        self, endpoints=HEDGE_ENDPOINTS, percentile=95, delay=0.5,
+        min_delay=0.01, min_samples=20, window=200, budget=0.05,
+        max_workers=32
+    ):
+        self.endpoints = frozenset(endpoints)
+        self.percentile = percentile
+        self.delay = delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = budget
+        self.max_workers = max_workers
+        self.latencies = {}  # endpoint: deque of recent seconds
+        self.delays = {}  # endpoint: current hedge delay
+        self.lock = threading.Lock()
+        self.scheduled = threading.Condition(self.lock)
+        self.due = []  # Heap of (time to hedge, sequence, _HedgedCall)
+        self.sequence = 0
+        self.timer = None
+        self.executor = None
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def win_rate(self):
+        return self.wins / float(self.hedges) if self.hedges else 0.0
+
+    def hedge_after(self, endpoint):
+        """ Seconds to wait for a response before hedging """
+        return self.delays.get(endpoint, self.delay)
+
+    def observe(self, endpoint, seconds):
+        with self.lock:
+            latencies = self.latencies.get(endpoint)
+            if latencies is None:
+                latencies = deque(maxlen=self.window)
+                self.latencies[endpoint] = latencies
+            latencies.append(seconds)
+            if len(latencies) >= self.min_samples and \
+                    len(latencies) % 10 == 0:
+                ordered = sorted(latencies)
+                index = int(self.percentile / 100.0 * (len(ordered) - 1))
+                self.delays[endpoint] = max(ordered[index], self.min_delay)
+
+    def send(self, endpoint, send):
+        """ send(), hedged if it is slow, returns (response, hedged, won) """
+        if endpoint not in self.endpoints:
+            return send(), False, False
+        call = _HedgedCall(endpoint, send)
+        with self.lock:
+            self.requests += 1
+            first = self._executor().submit(self._first, call)
+        first.add_done_callback(lambda future: call.answered.set())
+
+        while True:
+            call.answered.wait()
+            call.answered.clear()
+            with self.lock:
+                hedge = call.hedge
+                if first.done() and hedge is None:
+                    call.done = True  # Too late to hedge
+            # The first request wins ties
+            for future in (first, hedge):
+                if future is None or not future.done() or future.exception():
+                    continue
+                won = future is hedge
+                with self.lock:
+                    call.done = True
+                    if won:
+                        self.wins += 1
+                return future.result(), hedge is not None, won
+            if first.done() and (hedge is None or hedge.done()):
+                raise first.exception()
+
+    def _first(self, call):
+        with self.lock:
+            self.sequence += 1
+            heapq.heappush(self.due, (
+                time.time() + self.hedge_after(call.endpoint), self.sequence,
+                call,
+            ))
+            if self.timer is None:
+                self.timer = threading.Thread(
+                    target=self._hedge_when_due, name='monzo-hedge-timer',
+                )
+                self.timer.daemon = True
+                self.timer.start()
+            self.scheduled.notify()
+        return self._timed(call.endpoint, call.send)
+
+    def _executor(self):
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(self.max_workers)
+        return self.executor
+
+    def _hedge_when_due(self):
+        """ The timer thread, sends hedges for calls still running """
+        with self.lock:
+            while True:
+                if not self.due:
+                    self.scheduled.wait()
+                    continue
+                wait = self.due[0][0] - time.time()
+                if wait > 0:
+                    self.scheduled.wait(wait)
+                    continue
+                call = heapq.heappop(self.due)[2]
+                if call.done or self.hedges >= self.budget * self.requests:
+                    continue
+                self.hedges += 1
+                call.hedge = self._executor().submit(
+                    self._timed, call.endpoint, call.send
+                )
+                call.hedge.add_done_callback(
+                    lambda future, call=call: call.answered.set()
+                )
+
+    def _timed(self, endpoint, send):
+        started = time.time()
+        response = send()
+        self.observe(endpoint, time.time() - started)
+        return response
@@ -0,0 +1,334 @@
+""" Keep balances and transactions fresh from webhooks instead of polling
+
+WebhookSubscriptions makes sure each account has exactly one webhook
+pointing at your receiver, removing duplicates and stale registrations
+(e.g. from before a secret token was rotated). Reconciling is idempotent,
+so run it on every deploy or on a schedule.
+
+AccountCache holds each account's balance and recent transactions in
+memory. It is a sink for monzo_webhooks.WebhookReceiver: transaction.created
+events are added to the cached transactions and balance as they arrive, so
+reads are served locally and only a miss, or state older than max_age,
+calls the API.
+"""
+
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from monzo_sync import format_since, parse_created
+
+
+STAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def created_stamp(created):
+    """ A created timestamp to the microsecond, comparable as a string """
+    seconds, _, fraction = created.rstrip('Z').partition('.')
+    return '{0}.{1:0<6}'.format(seconds[:19], fraction[:6])
+
+
+def webhook_base(url):
+    """ The URL without its query string, e.g. without a secret token """
+    parts = urlsplit(url)
+    return '{0}://{1}{2}'.format(parts.scheme, parts.netloc, parts.path)
+
+
+class WebhookSubscriptions(object):
+    """ One webhook per account pointing at webhook_url
+
+    A registered webhook whose URL without its query string is managed
+    (by default webhook_url without its query string) but which is not
+    webhook_url is stale and is removed, as is any second webhook for
+    webhook_url. Webhooks pointing anywhere else, including other paths
+    on the same host, belong to someone else and are left alone.
+    """
+
+    def __init__(self, client, webhook_url, managed=None, max_workers=10):
+        self.client = client
+        self.webhook_url = webhook_url
+        self.managed = managed if managed else webhook_base(webhook_url)
+        self.max_workers = max_workers
+
+    def plan(self, webhooks):
+        """ (webhook to keep or None, [webhooks to remove]) """
+        keep = None
+        remove = []
+        for webhook in webhooks:
+            url = webhook.get('url') or ''
+            if url == self.webhook_url and keep is None:
+                keep = webhook
+            elif self.is_managed(url):
+                remove.append(webhook)
+        return keep, remove
+
+    def is_managed(self, url):
+        return webhook_base(url) == self.managed
+
+    def reconcile(self, account_ids):
+        """ Register or repair the webhook of each account
+
+        Returns {'results': {account_id: report}, 'errors': {...}} as
+        MonzoClient.get_balances does. A report has the 'webhook' id in use
+        and whether it was 'created', plus the ids 'removed'. Running it
+        again changes nothing.
+        """
+        return self.client._fan_out(
+            self._reconcile, account_ids, self.max_workers
+        )
+
+    def _reconcile(self, account_id):
+        keep, remove = self.plan(self.client._list_webhooks(account_id))
+        # Register the new hook before removing old ones so no event is missed
+        created = keep is None
+        if created:
+            keep = self.client._create_webhook(self.webhook_url, account_id)
+        for webhook in remove:
+            self.client._remove_webhook(webhook['id'], account_id)
+        return {
+            'webhook': keep['id'],
+            'created': created,
+            'removed': [webhook['id'] for webhook in remove],
+        }
+
+    def unsubscribe(self, account_ids):
+        """ Remove every managed webhook, returns the ids removed """
+        return self.client._fan_out(
+            self._unsubscribe, account_ids, self.max_workers
+        )
+
+    def _unsubscribe(self, account_id):
+        removed = []
+        for webhook in self.client._list_webhooks(account_id):
+            if self.is_managed(webhook.get('url') or ''):
+                self.client._remove_webhook(webhook['id'], account_id)
+                removed.append(webhook['id'])
+        return removed
+
+
+class AccountState(object):
+    __slots__ = (
+        'balance', 'balance_at', 'transactions', 'ids', 'transactions_at',
+        'pending',
+    )
+
+    def __init__(self):
+        self.balance = None
+        # (time.time(), UTC timestamps before and after) the balance fetch
+        self.balance_at = None
+        self.transactions = None  # Oldest first
+        self.ids = set()
+        self.transactions_at = None
+        self.pending = None  # Events which arrived during a fetch
+
+
+class AccountCache(object):
+    """ Balances and recent transactions kept up to date by webhook events
+
+    The first read of an account fetches its balance or its transactions
+    since window (a timedelta, or None for the whole history) and keeps
+    the last max_transactions of them; later fetches only ask for
+    transactions since the newest one cached. Pass the cache as the sink of a
+    WebhookReceiver and every transaction.created event is merged in:
+    new transactions are added in created order, redelivered or updated
+    ones replace the cached copy, and the amount of a new transaction
+    created after the balance was fetched is added to it (and to
+    spend_today for spending today). One created while the balance was
+    being fetched may or may not be in it, so the balance is fetched
+    again instead. State older than max_age seconds is fetched again in
+    case an event was missed. Only max_accounts accounts are kept, least
+    recently used first out.
+
+    Events also drop the client's ResponseCache entries for the account,
+    so plain client reads don't return a stale balance either. hits,
+    misses and applied count what happened.
+    """
+
+    def __init__(
+        self, client, window=timedelta(days=90), max_age=15 * 60,
+        max_accounts=1000, max_transactions=1000
+    ):
+        self.client = client
+        self.window = window
+        self.max_age = max_age
+        self.max_accounts = max_accounts
+        self.max_transactions = max_transactions
+        self.accounts = OrderedDict()  # account_id: AccountState
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.applied = 0
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _state(self, account_id):
+        state = self.accounts.get(account_id)
+        if state is None:
+            state = self.accounts[account_id] = AccountState()
+            while len(self.accounts) > self.max_accounts:
+                self.accounts.popitem(last=False)
+        else:
+            self.accounts.move_to_end(account_id)
+        return state
+
+    def _fresh(self, fetched_at):
+        if fetched_at is None:
+            return False
+        return time.time() - fetched_at < self.max_age
+
+    def balance(self, account_id):
+        """ The account's balance as get_balance returns it """
+        with self.lock:
+            state = self._state(account_id)
+            fetched_at = state.balance_at[0] if state.balance_at else None
+            if state.balance is not None and self._fresh(fetched_at):
+                self.hits += 1
+                return dict(state.balance)
+            self.misses += 1
+        fetched_at = time.time()
+        sent = datetime.utcnow().strftime(STAMP_FORMAT)
+        balance = self.client._get_balance(account_id)
+        with self.lock:
+            state = self._state(account_id)
+            state.balance = dict(balance)
+            state.balance_at = (
+                fetched_at, sent, datetime.utcnow().strftime(STAMP_FORMAT),
+            )
+        return dict(balance)
+
+    def transactions(self, account_id, limit=None):
+        """ The account's cached transactions, oldest first
+
+        limit returns only the most recent limit of them.
+        """
+        with self.lock:
+            state = self._state(account_id)
+            cached = state.transactions
+            if cached is not None and self._fresh(state.transactions_at):
+                self.hits += 1
+                transactions = list(cached)
+            else:
+                self.misses += 1
+                if state.pending is None:
+                    state.pending = []
+                cached = list(cached) if cached else None
+                state = None
+        if state is None:
+            transactions = self._fetch(account_id, cached)
+        return transactions[-limit:] if limit else transactions
+
+    def _fetch(self, account_id, cached=None):
+        """ Fetch transactions since the newest cached, or within window """
+        fetched_at = time.time()
+        since = None
+        if self.window:
+            since = format_since(datetime.utcnow() - self.window)
+        if cached:
+            newest = format_since(parse_created(cached[-1]['created']))
+            since = max(since, newest) if since else newest
+        try:
+            transactions = list(self.client.iter_transactions(
+                account_id=account_id, since=since,
+            ))
+        except Exception:
+            with self.lock:
+                # Merge what arrived into the old state rather than queue it
+                state = self._state(account_id)
+                arrived, state.pending = state.pending or [], None
+                if state.transactions is not None:
+                    for transaction in arrived:
+                        self._merge_transaction(state, transaction)
+            raise
+
+        with self.lock:
+            state = self._state(account_id)
+            # Fetched copies are newer than cached ones, and events which
+            # arrived while the fetch was in flight newer still
+            arrived, state.pending = state.pending or [], None
+            by_id = OrderedDict((t['id'], t) for t in cached or [])
+            for transaction in transactions + arrived:
+                by_id[transaction['id']] = transaction
+            transactions = sorted(by_id.values(), key=lambda t: t['created'])
+            transactions = transactions[-self.max_transactions:]
+            state.transactions = transactions
+            state.ids = set(t['id'] for t in transactions)
+            state.transactions_at = fetched_at
+            return list(transactions)
+
+    def invalidate(self, account_id):
+        """ Forget an account so its next read goes to the API """
+        with self.lock:
+            self.accounts.pop(account_id, None)
+        self.client._invalidate(
+            'balance:{0}'.format(account_id),
+            'transactions:{0}'.format(account_id),
+        )
+
+    def apply(self, events):
+        """ Merge webhook events, ignoring all but transaction.created """
+        tags = set()
+        with self.lock:
+            for event in events:
+                if event.get('type') != 'transaction.created':
+                    continue
+                transaction = event['data']
+                account_id = transaction['account_id']
+                tags.update([
+                    'balance:{0}'.format(account_id),
+                    'transactions:{0}'.format(account_id),
+                    'transaction:{0}'.format(transaction['id']),
+                ])
+                self.applied += 1
+                state = self.accounts.get(account_id)
+                if state is not None:
+                    self._merge(state, transaction)
+        if tags:
+            self.client._invalidate(*sorted(tags))
+
+    __call__ = apply
+
+    def _merge_transaction(self, state, transaction):
+        if transaction['id'] not in state.ids:
+            created = [t['created'] for t in state.transactions]
+            state.transactions.insert(
+                bisect.bisect_right(created, transaction['created']),
+                transaction,
+            )
+            state.ids.add(transaction['id'])
+            if len(state.transactions) > self.max_transactions:
+                state.ids.discard(state.transactions.pop(0)['id'])
+            return
+        for index, cached in enumerate(state.transactions):
+            if cached['id'] == transaction['id']:
+                state.transactions[index] = transaction
+                break
+
+    def _merge(self, state, transaction):
+        new = transaction['id'] not in state.ids
+        if state.pending is not None:
+            state.pending.append(transaction)
+        elif state.transactions is not None:
+            self._merge_transaction(state, transaction)
+
+        # A transaction created before the balance was fetched is in it already
+        if not new or state.balance is None:
+            return
+        if transaction.get('decline_reason'):
+            return
+        created = created_stamp(transaction['created'])
+        if created < state.balance_at[1]:
+            return
+        if created <= state.balance_at[2]:
+            # Created while the balance was fetched, it may be in it or not
+            state.balance = None
+            return
+        amount = transaction.get('amount') or 0
+        state.balance['balance'] = state.balance.get('balance', 0) + amount
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        if amount < 0 and created[:10] == today:
+            spend_today = state.balance.get('spend_today', 0)
+            state.balance['spend_today'] = spend_today + amount
@@ -0,0 +1,224 @@
+""" Incremental transaction sync into a local SQLite store """
+
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    created TEXT NOT NULL,
+    merchant_id TEXT,
+    category TEXT,
+    amount INTEGER,
+    currency TEXT,
+    settled INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_account_created
+    ON transactions (account_id, created);
+CREATE INDEX IF NOT EXISTS transactions_merchant
+    ON transactions (merchant_id, created);
+CREATE TABLE IF NOT EXISTS sync_state (
+    account_id TEXT PRIMARY KEY,
+    cursor TEXT,
+    synced_at REAL
+);
+"""
+
+
+def parse_created(created):
+    """ A naive UTC datetime from a Monzo timestamp
+
+    They look like 2016-01-01T12:00:00.000Z or 2016-01-01T12:00:00Z.
+    """
+    return datetime.strptime(created[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def format_since(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def merchant_id(transaction):
+    """ The merchant id whether or not the merchant was expanded """
+    merchant = transaction.get('merchant')
+    if isinstance(merchant, dict):
+        return merchant.get('id')
+    return merchant
+
+
+class TransactionStore(object):
+    """ Transactions per account plus the last synced cursor, in SQLite
+
+    Indexed by (account_id, created) and (merchant_id, created) so the local
+    queries never scan the whole table. One store can be shared between
+    threads, e.g. a TransactionSync and a webhook StoreSink; lock is held
+    around each use of the connection.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def get_cursor(self, account_id):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT cursor FROM sync_state WHERE account_id = ?',
+                (account_id,)
+            ).fetchone()
+        return row['cursor'] if row else None
+
+    def set_cursor(self, account_id, cursor):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)',
+                (account_id, cursor, time.time()),
+            )
+
+    def upsert(self, transactions):
+        """ Store transactions, returning (inserted, updated, unchanged) """
+        inserted = updated = unchanged = 0
+        changes = []
+        with self.lock, self.connection:
+            for transaction in transactions:
+                data = json.dumps(transaction, sort_keys=True)
+                row = self.connection.execute(
+                    'SELECT data FROM transactions WHERE id = ?',
+                    (transaction['id'],)
+                ).fetchone()
+                if row is None:
+                    inserted += 1
+                elif row['data'] != data:
+                    updated += 1
+                else:
+                    unchanged += 1
+                    continue
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO transactions '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        transaction['id'],
+                        transaction['account_id'],
+                        transaction['created'],
+                        merchant_id(transaction),
+                        transaction.get('category'),
+                        transaction.get('amount'),
+                        transaction.get('currency'),
+                        1 if transaction.get('settled') else 0,
+                        data,
+                    )
+                )
+                changes.append((row['data'] if row else None, transaction))
+            self.changed(changes)
+        return inserted, updated, unchanged
+
+    def changed(self, changes):
+        """ Hook for subclasses keeping derived tables in step
+
+        changes lists (previous JSON or None, transaction) for each row
+        upsert wrote. It runs inside upsert's database transaction.
+        """
+
+    def transactions(
+        self, account_id, since=None, before=None, merchant_id=None,
+        category=None
+    ):
+        """ Stored transactions for an account in created order """
+        sql = 'SELECT data FROM transactions WHERE account_id = ?'
+        params = [account_id]
+        if merchant_id:
+            sql += ' AND merchant_id = ?'
+            params.append(merchant_id)
+        if category:
+            sql += ' AND category = ?'
+            params.append(category)
+        if since:
+            sql += ' AND created >= ?'
+            params.append(since)
+        if before:
+            sql += ' AND created < ?'
+            params.append(before)
+        sql += ' ORDER BY created'
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        for row in rows:
+            yield json.loads(row['data'])
+
+    def count(self, account_id):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT COUNT(*) AS n FROM transactions WHERE account_id = ?',
+                (account_id,)
+            ).fetchone()
+        return row['n']
+
+
+class TransactionSync(object):
+    """ Keep a TransactionStore up to date from a MonzoClient
+
+    The first sync downloads the full history. Later syncs start from the
+    stored cursor minus refetch_window, so settled amounts and metadata
+    added with annotate_transaction are picked up for recent transactions.
+    """
+
+    def __init__(
+        self, client, store, refetch_window=timedelta(days=7), page_size=100
+    ):
+        self.client = client
+        self.store = store
+        self.refetch_window = refetch_window
+        self.page_size = page_size
+
+    def sync(self, account_id=None):
+        """ Sync one account and return the delta stats for the run """
+        account_id = account_id if account_id else self.client.account_id
+        started = time.time()
+        cursor = self.store.get_cursor(account_id)
+        since = None
+        if cursor:
+            since = format_since(parse_created(cursor) - self.refetch_window)
+
+        stats = {
+            'account_id': account_id,
+            'since': since,
+            'fetched': 0,
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+        }
+        batch = []
+        for transaction in self.client.iter_transactions(
+            account_id=account_id, since=since, page_size=self.page_size
+        ):
+            stats['fetched'] += 1
+            if not cursor or transaction['created'] > cursor:
+                cursor = transaction['created']
+            batch.append(transaction)
+            if len(batch) >= self.page_size:
+                self._store(batch, stats)
+                batch = []
+        self._store(batch, stats)
+
+        if cursor:
+            self.store.set_cursor(account_id, cursor)
+        stats['cursor'] = cursor
+        stats['duration'] = time.time() - started
+        return stats
+
+    def sync_many(self, account_ids):
+        return [self.sync(account_id) for account_id in account_ids]
+
+    def _store(self, batch, stats):
+        inserted, updated, unchanged = self.store.upsert(batch)
+        stats['inserted'] += inserted
+        stats['updated'] += updated
+        stats['unchanged'] += unchanged
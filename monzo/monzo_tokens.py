@@ -0,0 +1,278 @@
+""" Access token management shared between threads and worker processes """
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+NEVER_EXPIRES = '3000-12-31T23:59:59.999999'
+
+
+def parse_expires_at(expires_at):
+    """ ISO local time (as returned by _set_expires_at) to epoch seconds """
+    if not expires_at:
+        return 0.0
+    if '.' not in expires_at:
+        expires_at += '.0'
+    value = datetime.strptime(expires_at, '%Y-%m-%dT%H:%M:%S.%f')
+    return time.mktime(value.timetuple()) + value.microsecond / 1000000.0
+
+
+def format_expires_at(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+
+class TokenStore(object):
+    """ Where refreshed tokens are shared between processes
+
+    load() returns a dict with access_token, refresh_token and expires_at or
+    None. lock() is held around load, refresh and save so only one worker
+    process uses the single-use refresh token.
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, tokens):
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self):
+        yield
+
+
+class CallbackTokenStore(TokenStore):
+    """ Hands tokens to your own load() and save(tokens) functions """
+
+    def __init__(self, load, save):
+        self._load = load
+        self._save = save
+
+    def load(self):
+        return self._load()
+
+    def save(self, tokens):
+        self._save(tokens)
+
+
+class FileTokenStore(TokenStore):
+    """ JSON file, locked with flock so workers on one host take turns """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, tokens):
+        temp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(temp_path, 'w') as fh:
+            json.dump(tokens, fh)
+        os.rename(temp_path, self.path)
+
+    @contextmanager
+    def lock(self):
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        with open(self.path + '.lock', 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class SQLiteTokenStore(TokenStore):
+    """ Tokens kept in a SQLite table, keyed so many users can share a db """
+
+    def __init__(self, path, key='default'):
+        self.path = path
+        self.key = key
+        self._locked = None
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS monzo_tokens '
+                '(key TEXT PRIMARY KEY, data TEXT NOT NULL)'
+            )
+
+    def _connect(self):
+        import sqlite3
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self):
+        connection = self._locked or self._connect()
+        row = connection.execute(
+            'SELECT data FROM monzo_tokens WHERE key = ?', (self.key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, tokens):
+        connection = self._locked or self._connect()
+        connection.execute(
+            'INSERT OR REPLACE INTO monzo_tokens VALUES (?, ?)',
+            (self.key, json.dumps(tokens)),
+        )
+        if connection is not self._locked:
+            connection.commit()
+
+    @contextmanager
+    def lock(self):
+        connection = self._connect()
+        connection.isolation_level = None
+        connection.execute('BEGIN IMMEDIATE')
+        self._locked = connection
+        try:
+            yield
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        finally:
+            self._locked = None
+            connection.close()
+
+
+class TokenManager(object):
+    """ Holds the tokens for a client and refreshes them exactly once
+
+    Expiry is kept as epoch seconds with the refresh point precomputed, so
+    the check on every request is a single comparison. When the token is
+    due for refresh the first caller refreshes it while any other threads
+    wait and then reuse the new token. With a TokenStore the new tokens are
+    shared with other processes, and a process which finds a fresher token
+    in the store uses it instead of refreshing again. ensure_async and
+    refresh_async do the same for coroutines, with an asyncio.Lock per
+    event loop in place of the thread lock.
+    """
+
+    def __init__(
+        self, access_token='', refresh_token='', expires_at=NEVER_EXPIRES,
+        store=None, refresh_margin=60
+    ):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.refreshes = 0
+        self.lock = threading.Lock()
+        self._async_lock = None  # (event loop, asyncio.Lock)
+        self.set_expires_at(expires_at)
+
+    @property
+    def expires_at(self):
+        return format_expires_at(self.expires_at_epoch)
+
+    def set_expires_at(self, expires_at):
+        self.set_expires_at_epoch(parse_expires_at(expires_at))
+
+    def set_expires_at_epoch(self, epoch):
+        self.expires_at_epoch = epoch
+        self.refresh_at = epoch - self.refresh_margin
+
+    def as_dict(self):
+        return {
+            'access_token': self.access_token,
+            'refresh_token': self.refresh_token,
+            'expires_at': self.expires_at,
+        }
+
+    def ensure(self, refresh):
+        """ Refresh with refresh(refresh_token) if the token is due """
+        if time.time() < self.refresh_at:
+            return
+        self.refresh(refresh, stale_token=self.access_token)
+
+    def refresh(self, refresh, stale_token=None):
+        """ Run refresh(refresh_token) and store the tokens it returns
+
+        With a stale_token the refresh is skipped if another thread or
+        process has already replaced that token with one not yet due. Newer
+        tokens in the store are loaded first either way, as their refresh
+        token is the only one still valid.
+        """
+        with self.lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return self.as_dict()
+            if self.store is None:
+                return self._refresh(refresh)
+            with self.store.lock():
+                if self._load_stored(stale_token):
+                    return self.as_dict()
+                response = self._refresh(refresh)
+                self.store.save(self.as_dict())
+                return response
+
+    async def ensure_async(self, refresh):
+        """ ensure() for a coroutine refresh(refresh_token) """
+        if time.time() < self.refresh_at:
+            return
+        await self.refresh_async(refresh, stale_token=self.access_token)
+
+    async def refresh_async(self, refresh, stale_token=None):
+        """ refresh() for a coroutine refresh(refresh_token)
+
+        Coroutines which find the token due wait for the first one's
+        refresh and then reuse its token.
+        """
+        async with self._event_loop_lock():
+            if stale_token is not None and self.access_token != stale_token:
+                return self.as_dict()
+            if self.store is None:
+                return self._refreshed(await refresh(self.refresh_token))
+            with self.store.lock():
+                if self._load_stored(stale_token):
+                    return self.as_dict()
+                response = self._refreshed(await refresh(self.refresh_token))
+                self.store.save(self.as_dict())
+                return response
+
+    def _event_loop_lock(self):
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        if self._async_lock is None or self._async_lock[0] is not loop:
+            self._async_lock = (loop, asyncio.Lock())
+        return self._async_lock[1]
+
+    def _load_stored(self, stale_token):
+        """ Take newer tokens from the store, True if they aren't due """
+        stored = self.store.load()
+        if stored and \
+                stored.get('access_token') != self.access_token and \
+                parse_expires_at(stored.get('expires_at')) >= \
+                self.expires_at_epoch:
+            # Another process refreshed first, which used up our refresh
+            # token, so carry on from its tokens
+            self.update(stored)
+            return stale_token is not None and time.time() < self.refresh_at
+        return False
+
+    def _refresh(self, refresh):
+        return self._refreshed(refresh(self.refresh_token))
+
+    def _refreshed(self, response):
+        self.refreshes += 1
+        self.access_token = response['access_token']
+        self.refresh_token = response.get('refresh_token', self.refresh_token)
+        self.set_expires_at_epoch(time.time() + response['expires_in'])
+        response['expires_at'] = self.expires_at
+        return response
+
+    def update(self, tokens):
+        if 'access_token' in tokens:
+            self.access_token = tokens['access_token']
+        if 'refresh_token' in tokens:
+            self.refresh_token = tokens['refresh_token']
+        if 'expires_at' in tokens:
+            self.set_expires_at(tokens['expires_at'])
@@ -0,0 +1,236 @@
+""" Receiver for the events Monzo posts to webhooks
+
+WebhookReceiver is a WSGI app (see monzo_asgi for ASGI). It parses and
+checks each event, drops redeliveries of an event it has already seen and
+hands the event to a background batcher before replying, so Monzo gets its
+200 without waiting on whatever the sink does with the events.
+"""
+
+import hmac
+import json
+import time
+import queue
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+
+def event_key(event):
+    """ The key redeliveries of an event share """
+    return '{0}:{1}'.format(event['type'], event['data']['id'])
+
+
+class DedupSet(object):
+    """ Remembers keys for ttl seconds, keeping at most max_size of them """
+
+    def __init__(self, max_size=100000, ttl=24 * 60 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.keys = OrderedDict()  # key: expires_at, oldest first
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        """ Returns False if key was already seen and has not expired """
+        now = time.time()
+        with self.lock:
+            expires_at = self.keys.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self.keys.pop(key, None)
+            self.keys[key] = now + self.ttl
+            while len(self.keys) > self.max_size:
+                self.keys.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self.lock:
+            self.keys.pop(key, None)
+
+
+class EventBatcher(object):
+    """ Collects events on a bounded queue and calls sink(events) in batches
+
+    A batch is sent when it reaches batch_size or flush_interval seconds
+    after its first event. put() never blocks; it returns False when the
+    queue is full so the caller can ask Monzo to redeliver later. Monzo
+    has already had its 200 for queued events and won't send them again,
+    so if the sink raises the batch is retried up to max_retries times
+    with exponential backoff. A batch which still fails is passed to
+    dead_letter(batch, error), or kept on dead_letters if there is none.
+    """
+
+    def __init__(
+        self, sink, batch_size=100, flush_interval=1.0, max_queue=10000,
+        dead_letter=None, max_retries=3, backoff=0.5, max_backoff=30
+    ):
+        self.sink = sink
+        self.dead_letter = dead_letter
+        self.dead_letters = []
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_queue)
+        self.delivered = 0
+        self.errors = 0
+        self.retries = 0
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self, timeout=None):
+        """ Send whatever is queued and stop the worker thread """
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            batch = [event]
+            deadline = time.time() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.queue.get(
+                        timeout=max(0, deadline - time.time())
+                    )
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+            self._deliver(batch)
+            if stop:
+                return
+
+    def _deliver(self, batch):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                time.sleep(min(
+                    self.max_backoff, self.backoff * 2 ** (attempt - 1)
+                ))
+            try:
+                self.sink(batch)
+                self.delivered += len(batch)
+                return
+            except Exception as exc:
+                self.errors += 1
+                error = exc
+        if self.dead_letter is not None:
+            self.dead_letter(batch, error)
+        else:
+            self.dead_letters.append(batch)
+
+
+class StoreSink(object):
+    """ Writes transaction.created events into a TransactionStore
+
+    store is a monzo_sync.TransactionStore, or anything with its upsert().
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __call__(self, events):
+        transactions = [
+            event['data'] for event in events
+            if event.get('type') == 'transaction.created'
+        ]
+        if transactions:
+            self.store.upsert(transactions)
+
+
+class WebhookReceiver(object):
+    """ WSGI app for Monzo webhook events
+
+    Monzo does not sign webhook requests, so pass a secret and register
+    the webhook as https://example.com/hook?token=<secret> to reject posts
+    which did not come from your registration. Batches the sink keeps
+    failing on go to dead_letter(batch, error), see EventBatcher.
+    """
+
+    def __init__(
+        self, sink, secret=None, dedup=None, batch_size=100,
+        flush_interval=1.0, max_queue=10000, dead_letter=None,
+        max_retries=3, backoff=0.5
+    ):
+        self.secret = secret
+        self.dedup = dedup if dedup is not None else DedupSet()
+        self.batcher = EventBatcher(
+            sink, batch_size, flush_interval, max_queue, dead_letter,
+            max_retries, backoff,
+        )
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def close(self, timeout=None):
+        self.batcher.close(timeout)
+
+    def handle(self, body, query_string=''):
+        """ Process one delivery, returns (status code, response dict) """
+        if self.secret is not None:
+            token = parse_qs(query_string).get('token', [''])[0]
+            if not hmac.compare_digest(
+                token.encode('utf-8'), self.secret.encode('utf-8')
+            ):
+                self.rejected += 1
+                return 403, {'error': 'bad token'}
+        try:
+            event = json.loads(body.decode('utf-8'))
+            key = event_key(event)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.rejected += 1
+            return 400, {'error': 'not a webhook event'}
+
+        self.received += 1
+        if not self.dedup.add(key):
+            self.duplicates += 1
+            return 200, {'duplicate': True}
+        if not self.batcher.put(event):
+            # Let Monzo redeliver rather than lose the event
+            self.dedup.discard(key)
+            self.dropped += 1
+            return 503, {'error': 'busy'}
+        return 200, {}
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] != 'POST':
+            status, body = 405, {'error': 'POST only'}
+        else:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            status, body = self.handle(
+                environ['wsgi.input'].read(length),
+                environ.get('QUERY_STRING', ''),
+            )
+        payload = json.dumps(body).encode('utf-8')
+        start_response('{0} {1}'.format(status, STATUS_TEXT[status]), [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(payload))),
+        ])
+        return [payload]
+
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    405: 'Method Not Allowed',
+    503: 'Service Unavailable',
+}
@@ -13,14 +13,23 @@ setup(
     author='Matt Pye',
     author_email='pyematt@gmail.com',
     zip_safe=True,
+    python_requires='>=3.6',
     install_requires=['requests'],
+    extras_require={
+        'async': ['aiohttp'],
+        'export': ['numpy', 'pyarrow'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=['pytest', 'ipdb'],
     classifiers=[
         'Development Status :: 3 - Alpha',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
-        # 'Programming Language :: Python :: 3',
-        # 'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
 )
@@ -0,0 +1,167 @@
+import random
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from monzo import MonzoClient
+from monzo_analytics import AnalyticsStore
+from monzo_mock import MockMonzoServer
+from monzo_sync import TransactionStore, TransactionSync
+
+START = datetime(2016, 1, 30, 12)
+
+
+def make(id, hours, amount, category='groceries', merchant='merch_1', **extra):  # NOQA
+    transaction = {
+        'id': id,
+        'account_id': 'acc_1',
+        'created': (START + timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),  # NOQA
+        'amount': amount,
+        'currency': 'GBP',
+        'category': category,
+        'merchant': {'id': merchant} if merchant else None,
+        'settled': True,
+    }
+    transaction.update(extra)
+    return transaction
+
+
+@pytest.fixture()
+def store():
+    store = AnalyticsStore()
+    store.upsert([
+        make('tx_1', 0, -500),
+        make('tx_2', 1, -250, 'eating_out', 'merch_2'),
+        make('tx_3', 24, -1000),  # 2016-01-31
+        make('tx_4', 48, 20000, 'general', None),  # 2016-02-01, a top up
+        make('tx_5', 49, -300, 'eating_out', 'merch_2'),
+        make('tx_6', 50, -9999, decline_reason='INSUFFICIENT_FUNDS'),
+    ])
+    return store
+
+
+class TestAnalyticsStore:
+
+    def test_daily(self, store):
+        days = store.daily('acc_1')
+        assert [(d['day'], d['spent'], d['received'], d['count']) for d in days] == [  # NOQA
+            ('2016-01-30', 750, 0, 2),
+            ('2016-01-31', 1000, 0, 1),
+            ('2016-02-01', 300, 20000, 2),
+        ]
+        assert store.daily('acc_1', since='2016-01-31', before=datetime(2016, 2, 1))[0]['day'] == '2016-01-31'  # NOQA
+        assert [d['spent'] for d in store.daily('acc_1', category='eating_out')] == [250, 300]  # NOQA
+
+    def test_monthly_and_categories(self, store):
+        assert [(m['month'], m['spent'], m['net']) for m in store.monthly('acc_1')] == [  # NOQA
+            ('2016-01', 1750, -1750),
+            ('2016-02', 300, 19700),
+        ]
+        categories = store.categories('acc_1', since='2016-01-01')
+        assert categories['groceries']['spent'] == 1500
+        assert categories['eating_out']['count'] == 2
+
+    def test_merchants(self, store):
+        merchants = store.merchants('acc_1')
+        assert [(m['merchant_id'], m['spent']) for m in merchants] == [
+            ('merch_1', 1500), ('merch_2', 550),
+        ]
+        assert store.merchants('acc_1', limit=1)[0]['merchant_id'] == 'merch_1'  # NOQA
+        assert [d['day'] for d in store.merchant_daily('acc_1', 'merch_2')] == [  # NOQA
+            '2016-01-30', '2016-02-01',
+        ]
+
+    def test_updates_move_totals(self, store):
+        # Settled for a different amount, then recategorised
+        store.upsert([make('tx_1', 0, -600)])
+        assert store.daily('acc_1')[0]['spent'] == 850
+        store.upsert([make('tx_1', 0, -600, 'shopping')])
+        assert store.categories('acc_1')['shopping']['spent'] == 600
+        assert store.categories('acc_1')['groceries']['spent'] == 1000
+        # Unchanged rows don't touch the rollups
+        assert store.upsert([make('tx_1', 0, -600, 'shopping')]) == (0, 0, 1)
+        assert store.monthly('acc_1')[0]['count'] == 3
+
+    def test_month_over_month(self, store):
+        months = store.month_over_month('acc_1')
+        assert months[0]['change'] is None
+        assert months[1]['change'] == 300 - 1750
+        assert months[1]['change_pct'] == pytest.approx(-82.857, rel=1e-3)
+
+    def test_running_balance(self, store):
+        balances = store.running_balance('acc_1', 17950)
+        assert balances == [
+            ('2016-01-30', -750), ('2016-01-31', -1750), ('2016-02-01', 17950),
+        ]
+        assert store.running_balance('acc_1', 17950, before='2016-02-01') == [  # NOQA
+            ('2016-01-30', -750), ('2016-01-31', -1750),
+        ]
+
+    def test_matches_full_recomputation(self):
+        rng = random.Random(1)
+        store = AnalyticsStore()
+        transactions = {}
+        for __ in range(20):
+            updates = []
+            for __ in range(50):
+                id = 'tx_{0}'.format(rng.randint(0, 400))
+                updates.append(make(
+                    id, rng.randint(0, 24 * 90), rng.randint(-5000, 1000),
+                    rng.choice(['groceries', 'bills', 'transport']),
+                    rng.choice(['merch_1', 'merch_2', None]),
+                ))
+                transactions[id] = updates[-1]
+            store.upsert(updates)
+
+        expected = {}
+        for transaction in transactions.values():
+            day = transaction['created'][:10]
+            expected[day] = expected.get(day, 0) + transaction['amount']
+        assert dict((d['day'], d['net']) for d in store.daily('acc_1')) == expected  # NOQA
+        incremental = store.merchants('acc_1')
+        store.rebuild('acc_1')
+        assert store.merchants('acc_1') == incremental
+
+    def test_concurrent_upserts(self):
+        store = AnalyticsStore()
+        transactions = [make('tx_{0}'.format(i), i, -100) for i in range(300)]
+        counts = []
+
+        def upsert():
+            counts.append(store.upsert(transactions))
+
+        threads = [threading.Thread(target=upsert) for __ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sum(inserted for inserted, __, __ in counts) == 300
+        assert sum(day['count'] for day in store.daily('acc_1')) == 300
+        assert store.count('acc_1') == 300
+
+    def test_builds_rollups_for_existing_store(self, tmpdir):
+        path = str(tmpdir.join('transactions.db'))
+        plain = TransactionStore(path)
+        plain.upsert([make('tx_1', 0, -500), make('tx_2', 30, -100)])
+        plain.close()
+        store = AnalyticsStore(path)
+        assert [d['spent'] for d in store.daily('acc_1')] == [500, 100]
+
+    def test_range_queries_use_indexes(self, store):
+        plan = ' '.join(row[-1] for row in store.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT day, spent FROM daily_rollup '
+            'WHERE account_id = ? AND day >= ? AND day < ?',
+            ('acc_1', '2016-01-01', '2016-02-01'),
+        ))
+        assert plan.startswith('SEARCH') and 'INDEX' in plan
+
+    def test_sync(self):
+        with MockMonzoServer(transactions=300) as server:
+            client = MonzoClient(access_token='mock', account_id='acc_mock')
+            client.api_url = server.url
+            store = AnalyticsStore()
+            TransactionSync(client, store).sync()
+            expected = sum(-t['amount'] for t in server.accounts['acc_mock'])
+        assert sum(m['spent'] for m in store.monthly('acc_mock')) == expected
+        assert len(store.merchants('acc_mock')) == 50
@@ -0,0 +1,72 @@
+import requests
+
+from monzo_annotate import AnnotationQueue
+from monzo_ratelimit import RetryPolicy
+
+
+def patch_count(mock_server, action):
+    before = mock_server.request_count
+    result = action()
+    return result, mock_server.request_count - before
+
+
+class TestBulkAnnotate:
+
+    def test_coalesces_per_transaction(self, mock_client, mock_server):
+        transactions = mock_server.accounts['acc_mock'][:3]
+        annotations = []
+        for transaction in transactions:
+            annotations.append((transaction['id'], {'category': 'food'}))
+            annotations.append((transaction['id'], {'reviewed': 'yes'}))
+            annotations.append((transaction['id'], {'category': 'travel'}))
+
+        report, requests_sent = patch_count(
+            mock_server, lambda: mock_client.bulk_annotate(annotations)
+        )
+        assert requests_sent == 3
+        for transaction in transactions:
+            result = report[transaction['id']]
+            assert result['status'] == 'updated'
+            assert result['metadata'] == {'category': 'travel', 'reviewed': 'yes'}  # NOQA
+            assert transaction['metadata'] == {'category': 'travel', 'reviewed': 'yes'}  # NOQA
+
+    def test_drops_no_op_writes(self, mock_client, mock_server):
+        transactions = mock_client.list_transactions(limit=10)
+        transaction_id = transactions[0]['id']
+        mock_client.annotate_transaction(transaction_id, {'tag': 'a'})
+        transactions = mock_client.list_transactions(limit=10)
+
+        annotations = [(transaction_id, {'tag': 'a'})]
+        annotations += [(t['id'], {'missing': ''}) for t in transactions[1:]]
+        report, requests_sent = patch_count(
+            mock_server,
+            lambda: mock_client.bulk_annotate(annotations, known=transactions),  # NOQA
+        )
+        assert requests_sent == 0
+        assert set(r['status'] for r in report.values()) == set(['unchanged'])  # NOQA
+
+    def test_queue_remembers_written_metadata(self, mock_client, mock_server):
+        transaction_id = mock_server.accounts['acc_mock'][20]['id']
+        queue = AnnotationQueue(mock_client, max_workers=2)
+        queue.set(transaction_id, 'tag', 'b')
+        assert queue.flush()[transaction_id]['status'] == 'updated'
+        queue.set(transaction_id, 'tag', 'b')
+        assert queue.flush()[transaction_id]['status'] == 'unchanged'
+        queue.remove(transaction_id, ['tag'])
+        assert queue.flush()[transaction_id]['status'] == 'updated'
+        assert len(queue) == 0
+
+    def test_retries_and_failures(self, mock_client, mock_server):
+        transaction_id = mock_server.accounts['acc_mock'][30]['id']
+        queue = AnnotationQueue(
+            mock_client, retry_policy=RetryPolicy(backoff=0, statuses=(503,))
+        )
+        mock_server.inject_errors(503, count=2)
+        queue.set(transaction_id, 'tag', 'c')
+        queue.set('tx_unknown', 'tag', 'c')
+        report = queue.flush()
+
+        assert report[transaction_id]['status'] == 'updated'
+        assert report['tx_unknown']['status'] == 'failed'
+        assert isinstance(report['tx_unknown']['error'], requests.HTTPError)
+        assert report[transaction_id]['attempts'] + report['tx_unknown']['attempts'] == 4  # NOQA
@@ -0,0 +1,39 @@
+import json
+import asyncio
+
+from monzo_asgi import asgi_app
+from monzo_mock import make_transactions
+from monzo_webhooks import WebhookReceiver
+
+
+def call_asgi(app, body):
+    messages = [
+        {'type': 'http.request', 'body': body[:10], 'more_body': True},
+        {'type': 'http.request', 'body': body[10:], 'more_body': False},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'query_string': b''}
+    asyncio.new_event_loop().run_until_complete(app(scope, receive, send))
+    return sent
+
+
+class TestAsgi:
+
+    def test_asgi_app(self):
+        batches = []
+        receiver = WebhookReceiver(batches.append, flush_interval=0.01)
+        transaction = make_transactions('acc_mock', 1)[0]
+        body = json.dumps({'type': 'transaction.created', 'data': transaction})
+        sent = call_asgi(asgi_app(receiver), body.encode('utf-8'))
+        receiver.close()
+
+        assert sent[0]['status'] == 200
+        assert json.loads(sent[1]['body'].decode('utf-8')) == {}
+        assert batches[0][0]['data'] == transaction
@@ -0,0 +1,139 @@
+import time
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from monzo_async import AsyncMonzoClient, make_async_session  # NOQA
+from monzo_flight import AsyncSingleFlight  # NOQA
+from monzo_mock import MockMonzoServer  # NOQA
+from monzo_tokens import format_expires_at  # NOQA
+
+LATENCY = 0.2
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockMonzoServer(latency=LATENCY, transactions=20) as server:
+        yield server
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def make_client(server, session=None):
+    client = AsyncMonzoClient(access_token='mock', session=session)
+    client.api_url = server.url
+    return client
+
+
+class TestAsyncMonzoClient:
+
+    def test_update_tokens(self, server):
+        async def update():
+            async with make_client(server) as client:
+                return await client.update_tokens(access_token='new')
+
+        tokens = run(update())
+        assert tokens['access_token'] == 'new'
+        assert tokens['account_id'] == 'acc_mock'
+
+    def test_refreshes_expired_token(self, server):
+        server.httpd.refresh_tokens.add('refresh_async')
+
+        async def whoami():
+            async with make_client(server) as client:
+                client.refresh_token = 'refresh_async'
+                client.token_url = server.url + 'oauth2/token'
+                client.expires_at = '2016-01-01T00:00:00'
+                await client.whoami()
+                return client
+
+        client = run(whoami())
+        assert client.access_token != 'mock'
+        assert client.tokens.refresh_at > time.time()
+
+    def test_single_flight_refresh(self, server):
+        server.httpd.refresh_tokens.add('refresh_gather')
+        issued = server.token_count
+
+        async def whoami():
+            async with make_client(server) as client:
+                client.refresh_token = 'refresh_gather'
+                client.token_url = server.url + 'oauth2/token'
+                # Inside the refresh margin rather than expired
+                client.expires_at = format_expires_at(time.time() + 30)
+                await asyncio.gather(*[client.whoami() for __ in range(5)])
+                return client
+
+        client = run(whoami())
+        assert server.token_count - issued == 1
+        assert client.tokens.refreshes == 1
+
+    def test_list_transactions(self, server):
+        async def list_transactions():
+            async with make_client(server) as client:
+                return await client.list_transactions(account_id='acc_mock', limit=5)  # NOQA
+
+        transactions = run(list_transactions())
+        assert len(transactions) == 5
+        assert transactions[0]['merchant']['id']
+
+    def test_concurrent_fan_out(self, server):
+        accounts = 50
+
+        async def fan_out():
+            session = make_async_session(limit=accounts)
+            clients = [make_client(server, session) for __ in range(accounts)]
+            try:
+                started = time.time()
+                results = await asyncio.gather(*[c.whoami() for c in clients])  # NOQA
+                return results, time.time() - started
+            finally:
+                await session.close()
+
+        results, elapsed = run(fan_out())
+        assert len(results) == accounts
+        assert all(r['authenticated'] for r in results)
+        # Sequential calls would take accounts * LATENCY (10 seconds)
+        assert elapsed < accounts * LATENCY / 5
+
+    def test_timeouts(self, server):
+        async def sessions():
+            default = make_async_session()
+            unset = make_async_session(timeout=None)
+            try:
+                return default.timeout, unset.timeout
+            finally:
+                await default.close()
+                await unset.close()
+
+        default, unset = run(sessions())
+        assert (default.sock_connect, default.sock_read) == (5, 30)
+        assert unset == aiohttp.client.DEFAULT_TIMEOUT
+
+        async def slow():
+            client = AsyncMonzoClient(access_token='mock', timeout=LATENCY / 4)  # NOQA
+            client.api_url = server.url
+            async with client:
+                await client.whoami()
+
+        with pytest.raises(asyncio.TimeoutError):
+            run(slow())
+
+    def test_single_flight(self, server):
+        async def burst():
+            async with make_client(server) as client:
+                client.single_flight = AsyncSingleFlight()
+                before = server.request_count
+                results = await asyncio.gather(*[
+                    client.get_balance(account_id='acc_mock') for __ in range(10)  # NOQA
+                ])
+                return results, server.request_count - before, client.single_flight  # NOQA
+
+        results, requests_made, flight = run(burst())
+        assert requests_made == 1
+        assert flight.coalesced == 9
+        assert all(result == results[0] for result in results)
@@ -0,0 +1,53 @@
+import os
+import io
+import mmap
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), 'mondo-logo.png')
+
+
+class TestUploadAttachment:
+
+    def test_upload_streams_binary(self, mock_client, mock_server):
+        progress = []
+        upload = mock_client.upload_attachment(
+            TEST_FILE,
+            progress=lambda sent, total: progress.append((sent, total)),
+            chunk_size=1024,
+        )
+        size = os.path.getsize(TEST_FILE)
+        assert upload['file_type'] == 'image/png'
+        assert upload['file_url'].endswith('mondo-logo.png')
+        assert list(mock_server.httpd.uploads.values())[-1] == {
+            'size': size, 'content_type': 'image/png'
+        }
+        assert progress[-1] == (size, size)
+        assert len(progress) > size // 1024
+
+    def test_upload_file_object(self, mock_client, mock_server):
+        fileobj = io.BytesIO(b'%PDF-1.4 \x00\xff' * 1000)
+        upload = mock_client.upload_attachment(fileobj, file_name='receipt.pdf')  # NOQA
+        assert upload['file_type'] == 'application/pdf'
+        assert list(mock_server.httpd.uploads.values())[-1]['size'] == 11000
+
+    def test_upload_mmap(self, mock_client, mock_server):
+        with open(TEST_FILE, 'rb') as fh:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            mock_client.upload_attachment(mapped, file_name='logo.png')
+            mapped.close()
+        size = list(mock_server.httpd.uploads.values())[-1]['size']
+        assert size == os.path.getsize(TEST_FILE)
+
+
+class TestUploadAndAttachMany:
+
+    def test_upload_and_attach_many(self, mock_client):
+        files = [('tx_{0:08d}'.format(i), TEST_FILE) for i in range(10)]
+        files.append(('tx_00000010', '/does/not/exist.png'))
+        results = mock_client.upload_and_attach_many(files, max_workers=4)
+
+        assert [r['transaction_id'] for r in results] == [t for t, __ in files]  # NOQA
+        for result in results[:-1]:
+            assert result['attachment']['external_id'] == result['transaction_id']  # NOQA
+            assert result['attachment']['file_type'] == 'image/png'
+        assert 'attachment' not in results[-1]
+        assert isinstance(results[-1]['error'], (IOError, OSError))
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import signal
+from datetime import datetime, timedelta
+
+import pytest
+
+from monzo_backfill import Backfill, plan_shards
+from monzo_mock import MockMonzoServer
+from monzo_sync import TransactionStore
+from monzo_tokens import SQLiteTokenStore, format_expires_at
+
+ACCOUNTS = ['acc_a', 'acc_b']
+COUNT = 1500  # One a minute from 2016-01-01, so about a day each
+START = datetime(2016, 1, 1)
+
+
+class FailingStore(TransactionStore):
+    """ Crashes the writer after a number of pages """
+
+    def __init__(self, path, pages):
+        super(FailingStore, self).__init__(path)
+        self.pages = pages
+
+    def upsert(self, transactions):
+        if not self.pages:
+            raise IOError('disk full')
+        self.pages -= 1
+        return super(FailingStore, self).upsert(transactions)
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockMonzoServer(transactions=COUNT, account_ids=ACCOUNTS) as server:
+        yield server
+
+
+def make_backfill(server, store, checkpoint, **kwargs):
+    return Backfill(
+        [{'account_id': account_id, 'access_token': 'mock'} for account_id in ACCOUNTS],  # NOQA
+        store, checkpoint, processes=3, start=START,
+        end=START + timedelta(days=2), shard_size=timedelta(hours=6),
+        api_url=server.url, **kwargs
+    )
+
+
+def test_plan_shards():
+    shards = plan_shards(['acc_a'], START, START + timedelta(days=1), timedelta(hours=10))  # NOQA
+    assert [(s['since'], s['before']) for s in shards] == [
+        ('2016-01-01T00:00:00Z', '2016-01-01T10:00:00Z'),
+        ('2016-01-01T10:00:00Z', '2016-01-01T20:00:00Z'),
+        ('2016-01-01T20:00:00Z', '2016-01-02T00:00:00Z'),
+    ]
+    assert len(set(s['id'] for s in shards)) == 3
+
+
+def test_backfill(server, tmpdir):
+    reports = []
+    store = TransactionStore()
+    stats = make_backfill(
+        server, store, str(tmpdir.join('checkpoint.json')),
+        progress=reports.append,
+    ).run()
+    assert stats['transactions'] == COUNT * len(ACCOUNTS)
+    assert stats['done'] == stats['shards'] == 16
+    assert not stats['failed']
+    assert stats['per_second'] > 0
+    assert sum(w['transactions'] for w in stats['workers'].values()) == COUNT * len(ACCOUNTS)  # NOQA
+    assert all(w['lag'] >= 0 for w in stats['workers'].values())
+    assert reports[-1]['transactions'] == stats['transactions']
+    for account_id in ACCOUNTS:
+        assert store.count(account_id) == COUNT
+
+
+def test_resume_after_crash(server, tmpdir):
+    path = str(tmpdir.join('transactions.db'))
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    with pytest.raises(IOError):
+        make_backfill(server, FailingStore(path, pages=10), checkpoint).run()
+    with open(checkpoint) as saved:
+        shards = json.load(saved)['shards']
+    written = sum(shard['transactions'] for shard in shards)
+    assert 0 < written <= 10 * 100
+
+    store = TransactionStore(path)
+    stats = make_backfill(server, store, checkpoint).run()
+    assert stats['done'] == 16
+    # Only what the first run had not checkpointed is fetched again
+    assert stats['transactions'] == COUNT * len(ACCOUNTS) - written
+    for account_id in ACCOUNTS:
+        assert store.count(account_id) == COUNT
+
+    again = make_backfill(server, store, checkpoint).run()
+    assert again['transactions'] == 0 and again['done'] == 16
+
+
+def test_shard_errors_reported(tmpdir):
+    with MockMonzoServer(transactions=10, error_rate=1, error_status=403) as server:  # NOQA
+        stats = make_backfill(
+            server, TransactionStore(), str(tmpdir.join('checkpoint.json')),
+        ).run()
+    assert stats['failed'] == stats['shards']
+    assert all('HTTPError' in error for error in stats['errors'].values())
+
+
+def test_worker_killed(tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    store = TransactionStore()
+    killed = []
+
+    def progress(stats):
+        if not killed and stats['workers']:
+            killed.append(sorted(stats['workers'])[0])
+            os.kill(killed[0], signal.SIGKILL)
+
+    with MockMonzoServer(
+        transactions=COUNT, account_ids=ACCOUNTS, latency=0.05
+    ) as server:
+        stats = make_backfill(
+            server, store, checkpoint, progress=progress,
+            progress_interval=0.05,
+        ).run()
+        assert killed
+        assert stats['failed'] == 1
+        assert stats['done'] == stats['shards'] - 1
+        assert list(stats['errors'].values()) == [
+            'Worker exited before finishing the shard',
+        ]
+
+        again = make_backfill(server, store, checkpoint).run()
+    assert again['done'] == 16 and not again['failed']
+    for account_id in ACCOUNTS:
+        assert store.count(account_id) == COUNT
+
+
+def test_accounts_share_refreshed_tokens(server, tmpdir):
+    # As update_tokens() returns them, due for refresh
+    accounts = [{
+        'account_id': account_id,
+        'access_token': 'mock',
+        'refresh_token': 'backfill_' + account_id,
+        'expires_at': format_expires_at(time.time() + 30),
+    } for account_id in ACCOUNTS]
+    server.httpd.refresh_tokens.update(a['refresh_token'] for a in accounts)
+    issued = server.token_count
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    stats = Backfill(
+        accounts, TransactionStore(), checkpoint, processes=3, start=START,
+        end=START + timedelta(days=2), shard_size=timedelta(hours=6),
+        api_url=server.url,
+    ).run()
+    assert not stats['failed'] and stats['done'] == 16
+    # One refresh per account however many workers fetched its shards
+    assert server.token_count - issued == len(ACCOUNTS)
+    for account_id in ACCOUNTS:
+        stored = SQLiteTokenStore(checkpoint + '.tokens', key=account_id)
+        assert stored.load()['refresh_token'] in server.httpd.refresh_tokens
+
+    # A later run given the same, now spent, tokens uses the stored ones
+    os.remove(checkpoint)
+    issued = server.token_count
+    stats = Backfill(
+        accounts, TransactionStore(), checkpoint, processes=3, start=START,
+        end=START + timedelta(days=2), shard_size=timedelta(hours=6),
+        api_url=server.url,
+    ).run()
+    assert not stats['failed'] and server.token_count == issued
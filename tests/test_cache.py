@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from monzo import MonzoClient
+from monzo_cache import MemoryCache, ResponseCache
+
+
+@pytest.fixture()
+def cached_client(mock_server):
+    client = MonzoClient(
+        access_token='mock',
+        account_id='acc_mock',
+        cache=ResponseCache(ttls={'transactions': 60}),
+    )
+    client.api_url = mock_server.url
+    return client
+
+
+class TestMemoryCache:
+
+    def test_ttl(self):
+        cache = MemoryCache()
+        cache.set('key', '{}', 0.01, [])
+        assert cache.get('key') == '{}'
+        time.sleep(0.02)
+        assert cache.get('key') is None
+        assert cache.size == 0
+
+    def test_lru_max_entries(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', '1', 60, [])
+        cache.set('b', '2', 60, [])
+        cache.get('a')
+        cache.set('c', '3', 60, [])
+        assert cache.get('b') is None
+        assert cache.get('a') == '1'
+        assert cache.get('c') == '3'
+
+    def test_lru_max_bytes(self):
+        cache = MemoryCache(max_bytes=10)
+        cache.set('a', 'x' * 6, 60, [])
+        cache.set('b', 'y' * 6, 60, [])
+        assert len(cache) == 1
+        assert cache.get('b') == 'y' * 6
+        assert cache.size == 6
+
+    def test_invalidate(self):
+        cache = MemoryCache()
+        cache.set('a', '1', 60, ['tag'])
+        cache.set('b', '2', 60, ['tag', 'other'])
+        cache.set('c', '3', 60, ['other'])
+        cache.invalidate(['tag'])
+        assert cache.get('a') is None
+        assert cache.get('b') is None
+        assert cache.get('c') == '3'
+        assert cache.tags == {'other': set(['c'])}
+
+
+class TestResponseCache:
+
+    def test_hits(self, cached_client, mock_server):
+        before = mock_server.request_count
+        first = cached_client.whoami()
+        assert cached_client.whoami() == first
+        assert mock_server.request_count - before == 1
+        assert cached_client.cache.hits == 1
+
+    def test_scoped_per_token(self, cached_client, mock_server):
+        cached_client.get_balance()
+        cached_client.access_token = 'other'
+        before = mock_server.request_count
+        cached_client.get_balance()
+        assert mock_server.request_count - before == 1
+
+    def test_uncached_endpoint(self, cached_client, mock_server):
+        before = mock_server.request_count
+        cached_client.get_feed()
+        cached_client.get_feed()
+        assert mock_server.request_count - before == 2
+
+    def test_annotate_invalidates(self, cached_client):
+        transaction_id = cached_client.list_transactions(limit=1)[0]['id']
+        cached_client.get_transaction(transaction_id)
+        cached_client.annotate_transaction(transaction_id, {'cached': 'no'})
+
+        transaction = cached_client.get_transaction(transaction_id)
+        assert transaction['metadata']['cached'] == 'no'
+        transactions = cached_client.list_transactions(limit=1)
+        assert transactions[0]['metadata']['cached'] == 'no'
+
+        cached_client.remove_annotations(transaction_id, ['cached'])
+        transaction = cached_client.get_transaction(transaction_id)
+        assert 'cached' not in transaction['metadata']
+
+    def test_create_webhook_invalidates(self, cached_client):
+        assert cached_client.list_webhooks() == []
+        webhook = cached_client.create_webhook('http://example.com/hook')
+        assert cached_client.list_webhooks() == [webhook]
+        cached_client.remove_webhook(webhook['id'])
+        assert cached_client.list_webhooks() == []
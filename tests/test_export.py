@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from monzo_export import (  # NOQA
+    category_totals, export_arrow, export_parquet, export_record_array,
+    iter_batches, merchant_totals
+)
+
+
+class TestExport:
+
+    def test_iter_batches(self, mock_client):
+        batches = list(iter_batches(mock_client.iter_transactions(), batch_size=100))  # NOQA
+        assert [len(batch) for batch in batches] == [100, 100, 50]
+
+    def test_record_array(self, mock_client):
+        records = export_record_array(mock_client, batch_size=64)
+        transactions = list(mock_client.iter_transactions())
+        assert len(records) == 250
+        assert records.amount.sum() == sum(t['amount'] for t in transactions)
+        assert records.created[1] - records.created[0] == numpy.timedelta64(60, 's')  # NOQA
+        assert records.merchant_id[0] == transactions[0]['merchant']['id']
+        assert records.settled.all()
+
+    def test_totals(self, mock_client):
+        records = export_record_array(mock_client)
+        transactions = list(mock_client.iter_transactions())
+        expected = {}
+        for transaction in transactions:
+            merchant_id = transaction['merchant']['id']
+            expected[merchant_id] = expected.get(merchant_id, 0) + transaction['amount']  # NOQA
+        assert merchant_totals(records) == expected
+        assert category_totals(records) == {
+            'eating_out': sum(t['amount'] for t in transactions)
+        }
+
+    def test_parquet_and_arrow(self, mock_client, tmpdir):
+        pyarrow = pytest.importorskip('pyarrow')
+        import pyarrow.parquet  # NOQA
+
+        path = os.path.join(str(tmpdir), 'transactions.parquet')
+        assert export_parquet(mock_client, path, batch_size=100) == 250
+        table = pyarrow.parquet.read_table(path)
+        assert table.num_rows == 250
+        assert table.column('amount').to_pylist()[0] == -100
+
+        path = os.path.join(str(tmpdir), 'transactions.arrow')
+        assert export_arrow(mock_client, path, batch_size=100) == 250
+        table = pyarrow.ipc.open_file(path).read_all()
+        assert table.num_rows == 250
+        assert table.column_names[:3] == ['id', 'amount', 'currency']
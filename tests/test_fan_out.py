@@ -0,0 +1,42 @@
+import pytest
+
+from monzo import MonzoClient
+from monzo_mock import MockMonzoServer
+
+ACCOUNT_IDS = ['acc_{0:03d}'.format(i) for i in range(20)]
+
+
+@pytest.yield_fixture(scope='module')
+def server():
+    with MockMonzoServer(account_ids=ACCOUNT_IDS, transactions=5) as server:
+        yield server
+
+
+@pytest.fixture()
+def client(server):
+    client = MonzoClient(access_token='mock', account_id='acc_000')
+    client.api_url = server.url
+    return client
+
+
+class TestFanOut:
+
+    def test_get_balances(self, client):
+        balances = client.get_balances(ACCOUNT_IDS, max_workers=5)
+        assert sorted(balances['results']) == ACCOUNT_IDS
+        assert balances['errors'] == {}
+        assert client.account_id == 'acc_000'
+
+    def test_get_balances_reports_errors(self, client):
+        balances = client.get_balances(ACCOUNT_IDS + ['acc_missing'])
+        assert len(balances['results']) == len(ACCOUNT_IDS)
+        assert list(balances['errors']) == ['acc_missing']
+
+    def test_list_transactions_many(self, client):
+        transactions = client.list_transactions_many(ACCOUNT_IDS, limit=3)
+        results = transactions['results']
+        assert sorted(results) == ACCOUNT_IDS
+        for account_id, account_transactions in results.items():
+            assert len(account_transactions) == 3
+            assert account_transactions[0]['account_id'] == account_id
+        assert client.account_id == 'acc_000'
@@ -0,0 +1,115 @@
+import itertools
+import socket as socketlib
+
+import pytest
+import requests
+
+from monzo_feed import (
+    FEED_RETRY_STATUSES, FeedPublisher, feed_item_data, not_sent,
+)
+from monzo_ratelimit import RetryPolicy
+
+
+def specs(count, **extra):
+    for i in range(count):
+        spec = {'title': 'Statement {0}'.format(i), 'image_url': 'https://example.com/logo.png'}  # NOQA
+        spec.update(extra)
+        yield spec
+
+
+class TestFeedItemData:
+
+    def test_form(self):
+        data = feed_item_data({
+            'title': 'Hi', 'image_url': 'https://example.com/i.png',
+            'url': 'https://example.com', 'body': None,
+        }, 'acc_1')
+        assert data == {
+            'account_id': 'acc_1',
+            'type': 'basic',
+            'params[title]': 'Hi',
+            'params[image_url]': 'https://example.com/i.png',
+            'url': 'https://example.com',
+        }
+
+    def test_create_feed_item_sends_url(self, mock_client, mock_server):
+        mock_client.create_feed_item('Hi', 'https://example.com/i.png', url='https://example.com/open')  # NOQA
+        assert mock_server.httpd.feed['acc_mock'][-1]['url'] == 'https://example.com/open'  # NOQA
+
+
+class TestCreateFeedItems:
+
+    def test_publishes_generator(self, mock_client, mock_server):
+        before = len(mock_server.httpd.feed.get('acc_mock', []))
+        progress = []
+        stats = mock_client.create_feed_items(
+            specs(200), max_workers=4, max_pending=8, progress=progress.append,  # NOQA
+        )
+        assert stats['sent'] == 200
+        assert stats['failed'] == 0
+        assert stats['per_second'] > 0
+        assert progress[-1]['sent'] == 200
+        assert len(mock_server.httpd.feed['acc_mock']) - before == 200
+
+    def test_reads_input_lazily(self, mock_client):
+        read = []
+
+        def items():
+            for spec in specs(1000):
+                read.append(spec)
+                yield spec
+
+        stats = []
+        publisher = FeedPublisher(
+            mock_client, max_workers=2, max_pending=4,
+            progress=lambda s: stats.append((s['sent'], len(read))),
+            progress_interval=0,
+        )
+        publisher.publish(itertools.islice(items(), 100))
+        # Never more than the queue plus the items being posted read ahead
+        assert all(sent_read[1] - sent_read[0] <= 4 + 2 + 1 for sent_read in stats)  # NOQA
+
+    def test_retries_and_failures(self, mock_client, mock_server):
+        mock_server.inject_errors(503, count=3)
+        publisher = FeedPublisher(
+            mock_client, max_workers=2,
+            retry_policy=RetryPolicy(backoff=0, statuses=(503,), methods=('POST',)),  # NOQA
+        )
+        mock_server.inject_errors(400)  # Not worth retrying
+        stats = publisher.publish(specs(10))
+        assert stats['sent'] == 9
+        assert stats['retries'] == 3
+        assert stats['failed'] == 1
+        assert stats['failures'][0]['error'].response.status_code == 400
+
+    def test_retries_only_unsent(self, mock_client, mock_server):
+        for status in (503, 500, None):
+            mock_server.inject_errors(status)
+        policy = RetryPolicy(
+            backoff=0, statuses=FEED_RETRY_STATUSES, methods=('POST',)
+        )
+        stats = mock_client.create_feed_items(
+            specs(3), max_workers=1, retry_policy=policy,
+        )
+        # The 503 is retried, the 500 and dropped connection may have
+        # created the item already
+        assert (stats['sent'], stats['retries'], stats['failed']) == (1, 1, 2)
+        assert FeedPublisher(mock_client).retry_policy.statuses == (429, 503)
+
+    def test_not_sent(self):
+        socket = socketlib.socket()
+        socket.bind(('127.0.0.1', 0))
+        port = socket.getsockname()[1]
+        socket.close()  # Nothing listens here any more
+        with pytest.raises(requests.ConnectionError) as refused:
+            requests.post('http://127.0.0.1:{0}/feed'.format(port))
+        assert not_sent(refused.value)
+        assert not not_sent(requests.ConnectionError('Connection aborted.'))
+        assert not not_sent(ValueError())
+
+    def test_other_tokens(self, mock_client, mock_server):
+        stats = mock_client.create_feed_items(
+            specs(5, access_token='other', account_id='acc_other'),
+        )
+        assert stats['sent'] == 5
+        assert len(mock_server.httpd.feed['acc_other']) == 5
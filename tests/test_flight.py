@@ -0,0 +1,170 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+
+from monzo import MonzoClient
+from monzo_cache import ResponseCache
+from monzo_flight import AsyncSingleFlight, SingleFlight
+from monzo_metrics import MetricsCollector
+from monzo_mock import MockMonzoServer
+
+CALLERS = 10
+
+
+@pytest.fixture(scope='module')
+def slow_server():
+    with MockMonzoServer(latency=0.2, transactions=20) as server:
+        yield server
+
+
+def make_client(server, **kwargs):
+    client = MonzoClient(
+        access_token='mock', account_id='acc_mock', pool_maxsize=CALLERS,
+        single_flight=SingleFlight(), **kwargs
+    )
+    client.api_url = server.url
+    return client
+
+
+def concurrently(call, callers=CALLERS):
+    """ Start callers threads together, returns results and errors """
+    barrier = threading.Barrier(callers)
+    results = []
+    errors = []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(call())
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=worker) for __ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class TestSingleFlight:
+
+    def test_shares_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            threading.Event().wait(0.2)
+            return {'balance': 5}
+
+        results, errors = concurrently(lambda: flight.do('key', fetch))
+        assert not errors
+        assert len(calls) == 1
+        assert flight.calls == 1 and flight.coalesced == CALLERS - 1
+        assert sorted(shared for __, shared in results) == [False] + [True] * (CALLERS - 1)  # NOQA
+        assert len(set(id(result) for result, __ in results)) == 1
+        assert len(flight) == 0
+
+    def test_error_shared(self):
+        flight = SingleFlight()
+
+        def fetch():
+            threading.Event().wait(0.1)
+            raise ValueError('boom')
+
+        results, errors = concurrently(lambda: flight.do('key', fetch))
+        assert not results
+        assert len(errors) == CALLERS
+        assert flight.calls + flight.coalesced == CALLERS
+        assert len(flight) == 0
+        # Nothing is remembered once the call finishes
+        assert flight.do('key', lambda: 1) == (1, False)
+
+    def test_async(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {'id': 'tx_1'}
+
+        async def main():
+            return await asyncio.gather(*[
+                flight.do('key', fetch) for __ in range(CALLERS)
+            ])
+
+        results = asyncio.new_event_loop().run_until_complete(main())
+        assert len(calls) == 1
+        assert flight.coalesced == CALLERS - 1
+        assert [shared for __, shared in results] == [False] + [True] * (CALLERS - 1)  # NOQA
+        assert len(flight) == 0
+
+    def test_async_cancelled_waiter(self):
+        flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        async def main():
+            first = asyncio.ensure_future(flight.do('key', fetch))
+            second = asyncio.ensure_future(flight.do('key', fetch))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        result = asyncio.new_event_loop().run_until_complete(main())
+        assert result == ('done', True)
+
+
+class TestClientSingleFlight:
+
+    def test_get_balance_burst(self, slow_server):
+        client = make_client(slow_server)
+        before = slow_server.request_count
+        results, errors = concurrently(client.get_balance)
+        assert not errors
+        assert slow_server.request_count - before == 1
+        assert client.single_flight.coalesced == CALLERS - 1
+        assert all(result == results[0] for result in results)
+
+    def test_scoped_per_token(self, slow_server):
+        client = make_client(slow_server)
+        other = client.with_token('other')
+        clients = [client, other] * (CALLERS // 2)
+        before = slow_server.request_count
+        results, errors = concurrently(lambda: clients.pop().whoami())
+        assert not errors
+        assert slow_server.request_count - before == 2
+
+    def test_raw_not_shared_with_decoded(self, slow_server):
+        client = make_client(slow_server)
+        results, errors = concurrently(
+            lambda: client.whoami(raw=True), callers=2,
+        )
+        results += concurrently(client.whoami, callers=2)[0]
+        assert sorted(type(result).__name__ for result in results) == ['bytes', 'bytes', 'dict', 'dict']  # NOQA
+
+    def test_behind_cache_and_hooks(self, slow_server):
+        collector = MetricsCollector()
+        client = make_client(slow_server, cache=ResponseCache(), hooks=[collector])  # NOQA
+        transaction_id = slow_server.accounts['acc_mock'][0]['id']
+        before = slow_server.request_count
+        concurrently(lambda: client.get_transaction(transaction_id))
+        assert slow_server.request_count - before == 1
+        assert collector.coalesced_calls == {'transactions/{id}': CALLERS - 1}
+        assert 'monzo_coalesced_total{endpoint="transactions/{id}"} 9' in collector.prometheus()  # NOQA
+
+    def test_errors_shared(self):
+        with MockMonzoServer(latency=0.2, error_rate=1, error_status=404) as server:  # NOQA
+            client = make_client(server)
+            client.retry_policy = None
+            before = server.request_count
+            results, errors = concurrently(client.whoami)
+        assert server.request_count - before == 1
+        assert len(errors) == CALLERS
+        assert all(isinstance(error, requests.HTTPError) for error in errors)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from monzo import MonzoClient
+from monzo_cache import ResponseCache
+from monzo_json import DECODERS, available_decoders, get_decoder, loads
+
+
+class TestDecoders:
+
+    def test_every_installed_decoder(self):
+        body = json.dumps({'transactions': [{'id': 'tx_1', 'amount': -100, 'description': u'Caf\xe9'}]}).encode('utf-8')  # NOQA
+        assert 'json' in available_decoders()
+        for name in available_decoders():
+            assert get_decoder(name)[1](body) == json.loads(body.decode('utf-8'))  # NOQA
+
+    def test_default_is_fastest_installed(self):
+        name, decoder = get_decoder()
+        assert name == available_decoders()[0]
+        assert list(DECODERS).index(name) <= list(DECODERS).index('json')
+        assert loads(b'{"a": 1}') == {'a': 1}
+
+    def test_missing_decoder(self):
+        DECODERS['missing'] = lambda: __import__('no_such_json_module')
+        try:
+            with pytest.raises(ImportError):
+                get_decoder('missing')
+            assert 'missing' not in available_decoders()
+        finally:
+            del DECODERS['missing']
+
+
+class TestRaw:
+
+    def test_custom_decoder(self, mock_server):
+        decoded = []
+
+        def decoder(body):
+            decoded.append(body)
+            return json.loads(body.decode('utf-8'))
+
+        client = MonzoClient(access_token='mock', account_id='acc_mock', json_decoder=decoder)  # NOQA
+        client.api_url = mock_server.url
+        assert client.get_balance()['balance'] == 5000
+        assert isinstance(decoded[0], bytes)
+
+    def test_raw_bytes(self, mock_client):
+        body = mock_client.list_transactions(limit=20, raw=True)
+        assert isinstance(body, bytes)
+        assert json.loads(body.decode('utf-8'))['transactions'] == mock_client.list_transactions(limit=20)  # NOQA
+        transaction_id = json.loads(body.decode('utf-8'))['transactions'][0]['id']  # NOQA
+        assert b'"transaction"' in mock_client.get_transaction(transaction_id, raw=True)  # NOQA
+        assert b'"balance"' in mock_client.get_balance(raw=True)
+        assert b'"webhooks"' in mock_client.list_webhooks(raw=True)
+        assert b'"accounts"' in mock_client.list_accounts(raw=True)
+
+    def test_raw_skips_cache(self, mock_server):
+        client = MonzoClient(access_token='mock', account_id='acc_mock', cache=ResponseCache())  # NOQA
+        client.api_url = mock_server.url
+        client.get_balance()
+        client.get_balance(raw=True)
+        client.get_balance()
+        assert (client.cache.hits, client.cache.misses) == (1, 1)
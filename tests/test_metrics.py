@@ -0,0 +1,119 @@
+import json
+
+import pytest
+import requests
+
+from monzo import MonzoClient
+from monzo_cache import ResponseCache
+from monzo_metrics import Histogram, Hook, MetricsCollector
+from monzo_ratelimit import RetryPolicy
+
+
+@pytest.fixture()
+def metrics():
+    return MetricsCollector()
+
+
+@pytest.fixture()
+def hooked_client(mock_server, metrics):
+    client = MonzoClient(
+        access_token='mock',
+        account_id='acc_mock',
+        cache=ResponseCache(),
+        retry_policy=RetryPolicy(backoff=0),
+        hooks=[metrics],
+    )
+    client.api_url = mock_server.url
+    return client
+
+
+class Recorder(Hook):
+
+    def __init__(self):
+        self.calls = []
+
+    def before_request(self, event):
+        self.calls.append(('before', event['endpoint']))
+
+    def after_response(self, event, response):
+        self.calls.append(('after', response.status_code))
+
+    def on_error(self, event, error):
+        self.calls.append(('error', type(error).__name__))
+
+
+class TestHooks:
+
+    def test_callbacks(self, mock_server):
+        recorder = Recorder()
+        client = MonzoClient(access_token='mock', hooks=[recorder])
+        client.api_url = mock_server.url
+        client.get_balance('acc_mock')
+        with pytest.raises(requests.HTTPError):
+            client.get_transaction('tx_unknown')
+        assert recorder.calls == [
+            ('before', 'balance'), ('after', 200),
+            ('before', 'transactions/{id}'), ('after', 404),
+            ('error', 'HTTPError'),
+        ]
+
+
+class TestMetricsCollector:
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1]
+        assert histogram.cumulative() == [2, 3, 4]
+        assert histogram.count == 4
+
+    def test_collects(self, hooked_client, mock_server, metrics):
+        transaction_id = mock_server.accounts['acc_mock'][0]['id']
+        for __ in range(3):
+            hooked_client.get_transaction(transaction_id)
+        hooked_client.get_balance()
+        mock_server.inject_errors(503)
+        hooked_client.list_transactions(limit=5)
+        hooked_client.annotate_transaction(transaction_id, {'tag': 'x'})
+
+        assert metrics.latency[('GET', 'transactions/{id}')].count == 1
+        assert metrics.cache_hits == {'transactions/{id}': 2}
+        assert metrics.statuses[('GET', 'transactions', 200)] == 1
+        assert metrics.statuses[('PATCH', 'transactions/{id}', 200)] == 1
+        assert metrics.retries == 1
+        assert metrics.bytes_sent > 0
+        assert metrics.bytes_received > 1000
+
+    def test_refreshes(self, mock_server, metrics):
+        mock_server.httpd.refresh_tokens.add('refresh_0')
+        client = MonzoClient(
+            access_token='access_0', refresh_token='refresh_0',
+            hooks=[metrics],
+        )
+        client.token_url = mock_server.url + 'oauth2/token'
+        client.refresh_access_token()
+        assert metrics.refreshes == 1
+
+    def test_prometheus(self, hooked_client, metrics):
+        hooked_client.get_balance()
+        text = metrics.prometheus()
+        assert '# TYPE monzo_request_duration_seconds histogram' in text
+        assert 'monzo_request_duration_seconds_bucket{method="GET",endpoint="balance",le="+Inf"} 1' in text  # NOQA
+        assert 'monzo_request_duration_seconds_count{method="GET",endpoint="balance"} 1' in text  # NOQA
+        assert 'monzo_responses_total{method="GET",endpoint="balance",status="200"} 1' in text  # NOQA
+        assert 'monzo_token_refreshes_total 0' in text
+
+    def test_otlp(self, hooked_client, metrics):
+        hooked_client.get_balance()
+        export = json.loads(json.dumps(metrics.otlp()))
+        metrics_by_name = dict(
+            (metric['name'], metric)
+            for metric in export['resourceMetrics'][0]['scopeMetrics'][0]['metrics']  # NOQA
+        )
+        point = metrics_by_name['monzo.client.duration']['histogram']['dataPoints'][0]  # NOQA
+        assert point['count'] == '1'
+        assert len(point['bucketCounts']) == len(point['explicitBounds']) + 1
+        responses = metrics_by_name['monzo.client.responses']['sum']
+        assert responses['isMonotonic']
+        assert responses['dataPoints'][0]['asInt'] == '1'
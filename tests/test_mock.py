@@ -0,0 +1,74 @@
+import pytest
+import requests
+
+from monzo import MonzoClient
+from monzo_mock import FixtureRecorder, MockMonzoServer
+
+
+def make_client(server, **kwargs):
+    client = MonzoClient(access_token='mock', account_id='acc_mock', **kwargs)
+    client.api_url = server.url
+    client.token_url = server.url + 'oauth2/token'
+    return client
+
+
+class TestMockMonzoServer:
+
+    def test_rate_limit(self):
+        with MockMonzoServer(rate_limit=5) as server:
+            client = make_client(server)
+            statuses = []
+            for __ in range(10):
+                try:
+                    client.get_balance()
+                    statuses.append(200)
+                except requests.HTTPError as error:
+                    statuses.append(error.response.status_code)
+                    assert error.response.headers['Retry-After'] == '1'
+        assert statuses.count(429) == server.throttled
+        assert server.throttled >= 4  # Unless the second ticked over
+
+    def test_error_rate(self):
+        with MockMonzoServer(error_rate=0.5, error_status=500, seed=1) as server:  # NOQA
+            client = make_client(server)
+            failed = 0
+            for __ in range(40):
+                try:
+                    client.whoami()
+                except requests.HTTPError:
+                    failed += 1
+        assert 5 < failed < 35
+
+    def test_large_dataset(self):
+        with MockMonzoServer(transactions=20000, account_ids=('acc_mock', 'acc_2')) as server:  # NOQA
+            client = make_client(server)
+            transactions = list(client.iter_transactions(page_size=1000))
+            assert len(transactions) == 20000
+            assert client.get_transaction('tx_00019999')['account_id'] == 'acc_mock'  # NOQA
+            window = client.list_transactions(
+                since='2016-01-01T01:00:00Z', before='2016-01-01T02:00:00Z'
+            )
+            assert len(window) == 60
+
+    def test_record_and_replay(self, tmpdir):
+        recorder = FixtureRecorder()
+        with MockMonzoServer(account_ids=('acc_live',)) as live:
+            client = make_client(live, hooks=[recorder])
+            client.refresh_access_token('refresh_0')
+            client.get_balance('acc_live')
+            client.list_transactions('acc_live', limit=5)
+            with pytest.raises(requests.HTTPError):
+                client.get_transaction('tx_missing')
+        path = str(tmpdir.join('fixtures.json'))
+        recorder.save(path)
+        assert recorder.fixtures[0]['body']['access_token'] == 'recorded_access_token'  # NOQA
+
+        with MockMonzoServer(fixtures=path) as replay:
+            client = make_client(replay)
+            assert client.get_balance('acc_live')['balance'] == 5000
+            transactions = client.list_transactions('acc_live', limit=5)
+            assert [t['account_id'] for t in transactions] == ['acc_live'] * 5  # NOQA
+            with pytest.raises(requests.HTTPError):
+                client.get_transaction('tx_missing')
+            # Requests which were not recorded get the synthetic responses
+            assert client.list_transactions('acc_mock', limit=1)
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from monzo_models import Balance, Merchant, Transaction, parse_timestamp
+
+TRANSACTION = {
+    'id': 'tx_1',
+    'account_id': 'acc_1',
+    'amount': -510,
+    'currency': 'GBP',
+    'created': '2016-01-01T12:30:00.123Z',
+    'settled': '2016-01-02T06:00:00Z',
+    'category': 'eating_out',
+    'description': 'PRET',
+    'merchant': {'id': 'merch_1', 'name': 'Pret'},
+    'metadata': {},
+    'counterparty': {},
+}
+
+
+class TestModels:
+
+    def test_transaction(self):
+        transaction = Transaction.from_dict(TRANSACTION)
+        assert transaction.amount == -510
+        assert transaction.merchant_id == 'merch_1'
+        assert transaction.merchant.name == 'Pret'
+        assert transaction.is_settled
+        assert transaction.extra == {'counterparty': {}}
+        assert not hasattr(transaction, '__dict__')
+
+    def test_created_at_is_lazy(self):
+        transaction = Transaction.from_dict(TRANSACTION)
+        assert transaction._created_at is None
+        assert transaction.created_at == datetime(2016, 1, 1, 12, 30, 0, 123000)  # NOQA
+        assert parse_timestamp('2016-01-01T12:30:00Z') == datetime(2016, 1, 1, 12, 30)  # NOQA
+
+    def test_raw(self):
+        assert Transaction.from_dict(TRANSACTION).raw == TRANSACTION
+
+    def test_merchants_are_shared(self):
+        first = Transaction.from_dict(TRANSACTION)
+        second = Transaction.from_dict(dict(TRANSACTION, id='tx_2'))
+        assert first.merchant is second.merchant
+        assert Merchant.intern({'id': 'merch_1'}) is first.merchant
+
+    def test_balance(self):
+        balance = Balance.from_dict({'balance': 5000, 'currency': 'GBP', 'spend_today': 0})  # NOQA
+        assert balance.balance == 5000
+        assert balance.raw == {'balance': 5000, 'currency': 'GBP', 'spend_today': 0}  # NOQA
+
+
+class TestClientModels:
+
+    def test_list_transactions(self, mock_client):
+        transactions = mock_client.list_transactions(limit=10, models=True)
+        assert all(isinstance(t, Transaction) for t in transactions)
+        assert transactions[0].raw == mock_client.list_transactions(limit=1)[0]  # NOQA
+
+    def test_get_transaction(self, mock_client):
+        transaction = mock_client.get_transaction('tx_00000003', models=True)
+        assert transaction.id == 'tx_00000003'
+        assert isinstance(transaction.merchant, Merchant)
+
+    def test_iter_transactions(self, mock_client):
+        transactions = list(mock_client.iter_transactions(page_size=100, models=True))  # NOQA
+        assert len(transactions) == 250
+        assert len(set(id(t.merchant) for t in transactions)) == 50
@@ -32,7 +32,7 @@ def add_attachment(client):
     transactions = client.list_transactions()
     transaction_id = transactions[0]['id']
     base_dir = os.path.dirname(__file__)
-    file_path = '{0}/monzo-logo.png'.format(base_dir)
+    file_path = '{0}/mondo-logo.png'.format(base_dir)
     file_upload = client.upload_attachment(file_path)
     attachment = client.attach_file(
         transaction_id,
@@ -165,7 +165,7 @@ class TestMonzoClient:
         transaction_id = transactions[0]['id']
 
         base_dir = os.path.dirname(__file__)
-        file_path = '{0}/monzo-logo.png'.format(base_dir)
+        file_path = '{0}/mondo-logo.png'.format(base_dir)
         file_upload = client.upload_attachment(file_path)
         assert file_upload['file_type'] == 'image/png'
         assert 'file_url' in file_upload
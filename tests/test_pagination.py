@@ -0,0 +1,24 @@
+class TestIterTransactions:
+
+    def test_iter_transactions(self, mock_client):
+        transactions = list(mock_client.iter_transactions(page_size=100))
+        ids = [transaction['id'] for transaction in transactions]
+        assert len(ids) == 250
+        assert len(set(ids)) == 250
+        assert ids == sorted(ids)
+
+    def test_iter_transactions_prefetch(self, mock_client):
+        plain = list(mock_client.iter_transactions(page_size=50))
+        prefetched = list(mock_client.iter_transactions(page_size=50, prefetch=True))  # NOQA
+        assert prefetched == plain
+
+    def test_iter_transactions_since(self, mock_client):
+        transactions = mock_client.iter_transactions(since='tx_00000199', page_size=20)  # NOQA
+        assert [t['id'] for t in transactions][0] == 'tx_00000200'
+
+    def test_iter_transactions_exact_pages(self, mock_client, mock_server):
+        before = mock_server.request_count
+        transactions = list(mock_client.iter_transactions(page_size=125))
+        assert len(transactions) == 250
+        # Two full pages then an empty one to confirm the end
+        assert mock_server.request_count - before == 3
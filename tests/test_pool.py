@@ -0,0 +1,84 @@
+import threading
+
+from monzo_endpoints import token_scope
+from monzo_pool import MonzoClientPool
+from monzo_ratelimit import RateLimiter
+from monzo_tokens import CallbackTokenStore, format_expires_at
+
+
+def make_pool(mock_server, **kwargs):
+    return MonzoClientPool(
+        client_id='oauthclient_mock', api_url=mock_server.url,
+        token_url=mock_server.url + 'oauth2/token', **kwargs
+    )
+
+
+class TestMonzoClientPool:
+
+    def test_isolated_clients_share_session(self, mock_server):
+        pool = make_pool(mock_server)
+        alice = pool.get('alice', access_token='token_a')
+        bob = pool.get('bob', access_token='token_b', account_id='acc_b')
+        assert alice is not bob
+        assert alice.session is bob.session is pool.session
+        assert (alice.access_token, bob.access_token) == ('token_a', 'token_b')  # NOQA
+        assert (alice.account_id, bob.account_id) == ('acc_mock', 'acc_b')
+        assert pool.get('alice', access_token='token_a') is alice
+
+    def test_account_looked_up_once(self, mock_server):
+        pool = make_pool(mock_server, max_clients=2)
+        before = mock_server.request_count
+        threads = [
+            threading.Thread(target=pool.get, args=('alice',), kwargs={'access_token': 'a'})  # NOQA
+            for __ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert pool.account_lookups == 1
+        assert mock_server.request_count - before == 1
+
+        # Evicted clients come back without another lookup
+        pool.get('bob', access_token='b', account_id='acc_b')
+        pool.get('carol', access_token='c', account_id='acc_c')
+        assert 'alice' not in pool and pool.evicted == 1
+        assert pool.get('alice', access_token='a').account_id == 'acc_mock'
+        assert pool.account_lookups == 1
+        assert len(pool) == 2
+
+    def test_eviction_drops_rate_limit_buckets(self, mock_server):
+        limiter = RateLimiter()
+        pool = make_pool(mock_server, max_clients=1, rate_limiter=limiter)
+        pool.get('alice', access_token='a', account_id='acc_mock').whoami()
+        assert (token_scope('a'), None) in limiter.buckets
+        pool.get('bob', access_token='b', account_id='acc_mock').whoami()
+        assert 'alice' not in pool
+        assert list(limiter.buckets) == [(token_scope('b'), None)]
+        pool.discard('bob')
+        assert not limiter.buckets
+
+    def test_default_tenant_and_newer_tokens(self, mock_server):
+        pool = make_pool(mock_server)
+        client = pool.get(access_token='old', refresh_token='r', account_id='acc_mock')  # NOQA
+        assert pool.get(access_token='old', refresh_token='r') is client
+        pool.get('t', access_token='old', expires_at=format_expires_at(2e9))
+        pool.get('t', access_token='older', expires_at=format_expires_at(1e9))
+        assert pool.get('t').access_token == 'old'
+        pool.get('t', access_token='new', expires_at=format_expires_at(3e9))
+        assert pool.get('t').access_token == 'new'
+
+    def test_token_store_per_tenant(self, mock_server):
+        saved = {}
+        pool = make_pool(
+            mock_server,
+            token_store=lambda tenant: CallbackTokenStore(
+                lambda: saved.get(tenant),
+                lambda tokens: saved.__setitem__(tenant, tokens),
+            ),
+        )
+        mock_server.httpd.refresh_tokens.add('refresh_pool')
+        client = pool.get('alice', access_token='a', refresh_token='refresh_pool', account_id='acc_mock')  # NOQA
+        client.refresh_access_token()
+        pool.discard('alice')
+        assert pool.get('alice').access_token == saved['alice']['access_token']  # NOQA
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+import requests
+
+from monzo import MonzoClient
+from monzo_endpoints import token_scope
+from monzo_ratelimit import RateLimiter, RetryPolicy, TokenBucket
+
+
+@pytest.fixture()
+def make_client(mock_server):
+    def make_client(**kwargs):
+        client = MonzoClient(access_token='mock', account_id='acc_mock', **kwargs)  # NOQA
+        client.api_url = mock_server.url
+        return client
+    yield make_client
+    del mock_server.httpd.errors[:]
+
+
+class TestTokenBucket:
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        assert [bucket.reserve() for __ in range(5)] == [0] * 5
+        assert 0.005 < bucket.reserve() <= 0.011
+
+    def test_block(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        bucket.block(1)
+        assert bucket.reserve() > 0.9
+
+
+class TestRateLimiter:
+
+    def test_throttles_per_token(self, make_client):
+        limiter = RateLimiter(rate=50, burst=2)
+        client = make_client(rate_limiter=limiter)
+        started = time.time()
+        for __ in range(7):
+            client.whoami()
+        assert time.time() - started >= 0.09
+        assert limiter.throttled == 5
+
+        # Another token has its own bucket
+        other = make_client(rate_limiter=limiter)
+        other.access_token = 'other'
+        other.whoami()
+        assert limiter.throttled == 5
+
+    def test_endpoint_limits(self, make_client):
+        # Slow enough that the second balance call is always throttled
+        limiter = RateLimiter(rate=1000, burst=100, limits={'balance': (5, 1)})  # NOQA
+        client = make_client(rate_limiter=limiter)
+        client.whoami()
+        client.whoami()
+        client.get_balance()
+        assert limiter.throttled == 0
+        client.get_balance()
+        assert limiter.throttled == 1
+
+    def test_bounded_and_discard(self):
+        limiter = RateLimiter(limits={'balance': (1, 1)}, max_buckets=3)
+        for token in ('a', 'b', 'c', 'd'):
+            limiter.acquire(token, 'accounts')
+        assert len(limiter.buckets) == 3
+        limiter.acquire('d', 'balance')
+        assert len(limiter.buckets) == 3
+        limiter.discard('d')
+        assert list(limiter.buckets) == [(token_scope('c'), None)]
+
+
+class TestRetryPolicy:
+
+    def test_retries_429_with_retry_after(self, make_client, mock_server):
+        policy = RetryPolicy(backoff=0.01)
+        limiter = RateLimiter(rate=1000, burst=100)
+        client = make_client(retry_policy=policy, rate_limiter=limiter)
+        mock_server.inject_errors(429, count=2, retry_after='0.05')
+        started = time.time()
+        assert client.whoami()['authenticated']
+        assert time.time() - started >= 0.1
+        assert policy.retries == 2
+        assert limiter.throttled == 2
+
+    def test_retries_connection_reset(self, make_client, mock_server):
+        policy = RetryPolicy(backoff=0.01)
+        client = make_client(retry_policy=policy)
+        mock_server.inject_errors(None)
+        assert client.get_balance()['currency'] == 'GBP'
+        assert policy.retries == 1
+
+    def test_gives_up(self, make_client, mock_server):
+        client = make_client(retry_policy=RetryPolicy(max_retries=1, backoff=0.01))  # NOQA
+        mock_server.inject_errors(503, count=2)
+        with pytest.raises(requests.HTTPError):
+            client.whoami()
+
+    def test_post_not_retried(self, make_client, mock_server):
+        policy = RetryPolicy(backoff=0.01)
+        client = make_client(retry_policy=policy)
+        mock_server.inject_errors(503)
+        with pytest.raises(requests.HTTPError):
+            client.create_webhook('http://example.com/hook')
+        assert policy.retries == 0
+
+    def test_post_opt_in(self, make_client, mock_server):
+        policy = RetryPolicy(backoff=0.01)
+        client = make_client(retry_policy=policy)
+        mock_server.inject_errors(503)
+        url = mock_server.url + 'webhooks'
+        data = {'account_id': 'acc_mock', 'url': 'http://example.com/hook'}
+        webhook = client.request(url=url, method='POST', data=data, retry=True)  # NOQA
+        assert webhook['webhook']['url'] == data['url']
+        assert policy.retries == 1
@@ -0,0 +1,209 @@
+import time
+import threading
+
+import pytest
+import requests
+
+from monzo import MonzoClient
+from monzo_metrics import MetricsCollector
+from monzo_mock import MockMonzoServer
+from monzo_resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, HedgePolicy,
+)
+
+
+class SlowFirstSession(object):
+    """ The first request takes slow seconds, the rest answer at once """
+
+    def __init__(self, slow=0.5, error=None):
+        self.slow = slow
+        self.error = error  # Raised by the first request once it is done
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def request(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            time.sleep(self.slow)
+            if self.error is not None:
+                raise self.error
+        response = requests.Response()
+        response.status_code = 200
+        response._content = '{{"balance": {0}}}'.format(call).encode('utf-8')
+        response.request = requests.Request(kwargs['method'], kwargs['url']).prepare()  # NOQA
+        return response
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        assert breaker.allow('balance') is None
+        assert breaker.record('balance', False) is None
+        assert breaker.record('balance', False) is None
+        assert breaker.record('balance', False) == OPEN
+        with pytest.raises(CircuitOpenError) as error:
+            breaker.allow('balance')
+        assert error.value.endpoint == 'balance'
+        assert breaker.rejected == 1 and breaker.opened == 1
+        # Other endpoints have their own circuit
+        assert breaker.allow('accounts') is None
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record('balance', False)
+        breaker.record('balance', True)
+        assert breaker.record('balance', False) is None
+        assert breaker.state('balance') == CLOSED
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record('balance', False)
+        time.sleep(0.06)
+        assert breaker.allow('balance') == HALF_OPEN
+        with pytest.raises(CircuitOpenError):  # Only one probe at a time
+            breaker.allow('balance')
+        assert breaker.record('balance', False) == OPEN
+        time.sleep(0.06)
+        assert breaker.allow('balance') == HALF_OPEN
+        assert breaker.record('balance', True) == CLOSED
+        assert breaker.allow('balance') is None
+
+    def test_whole_api(self):
+        breaker = CircuitBreaker(failure_threshold=1, per_endpoint=False)
+        breaker.record('balance', False)
+        with pytest.raises(CircuitOpenError):
+            breaker.allow('accounts')
+        assert breaker.states() == {'*': OPEN}
+
+
+class TestClientCircuitBreaker:
+
+    def test_fails_fast_and_recovers(self):
+        collector = MetricsCollector()
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+        with MockMonzoServer(error_rate=1, error_status=503) as server:
+            client = MonzoClient(
+                access_token='mock', account_id='acc_mock',
+                circuit_breaker=breaker, hooks=[collector],
+            )
+            client.api_url = server.url
+            for __ in range(3):
+                with pytest.raises(requests.HTTPError):
+                    client.whoami()
+            before = server.request_count
+            with pytest.raises(CircuitOpenError):
+                client.whoami()
+            assert server.request_count == before
+            assert collector.circuits == {'ping/whoami': OPEN}
+
+            server.httpd.error_rate = 0
+            time.sleep(0.25)
+            assert client.whoami()['authenticated']
+        assert breaker.state('ping/whoami') == CLOSED
+        assert collector.circuit_changes == {
+            ('ping/whoami', OPEN): 1,
+            ('ping/whoami', HALF_OPEN): 1,
+            ('ping/whoami', CLOSED): 1,
+        }
+        text = collector.prometheus()
+        assert 'monzo_circuit_state{circuit="ping/whoami",state="closed"} 1' in text  # NOQA
+        assert 'monzo_circuit_state{circuit="ping/whoami",state="open"} 0' in text  # NOQA
+
+    def test_client_errors_do_not_open(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        with MockMonzoServer() as server:
+            client = MonzoClient(access_token='mock', circuit_breaker=breaker)
+            client.api_url = server.url
+            with pytest.raises(requests.HTTPError):
+                client.get_transaction('tx_missing')
+        assert breaker.state('transactions/{id}') == CLOSED
+
+
+class TestTimeouts:
+
+    def test_per_endpoint_timeout(self):
+        with MockMonzoServer(latency=0.3) as server:
+            client = MonzoClient(
+                access_token='mock', account_id='acc_mock',
+                timeouts={'ping/whoami': 0.1},
+            )
+            client.api_url = server.url
+            with pytest.raises(requests.Timeout):
+                client.whoami()
+            assert client.get_balance()['currency'] == 'GBP'
+
+    def test_default_timeout(self):
+        assert MonzoClient().timeout == (5, 30)
+
+
+class TestHedgePolicy:
+
+    def test_hedge_wins(self):
+        collector = MetricsCollector()
+        hedge = HedgePolicy(delay=0.05, budget=1)
+        client = MonzoClient(
+            access_token='mock', account_id='acc_mock',
+            session=SlowFirstSession(slow=2), hedge=hedge, hooks=[collector],
+        )
+        started = time.time()
+        assert client.get_balance() == {'balance': 2}
+        # Answered by the hedge, not after the slow first request
+        assert time.time() - started < 0.5
+        assert collector.hedge_win_rate('accounts') == 0.0
+        assert hedge.hedges == 1 and hedge.wins == 1
+        assert hedge.win_rate() == 1.0
+        assert collector.hedges == {'balance': [1, 1]}
+        assert collector.hedge_win_rate() == 1.0
+        assert 'monzo_hedge_win_ratio{endpoint="balance"} 1.0' in collector.prometheus()  # NOQA
+
+    def test_fast_response_not_hedged(self):
+        session = SlowFirstSession(slow=0)
+        hedge = HedgePolicy(delay=0.05, budget=1)
+        client = MonzoClient(access_token='mock', session=session, hedge=hedge)  # NOQA
+        client.get_balance(account_id='acc_mock')
+        time.sleep(0.1)
+        assert session.calls == 1 and hedge.hedges == 0
+
+    def test_failed_request_falls_back_to_hedge(self):
+        hedge = HedgePolicy(delay=0.05, budget=1)
+        session = SlowFirstSession(slow=0.2, error=requests.ReadTimeout())
+        client = MonzoClient(
+            access_token='mock', session=session, hedge=hedge,
+        )
+        assert client.get_balance(account_id='acc_mock') == {'balance': 2}
+        assert session.calls == 2 and hedge.wins == 1
+
+        session = SlowFirstSession(slow=0, error=requests.ReadTimeout())
+        client = MonzoClient(
+            access_token='mock', session=session, hedge=hedge,
+        )
+        with pytest.raises(requests.ReadTimeout):
+            client.get_balance(account_id='acc_mock')
+
+    def test_budget_and_endpoints(self):
+        session = SlowFirstSession(slow=0.1)
+        client = MonzoClient(
+            access_token='mock', session=session,
+            hedge=HedgePolicy(delay=0.01, budget=0),
+        )
+        client.get_balance(account_id='acc_mock')
+        assert session.calls == 1
+
+        session = SlowFirstSession(slow=0.1)
+        client = MonzoClient(
+            access_token='mock', session=session,
+            hedge=HedgePolicy(delay=0.01, budget=1, endpoints=['accounts']),
+        )
+        client.get_balance(account_id='acc_mock')
+        assert session.calls == 1
+
+    def test_delay_follows_percentile(self):
+        hedge = HedgePolicy(delay=1, min_samples=20)
+        for sample in range(19):
+            hedge.observe('balance', sample / 100.0)
+        assert hedge.hedge_after('balance') == 1
+        hedge.observe('balance', 0.19)
+        assert hedge.hedge_after('balance') == pytest.approx(0.18)
@@ -0,0 +1,27 @@
+import os
+import sys
+import json
+import subprocess
+
+from monzo import MonzoClient
+
+MONZO_DIR = os.path.join(os.path.dirname(__file__), '..', 'monzo')
+
+
+def test_import_does_not_load_requests():
+    env = dict(os.environ, PYTHONPATH=MONZO_DIR)
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, json, monzo; '
+        'print(json.dumps([m in sys.modules for m in ("requests", "monzo_json")]))',  # NOQA
+    ], env=env)
+    assert json.loads(output.decode('utf-8')) == [False, False]
+
+
+def test_api_url_rebuilds_endpoint_urls():
+    client = MonzoClient(access_token='token', account_id='acc_1')
+    assert client.urls['whoami'] == 'https://api.monzo.com/ping/whoami'
+    client.api_url = 'http://127.0.0.1:8000'
+    assert client.api_url == 'http://127.0.0.1:8000/'
+    assert client.urls['whoami'] == 'http://127.0.0.1:8000/ping/whoami'
+    assert client.urls['transaction'].format('tx_1') == 'http://127.0.0.1:8000/transactions/tx_1'  # NOQA
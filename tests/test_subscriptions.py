@@ -0,0 +1,236 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+import requests
+
+from monzo import MonzoClient
+from monzo_cache import ResponseCache
+from monzo_mock import MockMonzoServer
+from monzo_subscriptions import AccountCache, WebhookSubscriptions
+from monzo_webhooks import WebhookReceiver
+
+HOOK = 'https://example.com/hook?token=new'
+
+
+def created(transaction_id, amount, account_id='acc_1', **extra):
+    transaction = {
+        'id': transaction_id,
+        'account_id': account_id,
+        'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        'amount': amount,
+        'currency': 'GBP',
+    }
+    transaction.update(extra)
+    return {'type': 'transaction.created', 'data': transaction}
+
+
+@pytest.fixture()
+def server():
+    with MockMonzoServer(account_ids=('acc_1', 'acc_2'), transactions=20) as server:  # NOQA
+        yield server
+
+
+@pytest.fixture()
+def client(server):
+    client = MonzoClient(access_token='mock', account_id='acc_1')
+    client.api_url = server.url
+    return client
+
+
+class TestWebhookSubscriptions:
+
+    def test_reconcile(self, server, client):
+        client._create_webhook('https://example.com/hook?token=old', 'acc_1')
+        client._create_webhook(HOOK, 'acc_1')
+        client._create_webhook(HOOK, 'acc_1')
+        client._create_webhook('https://other.example.com/hook', 'acc_1')
+
+        subscriptions = WebhookSubscriptions(client, HOOK)
+        report = subscriptions.reconcile(['acc_1', 'acc_2'])
+        assert report['errors'] == {}
+        assert report['results']['acc_1'] == {
+            'webhook': 'webhook_000002', 'created': False,
+            'removed': ['webhook_000001', 'webhook_000003'],
+        }
+        assert report['results']['acc_2']['created']
+        assert sorted(w['url'] for w in server.httpd.webhooks.values()) == [
+            HOOK, HOOK, 'https://other.example.com/hook',
+        ]
+        # Idempotent
+        requests = server.request_count
+        again = subscriptions.reconcile(['acc_1', 'acc_2'])['results']
+        assert not any(r['created'] or r['removed'] for r in again.values())
+        assert server.request_count == requests + 2
+        assert client.account_id == 'acc_1'
+
+    def test_unsubscribe(self, server, client):
+        subscriptions = WebhookSubscriptions(client, HOOK)
+        subscriptions.reconcile(['acc_1'])
+        client._create_webhook('https://other.example.com/hook', 'acc_1')
+        assert subscriptions.unsubscribe(['acc_1'])['results'] == {'acc_1': ['webhook_000001']}  # NOQA
+        assert [w['url'] for w in client.list_webhooks()] == ['https://other.example.com/hook']  # NOQA
+
+    def test_leaves_sibling_paths_alone(self, client):
+        subscriptions = WebhookSubscriptions(client, HOOK)
+        webhooks = [
+            {'id': 'webhook_1', 'url': 'https://example.com/hooks/billing'},
+            {'id': 'webhook_2', 'url': 'https://example.com/hook2'},
+            {'id': 'webhook_3', 'url': 'https://example.com/hook/sub'},
+            {'id': 'webhook_4', 'url': 'https://example.com/hook'},
+        ]
+        keep, remove = subscriptions.plan(webhooks)
+        assert keep is None
+        assert [webhook['id'] for webhook in remove] == ['webhook_4']
+        for webhook in webhooks:
+            client._create_webhook(webhook['url'], 'acc_1')
+        removed = subscriptions.unsubscribe(['acc_1'])['results']['acc_1']
+        assert len(removed) == 1
+        assert len(client.list_webhooks()) == 3
+
+
+class TestAccountCache:
+
+    def test_reads_are_served_locally(self, server, client):
+        cache = AccountCache(client, window=None)
+        assert cache.balance('acc_1')['balance'] == 5000
+        assert len(cache.transactions('acc_1')) == 20
+        requests = server.request_count
+        assert cache.balance('acc_1')['balance'] == 5000
+        assert [t['id'] for t in cache.transactions('acc_1', limit=2)] == ['tx_00000018', 'tx_00000019']  # NOQA
+        assert server.request_count == requests
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_events_update_state(self, server, client):
+        cache = AccountCache(client, window=None)
+        cache.balance('acc_1')
+        cache.transactions('acc_1')
+        requests = server.request_count
+        cache([
+            created('tx_new', -250),
+            created('tx_new_2', 1000),
+            created('tx_declined', -99, decline_reason='INSUFFICIENT_FUNDS'),
+            {'type': 'account.updated', 'data': {'id': 'acc_1'}},
+            created('tx_other', -1, account_id='acc_2'),
+        ])
+        balance = cache.balance('acc_1')
+        assert balance['balance'] == 5000 - 250 + 1000
+        assert balance['spend_today'] == -250
+        ids = [t['id'] for t in cache.transactions('acc_1')]
+        assert ids[-3:] == ['tx_new', 'tx_new_2', 'tx_declined']
+        assert len(ids) == 23
+        assert server.request_count == requests
+        assert cache.applied == 4
+        # An account which isn't cached is read from the API when needed
+        assert len(cache.transactions('acc_2')) == 20
+
+    def test_updates_and_old_events(self, client):
+        cache = AccountCache(client, window=None)
+        cache.balance('acc_1')
+        first = cache.transactions('acc_1')[0]
+        # Already counted in the fetched balance and transactions
+        cache([{'type': 'transaction.created', 'data': dict(first, notes='lunch')}])  # NOQA
+        assert cache.balance('acc_1')['balance'] == 5000
+        transactions = cache.transactions('acc_1')
+        assert len(transactions) == 20 and transactions[0]['notes'] == 'lunch'
+
+    def test_bounds_and_expiry(self, server, client):
+        cache = AccountCache(client, window=None, max_accounts=1, max_transactions=5, max_age=0.05)  # NOQA
+        assert len(cache.transactions('acc_1')) == 5
+        cache([created('tx_new', -1)])
+        assert [t['id'] for t in cache.transactions('acc_1')][-2:] == ['tx_00000019', 'tx_new']  # NOQA
+        cache.balance('acc_2')
+        assert len(cache) == 1
+        requests = server.request_count
+        time.sleep(0.06)
+        cache.balance('acc_2')
+        assert server.request_count == requests + 1
+
+    def test_events_during_fetch(self, client):
+        cache = AccountCache(client, window=None)
+        fetch = client.iter_transactions
+        first = client._list_transactions('acc_1', limit=1)[0]
+
+        def iter_transactions(**kwargs):
+            # Arrive while the fetch is in flight
+            cache([
+                created(first['id'], 0, created=first['created'], notes='new'),
+                created('tx_new', -1),
+            ])
+            return fetch(**kwargs)
+
+        client.iter_transactions = iter_transactions
+        transactions = cache.transactions('acc_1')
+        assert transactions[0]['notes'] == 'new'
+        assert transactions[-1]['id'] == 'tx_new' and len(transactions) == 21
+
+    def test_window_and_incremental_fetch(self, server, client):
+        # The mock's transactions are all from 2016
+        assert AccountCache(client).transactions('acc_1') == []
+        cache = AccountCache(client, window=None, max_age=0)
+        cache.transactions('acc_1')
+        fetch = client.iter_transactions
+        calls = []
+
+        def iter_transactions(**kwargs):
+            calls.append(kwargs['since'])
+            return fetch(**kwargs)
+
+        client.iter_transactions = iter_transactions
+        transactions = cache.transactions('acc_1')
+        newest = transactions[-1]['created'][:19] + 'Z'
+        assert calls == [newest]
+        assert len(transactions) == 20
+        assert len(set(t['id'] for t in transactions)) == 20
+
+    def test_events_during_balance_fetch(self, server, client):
+        cache = AccountCache(client, window=None)
+        cache.balance('acc_1')
+        sent, received = cache.accounts['acc_1'].balance_at[1:]
+        # The balance may or may not include it, so it is fetched again
+        cache([created('tx_raced', -100, created=received + 'Z')])
+        requests = server.request_count
+        assert cache.balance('acc_1')['balance'] == 5000
+        assert server.request_count == requests + 1
+        cache([created('tx_before', -100, created=sent[:19] + 'Z')])
+        cache([created('tx_after', -100)])
+        assert cache.balance('acc_1')['balance'] == 4900
+
+    def test_failed_fetch_clears_pending(self, client):
+        cache = AccountCache(client, window=None, max_age=0)
+        cache.transactions('acc_1')
+
+        def iter_transactions(**kwargs):
+            cache([created('tx_new', -1)])
+            raise requests.ConnectionError('down')
+
+        client.iter_transactions = iter_transactions
+        with pytest.raises(requests.ConnectionError):
+            cache.transactions('acc_1')
+        state = cache.accounts['acc_1']
+        assert state.pending is None
+        assert state.transactions[-1]['id'] == 'tx_new'
+        cache([created('tx_new_2', -1)])
+        assert state.transactions[-1]['id'] == 'tx_new_2'
+
+    def test_invalidates_response_cache(self, server):
+        client = MonzoClient(access_token='mock', account_id='acc_1', cache=ResponseCache())  # NOQA
+        client.api_url = server.url
+        client.get_balance()
+        requests = server.request_count
+        client.get_balance()
+        assert server.request_count == requests
+        AccountCache(client)([created('tx_new', -1)])
+        client.get_balance()
+        assert server.request_count == requests + 1
+
+    def test_receiver_sink(self, client):
+        cache = AccountCache(client, window=None)
+        cache.balance('acc_1')
+        receiver = WebhookReceiver(cache, flush_interval=0.01)
+        body = json.dumps(created('tx_new', -100)).encode('utf-8')
+        assert receiver.handle(body)[0] == 200
+        assert receiver.handle(body)[1] == {'duplicate': True}
+        receiver.close(timeout=5)
+        assert cache.balance('acc_1')['balance'] == 4900
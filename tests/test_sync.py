@@ -0,0 +1,66 @@
+import copy
+from datetime import timedelta
+
+import pytest
+
+from monzo import MonzoClient
+from monzo_mock import MockMonzoServer, make_transactions
+from monzo_sync import TransactionStore, TransactionSync
+
+
+@pytest.yield_fixture()
+def server():
+    with MockMonzoServer(transactions=250) as server:
+        yield server
+
+
+@pytest.fixture()
+def sync(server):
+    client = MonzoClient(access_token='mock', account_id='acc_mock')
+    client.api_url = server.url
+    return TransactionSync(
+        client,
+        TransactionStore(),
+        refetch_window=timedelta(minutes=30),
+    )
+
+
+class TestTransactionSync:
+
+    def test_first_sync(self, sync):
+        stats = sync.sync()
+        assert stats['fetched'] == 250
+        assert stats['inserted'] == 250
+        assert sync.store.count('acc_mock') == 250
+        assert sync.store.get_cursor('acc_mock') == stats['cursor']
+
+    def test_incremental_sync(self, sync, server):
+        sync.sync()
+        stats = sync.sync()
+        # Only the refetch window is downloaded again
+        assert 0 < stats['fetched'] <= 31
+        assert stats['inserted'] == 0
+        assert stats['unchanged'] == stats['fetched']
+
+        transactions = server.accounts['acc_mock']
+        transactions[-1]['metadata'] = {'category': 'lunch'}
+        new = copy.deepcopy(make_transactions('acc_mock', 251)[-1])
+        transactions.append(new)
+
+        stats = sync.sync()
+        assert stats['inserted'] == 1
+        assert stats['updated'] == 1
+        assert sync.store.get_cursor('acc_mock') == new['created']
+
+    def test_store_queries(self, sync):
+        sync.sync()
+        merchant = list(sync.store.transactions('acc_mock', merchant_id='merch_0001'))  # NOQA
+        assert len(merchant) == 5
+        assert all(t['merchant']['id'] == 'merch_0001' for t in merchant)
+
+        window = list(sync.store.transactions(
+            'acc_mock',
+            since='2016-01-01T01:00:00',
+            before='2016-01-01T02:00:00',
+        ))
+        assert len(window) == 60
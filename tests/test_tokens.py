@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+import threading
+
+import pytest
+
+from monzo import MonzoClient
+from monzo_tokens import (
+    CallbackTokenStore, FileTokenStore, SQLiteTokenStore, TokenManager,
+    format_expires_at
+)
+
+EXPIRED = '2016-01-01T00:00:00.000000'
+
+
+@pytest.fixture()
+def make_client(mock_server):
+    def make_client(**kwargs):
+        kwargs.setdefault('access_token', 'access_0')
+        kwargs.setdefault('refresh_token', 'refresh_0')
+        client = MonzoClient(account_id='acc_mock', **kwargs)
+        client.api_url = mock_server.url
+        client.token_url = mock_server.url + 'oauth2/token'
+        return client
+    mock_server.httpd.refresh_tokens.add('refresh_0')
+    return make_client
+
+
+class TestTokenManager:
+
+    def test_expires_at_round_trip(self):
+        tokens = TokenManager(expires_at='2030-06-01T12:30:00.250000')
+        assert tokens.expires_at == '2030-06-01T12:30:00.250000'
+        assert tokens.refresh_at == tokens.expires_at_epoch - 60
+
+    def test_ensure_only_when_due(self):
+        calls = []
+
+        def refresh(refresh_token):
+            calls.append(refresh_token)
+            return {'access_token': 'new', 'refresh_token': 'r2', 'expires_in': 3600}  # NOQA
+
+        tokens = TokenManager('old', 'r1', format_expires_at(time.time() + 600))  # NOQA
+        tokens.ensure(refresh)
+        assert calls == []
+
+        # Inside the refresh margin the token is refreshed ahead of expiry
+        tokens = TokenManager('old', 'r1', format_expires_at(time.time() + 30))  # NOQA
+        tokens.ensure(refresh)
+        assert calls == ['r1']
+        assert tokens.access_token == 'new'
+        assert tokens.refresh_token == 'r2'
+
+
+    def test_newer_stored_tokens_due_for_refresh(self):
+        # Another process refreshed, using up r1, but its token is due too
+        stored = {
+            'access_token': 'other', 'refresh_token': 'r2',
+            'expires_at': format_expires_at(time.time() + 30),
+        }
+        saved = []
+        calls = []
+
+        def refresh(refresh_token):
+            calls.append(refresh_token)
+            return {'access_token': 'new', 'refresh_token': 'r3', 'expires_in': 3600}  # NOQA
+
+        tokens = TokenManager(
+            'old', 'r1', format_expires_at(time.time() + 10),
+            store=CallbackTokenStore(lambda: dict(stored), saved.append),
+        )
+        tokens.ensure(refresh)
+        assert calls == ['r2']
+        assert saved[-1]['refresh_token'] == 'r3'
+
+
+    def test_ensure_async_single_flight(self):
+        calls = []
+        saved = []
+
+        async def refresh(refresh_token):
+            calls.append(refresh_token)
+            await asyncio.sleep(0.01)
+            return {'access_token': 'new', 'refresh_token': 'r2', 'expires_in': 3600}  # NOQA
+
+        tokens = TokenManager(
+            'old', 'r1', EXPIRED,
+            store=CallbackTokenStore(lambda: None, saved.append),
+        )
+        async def ensure():
+            await asyncio.gather(*[
+                tokens.ensure_async(refresh) for __ in range(5)
+            ])
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(ensure())
+        loop.close()
+        assert calls == ['r1']
+        assert [t['access_token'] for t in saved] == ['new']
+
+
+class TestTokenRefresh:
+
+    def test_single_flight(self, make_client, mock_server):
+        client = make_client()
+        client.expires_at = EXPIRED
+        issued = mock_server.token_count
+        errors = []
+
+        def call():
+            try:
+                client.whoami()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for __ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert mock_server.token_count - issued == 1
+        assert client.tokens.refreshes == 1
+
+    def test_refresh_access_token(self, make_client):
+        client = make_client()
+        response = client.refresh_access_token()
+        assert client.access_token == response['access_token']
+        assert client.refresh_token == response['refresh_token']
+        assert client.expires_at == response['expires_at']
+
+    @pytest.mark.parametrize('store_class', [FileTokenStore, SQLiteTokenStore])  # NOQA
+    def test_shared_store(self, make_client, mock_server, tmpdir, store_class):  # NOQA
+        store = store_class(os.path.join(str(tmpdir), 'tokens'))
+        first = make_client(token_store=store)
+        second = make_client(token_store=store)
+        first.expires_at = EXPIRED
+        second.expires_at = EXPIRED
+
+        first.whoami()
+        issued = mock_server.token_count
+        # second finds the fresh token in the store instead of spending
+        # the refresh token first has already used
+        second.whoami()
+        assert mock_server.token_count == issued
+        assert second.access_token == first.access_token
+        assert store.load()['refresh_token'] == first.refresh_token
+
+        third = make_client(token_store=store, access_token=None)
+        assert third.access_token == first.access_token
+
+    def test_callback_store(self, make_client):
+        saved = []
+        store = CallbackTokenStore(lambda: None, saved.append)
+        client = make_client(token_store=store)
+        client.expires_at = EXPIRED
+        client.whoami()
+        assert saved[0]['access_token'] == client.access_token
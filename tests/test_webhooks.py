@@ -0,0 +1,137 @@
+import io
+import json
+import threading
+from wsgiref.util import setup_testing_defaults
+
+from monzo_mock import make_transactions
+from monzo_sync import TransactionStore
+from monzo_webhooks import DedupSet, StoreSink, WebhookReceiver
+
+
+def event(transaction):
+    return json.dumps({'type': 'transaction.created', 'data': transaction}).encode('utf-8')  # NOQA
+
+
+def call_wsgi(app, body, method='POST', query_string=''):
+    environ = {
+        'REQUEST_METHOD': method,
+        'QUERY_STRING': query_string,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    setup_testing_defaults(environ)
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+
+    response['body'] = json.loads(b''.join(app(environ, start_response)).decode('utf-8'))  # NOQA
+    return response
+
+
+class TestDedupSet:
+
+    def test_add(self):
+        seen = DedupSet(max_size=2)
+        assert seen.add('a')
+        assert not seen.add('a')
+        assert seen.add('b')
+        assert seen.add('c')
+        assert len(seen) == 2
+        assert seen.add('a')  # Evicted as the oldest
+
+    def test_ttl(self):
+        seen = DedupSet(ttl=-1)
+        assert seen.add('a')
+        assert seen.add('a')
+
+
+class TestWebhookReceiver:
+
+    def test_batches_and_dedups(self):
+        batches = []
+        receiver = WebhookReceiver(batches.append, batch_size=10, flush_interval=0.05)  # NOQA
+        transactions = make_transactions('acc_mock', 25)
+        for transaction in transactions + transactions[:5]:
+            response = call_wsgi(receiver, event(transaction))
+            assert response['status'] == '200 OK'
+        receiver.close()
+
+        delivered = [e['data']['id'] for batch in batches for e in batch]
+        assert delivered == [t['id'] for t in transactions]
+        assert max(len(batch) for batch in batches) == 10
+        assert receiver.duplicates == 5
+
+    def test_rejects(self):
+        receiver = WebhookReceiver(lambda events: None, secret='s3cret')
+        body = event(make_transactions('acc_mock', 1)[0])
+        assert call_wsgi(receiver, body)['status'] == '403 Forbidden'
+        assert call_wsgi(receiver, body, query_string='token=s3cret')['status'] == '200 OK'  # NOQA
+        assert call_wsgi(receiver, b'nope', query_string='token=s3cret')['status'] == '400 Bad Request'  # NOQA
+        assert call_wsgi(receiver, b'', method='GET')['status'] == '405 Method Not Allowed'  # NOQA
+        receiver.close()
+        assert receiver.rejected == 2
+
+    def test_full_queue_asks_for_redelivery(self):
+        release = threading.Event()
+        receiver = WebhookReceiver(
+            lambda events: release.wait(), batch_size=1, max_queue=1
+        )
+        transactions = make_transactions('acc_mock', 5)
+        statuses = [receiver.handle(event(t))[0] for t in transactions]
+        assert 503 in statuses
+        release.set()
+        receiver.close()
+        # The dropped event is not remembered so a redelivery is accepted
+        dropped = transactions[statuses.index(503)]
+        assert receiver.handle(event(dropped))[0] in (200, 503)
+        assert receiver.dedup.add('transaction.created:' + dropped['id']) is False  # NOQA
+
+    def test_failed_batch_is_retried(self):
+        batches = []
+
+        def sink(events):
+            if not batches:
+                batches.append(None)
+                raise IOError('disk full')
+            batches.append(events)
+
+        receiver = WebhookReceiver(sink, flush_interval=0.01, backoff=0.01)
+        transaction = make_transactions('acc_mock', 1)[0]
+        body = event(transaction)
+        assert receiver.handle(body) == (200, {})
+        receiver.close(timeout=5)
+        assert [e['data'] for e in batches[1]] == [transaction]
+        assert (receiver.batcher.errors, receiver.batcher.retries) == (1, 1)
+        assert receiver.handle(body)[1] == {'duplicate': True}
+
+    def test_failing_batch_is_dead_lettered(self):
+        dead = []
+
+        def sink(events):
+            raise IOError('disk full')
+
+        receiver = WebhookReceiver(
+            sink, flush_interval=0.01, backoff=0.01,
+            dead_letter=lambda batch, error: dead.append((batch, error)),
+        )
+        transaction = make_transactions('acc_mock', 1)[0]
+        assert receiver.handle(event(transaction)) == (200, {})
+        receiver.close(timeout=5)
+        assert receiver.batcher.errors == 4
+        [(batch, error)] = dead
+        assert [e['data'] for e in batch] == [transaction]
+        assert isinstance(error, IOError)
+
+        receiver = WebhookReceiver(sink, flush_interval=0.01, max_retries=0)
+        receiver.handle(event(transaction))
+        receiver.close(timeout=5)
+        assert len(receiver.batcher.dead_letters) == 1
+
+    def test_store_sink(self):
+        store = TransactionStore()
+        receiver = WebhookReceiver(StoreSink(store), flush_interval=0.01)
+        for transaction in make_transactions('acc_mock', 20):
+            receiver.handle(event(transaction))
+        receiver.close()
+        assert store.count('acc_mock') == 20